@@ -4,8 +4,11 @@
 功能：图片管理、标签编辑、URL图片下载、数据导入导出
 """
 
-from flask import Flask, render_template, jsonify, request, Response, stream_with_context
-import json
+from flask import (Flask, render_template, jsonify, request, Response, stream_with_context, send_file, redirect,
+                   has_request_context, g)
+from flask.json.provider import JSONProvider
+import copy
+import functools
 import os
 from datetime import datetime
 from werkzeug.utils import secure_filename
@@ -14,10 +17,57 @@ import uuid
 import time
 import threading
 import tempfile
-import portalocker
+import tarfile
+import zipfile
+
+import codec
+import dataset_export
+import liveness
+import metrics
+import profiler
+import relabel
+from changes import feed as change_feed, build_event
+from concurrency import data_lock, mutation_lock
+from dataset_export import processed_result
+from http_cache import (REVALIDATE, make_etag, matching_etag, compress_response,
+                        static_cache_control)
+from history import (new_batch_id, record_changes, get_store as get_history_store,
+                     undo_state, invert, reapply)
+from importer import (ImportAborted, parse_jsonl, entries_from_payload, is_legacy_payload, run_import, import_legacy,
+                      save_report, is_report_id, report_path as import_report_path)
+from indexes import GENERATION_KEY, get_index, update_index, peek_index, invalidate_index
+from page_cache import PageEntry, page_cache, selector_key
+from review_queue import leases as review_leases, DEFAULT_LEASE_SECONDS, MAX_LEASE_BATCH
+from similarity import DEFAULT_SIMILARITY
+from snapshot import SnapshotWriter, write_snapshot, get_snapshot
+from storage import ShardedStore, PartialData
+from tag_analysis import DEFAULT_MIN_COUNT, DEFAULT_REPORT_LIMIT
+from versions import (IMPORT_POLICIES, DEFAULT_IMPORT_POLICY, run_from_group, ensure_versions, expand_run, activate_run, diff_runs, prune_attribute_blocks,
+                      merge_run)
+from vocab import DEFAULT_SUGGESTIONS, MAX_SUGGESTIONS
+from media import (file_sha256, save_stream_hashed, load_hash_index, save_hash_index,
+                   register_image_hash, is_linked_duplicate, submit_thumbnails, ensure_thumbnail, fetch_remote_snapshot,
+                   thumb_path, is_content_hash, with_thumbnails, THUMB_WIDTHS, THUMB_FORMATS)
 
 app = Flask(__name__)
 
+
+class CodecJSONProvider(JSONProvider):
+    """接口请求/响应的JSON编解码统一使用codec模块"""
+
+    def dumps(self, obj, **kwargs):
+        return codec.dumps_str(obj)
+
+    def loads(self, s, **kwargs):
+        return codec.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(codec.dumps(obj), mimetype='application/json')
+
+
+app.json = CodecJSONProvider(app)
+
 # 添加CORS支持（如果需要）
 @app.after_request
 def after_request(response):
@@ -26,19 +76,139 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
+
+# 导出端点 -> 导出格式，用于统计导出字节数
+EXPORT_FORMATS = {'export_data': 'json', 'export_jsonl': 'jsonl', 'export_single_group': 'single'}
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    # 请求头X-Profile或查询参数_profile开启cProfile；配置慢请求阈值时对所有请求做栈采样
+    g.request_profile = profiler.start(request.headers.get(profiler.PROFILE_HEADER)
+                                       or request.args.get(profiler.PROFILE_QUERY_ARG))
+
+
+# 不读取标注数据的接口：不获取数据读写锁，静态文件、缩略图与远程图片、变更推送等不会与修改请求互相阻塞
+LOCK_FREE_ENDPOINTS = {'index', 'static', 'get_thumbnail', 'stream_changes', 'prometheus_metrics',
+                       'list_request_profiles', 'get_request_profile', 'download_import_report',
+                       'start_dataset_export', 'get_dataset_export', 'download_dataset_export',
+                       'get_relabel_job', 'cancel_relabel_job'}
+# 读取前需扫描图片目录（可能自动新增组）的接口
+IMAGE_SCAN_ENDPOINTS = {'get_groups', 'get_groups_stats'}
+# 只读取并修改单个组的接口：只加载该组所在分片，按分片互斥，不同分片上的修改并行
+SHARD_MUTATION_ENDPOINTS = {'add_tag', 'delete_tag', 'edit_tag', 'delete_attribute'}
+
+
+@app.before_request
+def acquire_data_lock():
+    """多线程模式下按请求加锁：只读请求共享持有数据读写锁，修改请求之间互斥（提交时再独占数据锁）"""
+    if request.endpoint is None or request.endpoint in LOCK_FREE_ENDPOINTS or request.method == 'OPTIONS':
+        return
+    if request.method in ('GET', 'HEAD'):
+        if request.endpoint in IMAGE_SCAN_ENDPOINTS:
+            scan_images_if_changed()
+        data_lock.acquire_read()
+        g.data_lock_mode = 'read'
+    else:
+        # 在锁外接收完整请求体（含上传文件），慢客户端不占用锁
+        request.get_data(cache=True, parse_form_data=True)
+        if request.endpoint in SHARD_MUTATION_ENDPOINTS:
+            g.shard_key = store.shard_key(request.view_args['group_id'])
+            mutation_lock.acquire_shard(g.shard_key)
+            g.data_lock_mode = 'shard'
+        else:
+            mutation_lock.acquire()
+            g.data_lock_mode = 'mutation'
+
+
+def release_data_lock():
+    mode = g.pop('data_lock_mode', None)
+    if mode == 'read':
+        data_lock.release_read()
+    elif mode == 'mutation':
+        mutation_lock.release()
+    elif mode == 'shard':
+        mutation_lock.release_shard(g.pop('shard_key'))
+
+
+@app.after_request
+def record_request_metrics(response):
+    """按端点记录请求耗时与状态码，并定期将本进程指标写盘供/metrics汇总"""
+    endpoint = request.endpoint or 'unmatched'
+    start = g.get('request_start')
+    if start is not None:
+        metrics.REQUEST_DURATION.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method)
+    metrics.REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    if endpoint in EXPORT_FORMATS and not response.is_streamed:
+        metrics.EXPORT_BYTES.inc(response.calculate_content_length() or 0, format=EXPORT_FORMATS[endpoint])
+    metrics.flush()
+
+    profile = g.pop('request_profile', None)
+    if profile is not None and start is not None:
+        profile_id = profiler.finish(profile, time.perf_counter() - start, {
+            'endpoint': endpoint, 'method': request.method, 'path': request.full_path.rstrip('?'),
+            'status': response.status_code})
+        if profile_id:
+            response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+@app.teardown_request
+def stop_request_profile(exc):
+    """请求异常结束（未经过after_request）时停止剖析并释放数据锁，避免残留在线程上"""
+    profile = g.pop('request_profile', None)
+    if profile is not None:
+        profile.stop()
+    release_data_lock()
+
+
+# 依赖数据代次的只读接口：响应附带ETag，条件请求未变化时返回304
+CACHEABLE_ENDPOINTS = {'get_groups', 'get_group', 'get_statistics', 'export_data'}
+
+
+@app.after_request
+def apply_http_caching(response):
+    """设置ETag/Cache-Control并压缩大响应"""
+    generation = None
+    if request.endpoint in CACHEABLE_ENDPOINTS and response.status_code == 200:
+        generation = g.get('data_generation')
+        response.headers['Cache-Control'] = REVALIDATE
+    elif request.endpoint in ('static', 'get_thumbnail') and response.status_code in (200, 304):
+        response.headers['Cache-Control'] = static_cache_control(request.path, request.args)
+    encoding = compress_response(response, request.accept_encodings)
+    if generation is not None:
+        response.headers['ETag'] = make_etag(generation, encoding)
+    return response
+
+
+@app.after_request
+def release_data_lock_after_view(response):
+    """视图返回后立即释放数据锁（最后注册、最先执行）：压缩与向客户端发送响应体不占用锁"""
+    release_data_lock()
+    return response
+
 # ========== 配置 ==========
 IMAGE_FOLDER = 'static/images'
-DATA_FILE = 'data/annotations.json'
+DATA_DIR = 'data/shards'  # 按组ID区间分片的标注数据（见storage.py）
+DATA_FILE = 'data/annotations.json'  # 分片存储之前的单文件数据，首次加载时自动拆分到DATA_DIR
+SNAPSHOT_FILE = 'data/annotations.snap'  # 列式快照，与数据版本一致时用于免解析读取
+MAX_INLINE_IMPORT_ITEMS = 20  # 导入响应中直接返回的错误/跳过条数，完整列表见错误报告
+EXPORT_STREAM_BATCH = 500  # 流式导出每次发送的行数
 
 # 确保数据文件夹存在
 os.makedirs('data', exist_ok=True)
 os.makedirs(IMAGE_FOLDER, exist_ok=True)
 
+store = ShardedStore(DATA_DIR, DATA_FILE)
+snapshot_writer = SnapshotWriter(SNAPSHOT_FILE, loader=store.load)  # 只提交了部分分片时后台重新加载完整数据
+
 
 # ========== 数据初始化 ==========
 def init_sample_data():
     """初始化示例数据"""
-    if not os.path.exists(DATA_FILE):
+    store.migrate()
+    if not store.exists():
         sample_data = {
             "groups": []
         }
@@ -55,117 +225,338 @@ def scan_and_add_images():
                 if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
                     image_files.append(filename)
 
-        # 加载现有数据
-        data = load_data()
-
-        # 收集所有现有图片文件名
-        existing_filenames = set()
-        for group in data.get('groups', []):
-            for img in group.get('images', []):
-                # 只处理本地文件类型的图片
-                if 'filename' in img:
-                    existing_filenames.add(img['filename'])
-
-        # 获取当前最大ID
-        max_id = 0
-        for group in data.get('groups', []):
-            for img in group.get('images', []):
-                max_id = max(max_id, img.get('id', 0))
+        # 收集所有现有图片文件名（快照可用时直接读取文件名词表，无需解析整份数据）
+        snapshot = load_snapshot()
+        if snapshot is not None:
+            data = None
+            existing_filenames = set(snapshot.vocab('filenames'))
+        else:
+            data = load_data()
+            existing_filenames = set()
+            for group in data.get('groups', []):
+                for img in group.get('images', []):
+                    # 只处理本地文件类型的图片
+                    if 'filename' in img:
+                        existing_filenames.add(img['filename'])
 
-        # 找出新图片
-        new_files = [f for f in image_files if f not in existing_filenames]
+        # 补登记尚未计算哈希的已入库图片（旧数据只需计算一次）
+        hash_index = load_hash_index()
+        index_changed = False
+        for filename in existing_filenames:
+            file_path = os.path.join(IMAGE_FOLDER, filename)
+            if filename not in hash_index['by_name'] and os.path.exists(file_path):
+                register_image_hash(hash_index, filename, file_sha256(file_path))
+                index_changed = True
+
+        # 找出新图片（已链接到其他图片的重复文件不再处理）
+        candidates = [f for f in image_files
+                      if f not in existing_filenames and not is_linked_duplicate(hash_index, f)]
+
+        # 按内容哈希去重：与已入库图片内容相同的文件只登记链接，不再建组
+        new_files = []
+        linked = 0
+        known_filenames = set(existing_filenames)
+        for filename in candidates:
+            content_hash = file_sha256(os.path.join(IMAGE_FOLDER, filename))
+            canonical = register_image_hash(hash_index, filename, content_hash)
+            index_changed = True
+            if canonical != filename and canonical in known_filenames:
+                linked += 1
+                print(f"[OK] Duplicate image {filename} linked to {canonical}")
+                continue
+            # 原规范文件已不在数据中时，由当前文件接替
+            hash_index['by_hash'][content_hash] = filename
+            known_filenames.add(filename)
+            new_files.append(filename)
+
+        if index_changed:
+            save_hash_index(hash_index)
 
         if not new_files:
             return
+        if data is None:
+            data = load_data()
 
         # 将新图片两两分组添加到现有数据中
-        new_groups_added = 0
-        for i in range(0, len(new_files), 2):
-            group_images = new_files[i:i+2]
-            group_imgs = []
-            for filename in group_images:
-                max_id += 1
-                group_imgs.append({
-                    "id": max_id,
-                    "filename": filename
-                })
-
-            new_group = {
-                "id": len(data.get('groups', [])) + new_groups_added + 1,
-                "images": group_imgs,
-                "primary_category": "",
-                "confidence": [],
-                "attributes": {
-                    "通用特征": {},
-                    "专属特征": {}
-                },
-                "tags": [],
-                "video_description": "",
-                "reasoning": "",
-                "reviewed": False,
-                "modified": False
-            }
-            data['groups'].append(new_group)
-            new_groups_added += 1
+        new_groups_added = add_image_groups(data, [(f, hash_index['by_name'][f]) for f in new_files])
 
         # 保存更新后的数据
         if new_groups_added > 0:
-            save_data(data)
-            print(f"[OK] Auto-added {len(new_files)} new images, created {new_groups_added} new groups")
+            commit_changes(data, [(None, g) for g in data['groups'][-new_groups_added:]], 'scan_images',
+                           batch_id=new_batch_id(), user='system')
+            print(f"[OK] Auto-added {len(new_files)} new images, created {new_groups_added} new groups"
+                  f"{f', linked {linked} duplicates' if linked else ''}")
 
     except Exception as e:
         print(f"[ERROR] Error scanning image directory: {e}")
 
 
-def load_data():
-    """加载标注数据（带文件锁保护）"""
+_image_scan_state = None  # 上次扫描后的 (图片目录mtime, 数据文件mtime)
+
+
+def image_scan_state():
     try:
-        # 使用文件锁确保并发安全
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            portalocker.lock(f, portalocker.LOCK_SH)  # 共享锁用于读取
-            data = json.load(f)
-            portalocker.unlock(f)
-
-        # 确保数据结构兼容
-        if 'groups' not in data:
-            data['groups'] = []
-        return data
+        folder_mtime = os.stat(IMAGE_FOLDER).st_mtime_ns  # 目录mtime随文件增删变化
     except FileNotFoundError:
+        folder_mtime = None
+    return folder_mtime, data_file_mtime()
+
+
+def scan_images_if_changed():
+    """图片目录或数据文件自上次扫描后有变化时扫描图片目录；有修改请求进行中时跳过，留给后续请求"""
+    global _image_scan_state
+    if image_scan_state() == _image_scan_state or not mutation_lock.acquire(blocking=False):
+        return
+    try:
+        scan_and_add_images()
+        _image_scan_state = image_scan_state()
+    finally:
+        mutation_lock.release()
+
+
+def add_image_groups(data, new_images):
+    """将新的本地图片两两分组追加到数据中（不保存），返回新建组数
+
+    new_images: [(文件名, 内容哈希), ...]，按顺序配对
+    """
+    groups = data.setdefault('groups', [])
+    max_group_id = max([g['id'] for g in groups], default=0)
+    max_image_id = 0
+    for group in groups:
+        for img in group.get('images', []):
+            max_image_id = max(max_image_id, img.get('id', 0))
+
+    new_groups_added = 0
+    for i in range(0, len(new_images), 2):
+        group_imgs = []
+        for filename, content_hash in new_images[i:i+2]:
+            max_image_id += 1
+            group_imgs.append({
+                "id": max_image_id,
+                "filename": filename,
+                "sha256": content_hash
+            })
+            # 后台预生成缩略图
+            submit_thumbnails(os.path.join(IMAGE_FOLDER, filename), content_hash)
+
+        max_group_id += 1
+        groups.append({
+            "id": max_group_id,
+            "images": group_imgs,
+            "primary_category": "",
+            "confidence": [],
+            "attributes": {
+                "通用特征": {},
+                "专属特征": {}
+            },
+            "tags": [],
+            "video_description": "",
+            "reasoning": "",
+            "reviewed": False,
+            "modified": False
+        })
+        new_groups_added += 1
+
+    return new_groups_added
+
+
+def load_data():
+    """加载标注数据（各分片在共享文件锁下读取）"""
+    start = time.perf_counter()
+    data, _ = store.load()
+    if data is None:
         init_sample_data()
         return load_data()
-    except portalocker.LockException:
-        # 如果锁失败，等待一小段时间后重试
-        time.sleep(0.1)
-        return load_data()
+    metrics.DATA_LOAD_DURATION.observe(time.perf_counter() - start)
+    if has_request_context():
+        g.data_generation = data.get(GENERATION_KEY, 0)  # 响应ETag以实际读到的数据为准
+    return data
 
 
-def save_data(data):
-    """保存标注数据（带文件锁保护）"""
-    try:
-        # 使用文件锁确保并发安全
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            portalocker.lock(f, portalocker.LOCK_EX)  # 独占锁用于写入
-            json.dump(data, f, ensure_ascii=False, indent=2)
-            portalocker.unlock(f)
-    except portalocker.LockException:
-        # 如果锁失败，等待一小段时间后重试
-        time.sleep(0.1)
-        save_data(data)
+def load_group_data(group_id):
+    """只加载组所在的分片，返回PartialData（保存时只写回这些分片）；用于只读取或修改单个组的请求"""
+    return load_groups_data([group_id])
+
+
+def load_groups_data(group_ids):
+    """只加载这些组所在的分片，返回PartialData；用于只涉及少数已知组的请求"""
+    start = time.perf_counter()
+    data, _ = store.load_groups(group_ids)
+    if data is None:
+        init_sample_data()
+        return load_groups_data(group_ids)
+    metrics.DATA_LOAD_DURATION.observe(time.perf_counter() - start)
+    if has_request_context():
+        g.data_generation = data.get(GENERATION_KEY, 0)
+    return data
+
+
+def save_data(data, changes=None):
+    """保存标注数据：只改写changes涉及的分片（未提供时改写全部分片），每次保存递增数据代次，返回写入后的数据版本"""
+    start = time.perf_counter()
+    mtime, _ = store.save(data, changes)  # 分片在加锁前完成编码
+    metrics.DATA_SAVE_DURATION.observe(time.perf_counter() - start)
+    return mtime
+
+
+def commit_changes(data, changes, action, batch_id=None, user=None, reverts=None):
+    """保存数据，增量更新索引并记录修改历史
+
+    changes: [(before, after), ...] 组快照，before为None表示新增，after为None表示删除
+    data为load_group_data加载的部分数据时只写回其中的分片，索引按变更增量更新，快照在后台重新加载完整数据后写出
+    """
+    partial = isinstance(data, PartialData)
+    reordered = not partial and not store.in_shard_order(data['groups'])
+    if reordered:
+        # 存储按分片键顺序拼接各分片：内存中的组顺序与之不一致时稳定排序后全量保存
+        data['groups'].sort(key=lambda group: store.shard_key(group['id']))
+    with data_lock.write():  # 等待进行中的读请求结束，期间新的读请求排队
+        mtime = save_data(data, None if reordered else changes)
+        old_generation = data[GENERATION_KEY] - 1  # 代次按磁盘上的代次递增，期间有其他进程写入时索引不匹配而丢弃
+        if reordered:
+            # 存储位置整体变化，索引与分页缓存下次查询时重建
+            invalidate_index()
+            page_cache.clear()
+        else:
+            # 分页缓存按修改前的存储位置判断受影响的页，需在更新索引前失效
+            index = peek_index()
+            page_cache.apply(changes, old_generation, data[GENERATION_KEY],
+                             index.positions if index is not None and index.generation == old_generation else None,
+                             inserted_positions(data['groups'], changes))
+            update_index(data, old_generation, changes)
+            index = peek_index()
+            if index is not None and index.generation == data[GENERATION_KEY]:
+                index.source_mtime = mtime
+    snapshot_writer.submit(None if partial else data, mtime)
+    record_changes(action, changes, user or current_user(), batch_id, reverts)
+    change_feed.publish(data[GENERATION_KEY], build_event(action, changes), mtime)
+
+
+def inserted_positions(groups, changes):
+    """新增组在修改后列表中的存储下标（新组通常追加在末尾，从尾部查找）"""
+    pending = {after['id'] for before, after in changes if before is None and after is not None}
+    positions = {}
+    for pos in range(len(groups) - 1, -1, -1):
+        if not pending:
+            break
+        gid = groups[pos]['id']
+        if gid in pending:
+            positions[gid] = pos
+            pending.discard(gid)
+    return positions
+
+
+def data_file_mtime():
+    """数据版本：分片清单的修改时间（纳秒，每次保存都会改写清单），数据不存在时返回None"""
+    return store.mtime()
+
+
+def current_user():
+    """当前操作用户（请求头X-User，未提供时为anonymous）"""
+    if has_request_context():
+        return request.headers.get('X-User') or 'anonymous'
+    return 'system'
+
+
+def find_group(data, group_id):
+    """通过索引按ID查找组（部分加载的数据直接按ID查找，不影响全量索引）"""
+    if isinstance(data, PartialData):
+        return data.find(group_id)
+    return get_index(data).find(data.get('groups', []), group_id)
+
+
+def load_index():
+    """获取与数据文件一致的索引；文件自上次同步后未被修改时直接复用，免去整份数据的解析"""
+    mtime = data_file_mtime()
+    index = peek_index()
+    if index is not None and mtime is not None and index.source_mtime == mtime:
+        metrics.cache_result('index', True)
+        return index
+    metrics.cache_result('index', False)
+    index = get_index(load_data())
+    index.source_mtime = mtime
+    return index
+
+
+def load_snapshot():
+    """获取与数据文件一致的列式快照，不存在或已过期时返回None（调用方回退到load_data）"""
+    snapshot = get_snapshot(SNAPSHOT_FILE, data_file_mtime())
+    metrics.cache_result('snapshot', snapshot is not None)
+    if snapshot is not None and has_request_context():
+        g.data_generation = snapshot.generation
+    return snapshot
+
+
+def data_generation():
+    """不解析数据文件取得当前数据代次：使用与文件mtime一致的缓存索引或快照，都不可用时返回None"""
+    mtime = data_file_mtime()
+    index = peek_index()
+    if index is not None and mtime is not None and index.source_mtime == mtime:
+        return index.generation
+    snapshot = get_snapshot(SNAPSHOT_FILE, mtime)
+    return snapshot.generation if snapshot is not None else None
+
+
+def not_modified():
+    """条件请求的ETag与当前数据代次一致时返回304响应（不加载也不序列化数据），否则返回None"""
+    generation = data_generation()
+    if generation is None:
+        return None
+    g.data_generation = generation
+    etag = matching_etag(request.if_none_match, generation)
+    if etag is None:
+        return None
+    response = Response(status=304)
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = REVALIDATE
+    return response
+
+
+def parse_import_policy(value):
+    """解析导入策略参数，非法时抛出ValueError"""
+    policy = value or DEFAULT_IMPORT_POLICY
+    if policy not in IMPORT_POLICIES:
+        raise ValueError(f'policy must be one of {", ".join(IMPORT_POLICIES)}')
+    return policy
+
+
+def select_groups(data, selector):
+    """按选择器从索引取出匹配的组（保持存储顺序）"""
+    index = get_index(data)
+    groups = data.get('groups', [])
+    positions = sorted(index.positions[gid] for gid in index.select(selector))
+    return [groups[pos] for pos in positions]
+
+
+def parse_bool_arg(value):
+    """解析查询参数中的布尔值，未提供返回None"""
+    if value is None or value == '':
+        return None
+    return value.lower() in ('1', 'true', 'yes')
 
 
 # ========== 路由：页面渲染 ==========
 @app.route('/')
 def index():
     """渲染主页"""
-    return render_template('index.html')
+    return render_template('index.html', change_stream=change_stream_enabled())
 
 
 # ========== 路由：获取数据 ==========
 @app.route('/api/groups', methods=['GET'])
 def get_groups():
-    """获取图片组和标签信息，支持分页"""
-    scan_and_add_images()
-    data = load_data()
+    """获取图片组和标签信息，支持分页、筛选、按审核优先级排序(sort=priority)及字段投影(fields=id,tags,...)
+
+    image_status=alive,partial,... 按远程图片可用性筛选（结果随后台检查变化，不使用ETag与分页缓存）
+    """
+    try:
+        image_status = liveness.parse_statuses(request.args.get('image_status'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if image_status is None:
+        cached = not_modified()
+        if cached is not None:
+            return cached
 
     # 获取分页参数
     page = int(request.args.get('page', 1))
@@ -177,42 +568,178 @@ def get_groups():
     if per_page < 1 or per_page > 100:
         per_page = 10
 
-    groups = data.get('groups', [])
-    total_groups = len(groups)
+    # 筛选条件（基于索引，不逐组扫描）
+    selector = {
+        'tag': request.args.get('tag') or None,
+        'category': request.args.get('category'),
+        'reviewed': parse_bool_arg(request.args.get('reviewed')),
+        'modified': parse_bool_arg(request.args.get('modified'))
+    }
+    filtered = any(v is not None for v in selector.values()) or image_status is not None
+    fields = parse_fields_arg(request.args.get('fields'))
 
     # 计算分页
     start_index = (page - 1) * per_page
     end_index = start_index + per_page
 
-    # 获取当前页的数据
-    paginated_groups = groups[start_index:end_index]
-
-    # 构建响应
-    response = {
-        'groups': paginated_groups,
-        'pagination': {
-            'page': page,
-            'per_page': per_page,
-            'total_groups': total_groups,
-            'total_pages': (total_groups + per_page - 1) // per_page,
-            'has_next': end_index < total_groups,
-            'has_prev': page > 1
-        }
+    sort = 'priority' if request.args.get('sort') == 'priority' else None
+    cache_key = (page, per_page, selector_key(selector), sort, fields) if image_status is None else None
+    cached_page = page_cache.get(cache_key, g.get('data_generation')) if cache_key is not None else None
+    metrics.cache_result('page', cached_page is not None)
+    if cached_page is not None:
+        # 命中时直接拼接已序列化的组数组，不再读取数据或编码
+        payload, total_groups = cached_page
+        return page_response(payload, page, per_page, total_groups)
+
+    snapshot = None if filtered or sort == 'priority' else load_snapshot()
+    priorities = {}
+    if snapshot is not None:
+        # 无筛选的默认顺序：直接从快照解码当前页，不解析整份数据
+        total_groups = len(snapshot)
+        page_groups = snapshot.records(start_index, end_index)
+        last_pos = start_index + len(page_groups) - 1
+    elif sort == 'priority':
+        # 按预先计算的审核优先级排序，无筛选时直接对有序索引切片
+        data = load_data()
+        index = get_index(data)
+        ranking = index.components['priority']
+        if filtered:
+            ranked_ids = ranking.sort(select_group_ids(index, selector, image_status))
+            total_groups = len(ranked_ids)
+            page_ids = ranked_ids[start_index:end_index]
+        else:
+            total_groups = len(ranking)
+            page_ids = ranking.ranked(start_index, end_index)
+        page_groups = [find_group(data, gid) for gid in page_ids]
+        priorities = {gid: ranking.score(gid) for gid in page_ids}
+        last_pos = None
+    elif filtered:
+        data = load_data()
+        index = get_index(data)
+        positions = sorted(index.positions[gid] for gid in select_group_ids(index, selector, image_status))
+        total_groups = len(positions)
+
+        # 获取当前页的数据
+        page_positions = positions[start_index:end_index]
+        page_groups = [data['groups'][pos] for pos in page_positions]
+        last_pos = page_positions[-1] if page_positions else -1
+    else:
+        # 无筛选且快照不可用：只读取覆盖当前页的分片
+        page_groups, total_groups, g.data_generation, _ = store.load_range(start_index, end_index)
+        last_pos = start_index + len(page_groups) - 1
+
+    paginated_groups = []
+    for group in page_groups:
+        group = with_thumbnails(group)
+        if group['id'] in priorities:
+            group['priority'] = priorities[group['id']]
+        paginated_groups.append(project_fields(group, fields))
+
+    payload = codec.dumps(paginated_groups)
+    if cache_key is None:
+        g.data_generation = None  # 结果还取决于图片检查结果，不能以数据代次作为ETag
+    else:
+        entry = PageEntry(payload, [group['id'] for group in page_groups], last_pos, len(page_groups) == per_page,
+                          selector, sort)
+        page_cache.put(cache_key, g.get('data_generation'), entry, total_groups)
+    return page_response(payload, page, per_page, total_groups)
+
+
+def select_group_ids(index, selector, image_status=None):
+    """按筛选条件与图片可用性选出组ID（筛选条件为空时从全部组中选）"""
+    group_ids = index.select({**selector, 'all': True})
+    if image_status is not None:
+        group_ids = index.components['liveness'].filter(group_ids, image_status)
+    return group_ids
+
+
+def parse_fields_arg(value):
+    """解析字段投影参数（逗号分隔，始终包含id），未提供返回None表示全部字段"""
+    if not value:
+        return None
+    return tuple(sorted({field.strip() for field in value.split(',') if field.strip()} | {'id'}))
+
+
+def project_fields(group, fields):
+    return group if fields is None else {k: v for k, v in group.items() if k in fields}
+
+
+def page_response(payload, page, per_page, total_groups):
+    """由已序列化的组数组拼接分页响应（分页信息每次重新生成）"""
+    pagination = {
+        'page': page,
+        'per_page': per_page,
+        'total_groups': total_groups,
+        'total_pages': (total_groups + per_page - 1) // per_page,
+        'has_next': page * per_page < total_groups,
+        'has_prev': page > 1
     }
-
-    return jsonify(response)
+    body = b'{"groups":' + payload + b',"pagination":' + codec.dumps(pagination) + b'}'
+    return Response(body, mimetype='application/json')
 
 
 @app.route('/api/groups/<int:group_id>', methods=['GET'])
 def get_group(group_id):
     """获取单个组信息"""
-    data = load_data()
-    for group in data.get('groups', []):
-        if group['id'] == group_id:
-            return jsonify(group)
+    cached = not_modified()
+    if cached is not None:
+        return cached
+    snapshot = load_snapshot()
+    group = snapshot.find(group_id) if snapshot is not None else find_group(load_group_data(group_id), group_id)
+    if group is not None:
+        return jsonify(with_thumbnails(group))
     return jsonify({'error': 'Group not found'}), 404
 
 
+@app.route('/api/thumbnail', methods=['GET'])
+def get_thumbnail():
+    """获取图片缩略图（首次请求时生成，按内容哈希缓存）"""
+    src = request.args.get('src', '')
+    content_hash = request.args.get('h', '')
+    fmt = request.args.get('fmt', 'jpeg')
+    try:
+        width = int(request.args.get('w', THUMB_WIDTHS[0]))
+    except ValueError:
+        width = THUMB_WIDTHS[0]
+
+    if not src:
+        return jsonify({'error': 'src is required'}), 400
+    if fmt not in THUMB_FORMATS:
+        fmt = 'jpeg'
+    if width not in THUMB_WIDTHS:
+        # 只提供预设尺寸，取不小于请求宽度的最小一档
+        width = next((w for w in THUMB_WIDTHS if w >= width), THUMB_WIDTHS[-1])
+
+    # 客户端携带内容哈希且缩略图已存在时，无需读取源文件
+    cached = is_content_hash(content_hash) and os.path.exists(thumb_path(content_hash, width, fmt))
+    metrics.cache_result('thumbnail', cached)
+    if cached:
+        return send_file(os.path.abspath(thumb_path(content_hash, width, fmt)),
+                         mimetype=f'image/{fmt}', max_age=86400)
+
+    if src.startswith(('http://', 'https://')):
+        # 只代理已入库组中的远程图片，其他地址不下载也不重定向
+        if not load_index().components['liveness'].has_url(src):
+            return jsonify({'error': 'Unknown image URL'}), 400
+        original_url = src
+        src_path = fetch_remote_snapshot(src)
+    else:
+        filename = secure_filename(src)
+        original_url = f'/static/images/{filename}'
+        src_path = os.path.join(IMAGE_FOLDER, filename)
+        if not os.path.exists(src_path):
+            return jsonify({'error': 'Image not found'}), 404
+
+    if src_path is None:
+        # 远程图片不可用，交给浏览器直接请求原地址
+        return redirect(original_url)
+
+    path = ensure_thumbnail(src_path, file_sha256(src_path), width, fmt)
+    if path is None:
+        return redirect(original_url)
+    return send_file(os.path.abspath(path), mimetype=f'image/{fmt}', max_age=86400)
+
+
 @app.route('/api/groups/<int:group_id>/delete', methods=['POST', 'OPTIONS'])
 def delete_group(group_id):
     """删除整个图片组"""
@@ -228,43 +755,40 @@ def delete_group(group_id):
             return jsonify({'error': 'Invalid group ID'}), 400
 
         data = load_data()
-        print(f"当前组数量: {len(data.get('groups', []))}")
-
-        for i, group in enumerate(data.get('groups', [])):
-            print(f"检查组 {group['id']}")
-            if group['id'] == group_id:
-                # 获取要删除的图片信息（可能是本地文件名或远程URL）
-                images_info = []
-                for img in group.get('images', []):
-                    if 'filename' in img:
-                        # 本地图片
-                        images_info.append({'type': 'local', 'filename': img['filename']})
-                    elif 'url' in img:
-                        # 远程图片
-                        images_info.append({'type': 'remote', 'url': img['url']})
-                    else:
-                        # 其他格式
-                        images_info.append({'type': 'unknown', 'data': img})
+        group = find_group(data, group_id)
+        if group is not None:
+            # 获取要删除的图片信息（可能是本地文件名或远程URL）
+            images_info = []
+            for img in group.get('images', []):
+                if 'filename' in img:
+                    # 本地图片
+                    images_info.append({'type': 'local', 'filename': img['filename']})
+                elif 'url' in img:
+                    # 远程图片
+                    images_info.append({'type': 'remote', 'url': img['url']})
+                else:
+                    # 其他格式
+                    images_info.append({'type': 'unknown', 'data': img})
 
-                # 从数据中删除组
-                deleted_group = data['groups'].pop(i)
+            # 从数据中删除组（完整快照写入历史，可撤销）
+            data['groups'].remove(group)
 
-                # 保存数据
-                save_data(data)
+            # 保存数据
+            commit_changes(data, [(group, None)], 'delete_group')
 
-                print(f"成功删除图片组 {group_id}")
+            print(f"成功删除图片组 {group_id}")
 
-                # 注意：这里不删除物理文件，因为：
-                # 1. 远程图片无法删除
-                # 2. 本地图片可能被其他地方引用
-                # 用户可以手动清理不需要的文件
+            # 注意：这里不删除物理文件，因为：
+            # 1. 远程图片无法删除
+            # 2. 本地图片可能被其他地方引用
+            # 用户可以手动清理不需要的文件
 
-                return jsonify({
-                    'success': True,
-                    'message': f'图片组 {group_id} 已删除',
-                    'deleted_images': len(images_info),
-                    'images_info': images_info  # 返回图片信息，让用户了解删除了什么
-                })
+            return jsonify({
+                'success': True,
+                'message': f'图片组 {group_id} 已删除',
+                'deleted_images': len(images_info),
+                'images_info': images_info  # 返回图片信息，让用户了解删除了什么
+            })
 
         print(f"未找到图片组 {group_id}")
         return jsonify({'error': 'Group not found'}), 404
@@ -284,20 +808,21 @@ def delete_tag(group_id):
     if not tag:
         return jsonify({'error': 'Tag not provided'}), 400
 
-    data = load_data()
-    for group in data.get('groups', []):
-        if group['id'] == group_id:
-            if tag in group.get('tags', []):
-                group['tags'].remove(tag)
-                group['modified'] = True
-                save_data(data)
-                return jsonify({
-                    'success': True,
-                    'message': f'Tag "{tag}" removed',
-                    'remaining_tags': group['tags']
-                })
-            else:
-                return jsonify({'error': 'Tag not found'}), 404
+    data = load_group_data(group_id)
+    group = find_group(data, group_id)
+    if group is not None:
+        if tag in group.get('tags', []):
+            before = copy.deepcopy(group)
+            group['tags'].remove(tag)
+            group['modified'] = True
+            commit_changes(data, [(before, group)], 'delete_tag')
+            return jsonify({
+                'success': True,
+                'message': f'Tag "{tag}" removed',
+                'remaining_tags': group['tags']
+            })
+        else:
+            return jsonify({'error': 'Tag not found'}), 404
 
     return jsonify({'error': 'Group not found'}), 404
 
@@ -309,20 +834,21 @@ def add_tag(group_id):
     if not tag:
         return jsonify({'error': 'Tag not provided'}), 400
 
-    data = load_data()
-    for group in data.get('groups', []):
-        if group['id'] == group_id:
-            if tag not in group.get('tags', []):
-                group['tags'].append(tag)
-                group['modified'] = True
-                save_data(data)
-                return jsonify({
-                    'success': True,
-                    'message': f'Tag "{tag}" added',
-                    'tags': group['tags']
-                })
-            else:
-                return jsonify({'error': 'Tag already exists'}), 400
+    data = load_group_data(group_id)
+    group = find_group(data, group_id)
+    if group is not None:
+        if tag not in group.get('tags', []):
+            before = copy.deepcopy(group)
+            group.setdefault('tags', []).append(tag)
+            group['modified'] = True
+            commit_changes(data, [(before, group)], 'add_tag')
+            return jsonify({
+                'success': True,
+                'message': f'Tag "{tag}" added',
+                'tags': group['tags']
+            })
+        else:
+            return jsonify({'error': 'Tag already exists'}), 400
 
     return jsonify({'error': 'Group not found'}), 404
 
@@ -336,20 +862,21 @@ def edit_tag(group_id):
     if not old_tag or not new_tag:
         return jsonify({'error': 'Both old_tag and new_tag are required'}), 400
 
-    data = load_data()
-    for group in data.get('groups', []):
-        if group['id'] == group_id:
-            if old_tag in group.get('tags', []):
-                group['tags'] = [new_tag if tag == old_tag else tag for tag in group['tags']]
-                group['modified'] = True
-                save_data(data)
-                return jsonify({
-                    'success': True,
-                    'message': f'Tag "{old_tag}" changed to "{new_tag}"',
-                    'tags': group['tags']
-                })
-            else:
-                return jsonify({'error': 'Old tag not found'}), 404
+    data = load_group_data(group_id)
+    group = find_group(data, group_id)
+    if group is not None:
+        if old_tag in group.get('tags', []):
+            before = copy.deepcopy(group)
+            group['tags'] = [new_tag if tag == old_tag else tag for tag in group['tags']]
+            group['modified'] = True
+            commit_changes(data, [(before, group)], 'edit_tag')
+            return jsonify({
+                'success': True,
+                'message': f'Tag "{old_tag}" changed to "{new_tag}"',
+                'tags': group['tags']
+            })
+        else:
+            return jsonify({'error': 'Old tag not found'}), 404
 
     return jsonify({'error': 'Group not found'}), 404
 
@@ -365,27 +892,28 @@ def delete_attribute(group_id):
     if not category or not key or not value:
         return jsonify({'error': 'Category, key and value are required'}), 400
 
-    data = load_data()
-    for group in data.get('groups', []):
-        if group['id'] == group_id:
-            attributes = group.get('attributes', {})
-            if category in attributes and key in attributes[category]:
-                if value in attributes[category][key]:
-                    attributes[category][key].remove(value)
-                    # 如果该key下没有值了，删除整个key
-                    if not attributes[category][key]:
-                        del attributes[category][key]
-                    group['modified'] = True
-                    save_data(data)
-                    return jsonify({
-                        'success': True,
-                        'message': f'Attribute "{key}: {value}" removed',
-                        'attributes': attributes
-                    })
-                else:
-                    return jsonify({'error': 'Attribute value not found'}), 404
+    data = load_group_data(group_id)
+    group = find_group(data, group_id)
+    if group is not None:
+        attributes = group.get('attributes', {})
+        if category in attributes and key in attributes[category]:
+            if value in attributes[category][key]:
+                before = copy.deepcopy(group)
+                attributes[category][key].remove(value)
+                # 如果该key下没有值了，删除整个key
+                if not attributes[category][key]:
+                    del attributes[category][key]
+                group['modified'] = True
+                commit_changes(data, [(before, group)], 'delete_attribute')
+                return jsonify({
+                    'success': True,
+                    'message': f'Attribute "{key}: {value}" removed',
+                    'attributes': attributes
+                })
             else:
-                return jsonify({'error': 'Attribute key not found'}), 404
+                return jsonify({'error': 'Attribute value not found'}), 404
+        else:
+            return jsonify({'error': 'Attribute key not found'}), 404
 
     return jsonify({'error': 'Group not found'}), 404
 
@@ -393,59 +921,39 @@ def delete_attribute(group_id):
 # ========== 路由：导入导出 ==========
 @app.route('/api/export', methods=['GET'])
 def export_data():
-    """导出清洗后的数据"""
+    """导出清洗后的数据（pretty=1 时格式化输出）"""
+    cached = not_modified()
+    if cached is not None:
+        return cached
     data = load_data()
-    return jsonify(data)
+    return Response(codec.dumps(data, pretty=bool(parse_bool_arg(request.args.get('pretty')))),
+                    mimetype='application/json')
 
 
 @app.route('/api/export/jsonl', methods=['GET'])
 def export_jsonl():
-    """导出为JSON Lines格式（每行一个完整的处理结果）"""
-    data = load_data()
-    groups = data.get('groups', [])
-
-    # 转换为JSON Lines格式
-    json_lines = []
-
-    for group in groups:
-        # 检查是否是完整的处理结果（有task字段）
-        if 'task' not in group:
-            continue
-
-        # 构建输出格式
-        output_obj = {
-            "task": group.get("task", {}),
-            "provider": group.get("provider", ""),
-            "model": group.get("model", ""),
-            "timestamp": group.get("timestamp", ""),
-            "elapsed_seconds": group.get("elapsed_seconds", 0),
-            "output": {
-                "primary_category": group.get("primary_category", ""),
-                "confidence": group.get("confidence", []),
-                "attributes": group.get("attributes", {
-                    "通用特征": {},
-                    "专属特征": {}
-                }),
-                "tags": group.get("tags", []),
-                "video_description": group.get("video_description", ""),
-                "reasoning": group.get("reasoning", ""),
-                "push_title": group.get("push_title", ""),
-                "封面图包含文字": group.get("封面图包含文字", ""),
-                "直播图包含文字": group.get("直播图包含文字", "")
-            }
-        }
-
-        # 如果有usage字段，也包含进去
-        if "usage" in group:
-            output_obj["usage"] = group["usage"]
-
-        json_lines.append(json.dumps(output_obj, ensure_ascii=False))
-
-    # 返回JSON Lines格式
-    response = Response(
-        "\n".join(json_lines),
-        mimetype='application/json'
-    )
+    """导出为JSON Lines格式（每行一个完整的处理结果）
+
+    数据在视图中一次性读出，响应体逐行生成：大文件下载期间不占用数据锁，也无需在内存中拼出完整响应
+    """
+    groups = load_data().get('groups', [])
+
+    def generate():
+        lines, sent = [], False
+        for group in groups:
+            # 检查是否是完整的处理结果（有task字段）
+            if 'task' not in group:
+                continue
+
+            lines.append(codec.dumps(processed_result(group)))
+            if len(lines) >= EXPORT_STREAM_BATCH:
+                yield (b'\n' if sent else b'') + b'\n'.join(lines)
+                lines, sent = [], True
+        if lines:
+            yield (b'\n' if sent else b'') + b'\n'.join(lines)
+
+    # 返回JSON Lines格式（流式响应）
+    response = Response(generate(), mimetype='application/json')
     response.headers['Content-Disposition'] = 'attachment; filename=processed_results.jsonl'
     return response
 
@@ -453,210 +961,43 @@ def export_jsonl():
 @app.route('/api/export/single/<int:group_id>', methods=['GET'])
 def export_single_group(group_id):
     """导出单个图片组为完整格式"""
-    data = load_data()
-
-    for group in data.get('groups', []):
-        if group['id'] == group_id and 'task' in group:
-            # 构建完整的输出对象
-            output_obj = {
-                "task": group.get("task", {}),
-                "provider": group.get("provider", ""),
-                "model": group.get("model", ""),
-                "timestamp": group.get("timestamp", ""),
-                "elapsed_seconds": group.get("elapsed_seconds", 0),
-                "output": {
-                    "primary_category": group.get("primary_category", ""),
-                    "confidence": group.get("confidence", []),
-                    "attributes": group.get("attributes", {
-                        "通用特征": {},
-                        "专属特征": {}
-                    }),
-                    "tags": group.get("tags", []),
-                    "video_description": group.get("video_description", ""),
-                    "reasoning": group.get("reasoning", ""),
-                    "push_title": group.get("push_title", ""),
-                    "封面图包含文字": group.get("封面图包含文字", ""),
-                    "直播图包含文字": group.get("直播图包含文字", "")
-                }
-            }
-
-            if "usage" in group:
-                output_obj["usage"] = group["usage"]
-
-            response = Response(
-                json.dumps(output_obj, ensure_ascii=False, indent=2),
-                mimetype='application/json'
-            )
-            response.headers['Content-Disposition'] = f'attachment; filename=group_{group_id}_processed.json'
-            return response
+    group = find_group(load_group_data(group_id), group_id)
+    if group is not None and 'task' in group:
+        response = Response(
+            codec.dumps(processed_result(group), pretty=True),
+            mimetype='application/json'
+        )
+        response.headers['Content-Disposition'] = f'attachment; filename=group_{group_id}_processed.json'
+        return response
 
     return jsonify({'error': 'Group not found or not processed'}), 404
 
 
 @app.route('/api/import', methods=['POST'])
 def import_data():
-    """导入JSON数据并自动分组"""
+    """导入JSON数据并自动分组（单个记录、记录数组或传统images数组格式）"""
     try:
-        import_data = request.get_json()
-        if not import_data:
+        payload = request.get_json()
+        if not payload:
             return jsonify({'error': 'No data provided'}), 400
-
-        # 合并导入的数据
-        data = load_data()
-
-        # 获取当前最大ID
-        max_group_id = max([g['id'] for g in data.get('groups', [])], default=0)
-        max_image_id = 0
-        for group in data.get('groups', []):
-            for img in group.get('images', []):
-                max_image_id = max(max_image_id, img.get('id', 0))
-
-        imported_groups = 0
-
-        # 检查数据格式：如果是example.json格式的单个图片组
-        if 'output' in import_data and 'task' in import_data:
-            print("检测到example.json格式的数据")
-            # 处理单个图片组数据
-            output_data = import_data.get('output', {})
-
-            # 检查是否已存在相同UID的图片组
-            import_uid = import_data.get('task', {}).get('uid')
-            if import_uid:
-                existing_group = None
-                for group in data.get('groups', []):
-                    if group.get('task', {}).get('uid') == import_uid:
-                        existing_group = group
-                        break
-
-                if existing_group:
-                    print(f"发现重复UID {import_uid}，跳过导入（现有组ID: {existing_group['id']}）")
-                    return jsonify({
-                        'success': False,
-                        'message': f'UID {import_uid} 已存在，跳过导入',
-                        'existing_group_id': existing_group['id']
-                    })
-
-            # 从cover_url和live_url创建图片
-            images = []
-            if import_data.get('task', {}).get('cover_url'):
-                max_image_id += 1
-                images.append({
-                    'id': max_image_id,
-                    'url': import_data['task']['cover_url'],
-                    'type': 'cover'
-                })
-
-            if import_data.get('task', {}).get('live_url'):
-                max_image_id += 1
-                images.append({
-                    'id': max_image_id,
-                    'url': import_data['task']['live_url'],
-                    'type': 'live'
-                })
-
-            if images:
-                max_group_id += 1
-                new_group = {
-                    'id': max_group_id,
-                    'task': import_data.get('task', {}),
-                    'provider': import_data.get('provider', ''),
-                    'model': import_data.get('model', ''),
-                    'timestamp': import_data.get('timestamp', ''),
-                    'elapsed_seconds': import_data.get('elapsed_seconds', 0),
-                    'usage': import_data.get('usage', {}),
-                    'images': images,
-                    'primary_category': output_data.get('primary_category', ''),
-                    'confidence': output_data.get('confidence', []),
-                    'attributes': output_data.get('attributes', {
-                        '通用特征': {},
-                        '专属特征': {}
-                    }),
-                    'tags': output_data.get('tags', []),
-                    'video_description': output_data.get('video_description', ''),
-                    'reasoning': output_data.get('reasoning', ''),
-                    'push_title': output_data.get('push_title', ''),
-                    '封面图包含文字': output_data.get('封面图包含文字', ''),
-                    '直播图包含文字': output_data.get('直播图包含文字', ''),
-                    'reviewed': False,
-                    'modified': False
-                }
-                data['groups'].append(new_group)
-                imported_groups += 1
-                print(f"成功导入单个图片组，ID: {max_group_id}")
-
-        # 检查是否是原来的images数组格式
-        elif 'images' in import_data:
-            print("检测到传统images数组格式的数据")
-            # 收集现有图片ID
-            existing_image_ids = set()
-            for group in data.get('groups', []):
-                for img in group.get('images', []):
-                    existing_image_ids.add(img['id'])
-
-            # 收集需要导入的图片
-            new_images = []
-            for img in import_data['images']:
-                if 'filename' in img:
-                    if img.get('id') and img['id'] not in existing_image_ids:
-                        # 保留原有ID
-                        new_images.append({
-                            'id': img['id'],
-                            'filename': img['filename'],
-                            'tags': img.get('tags', []),
-                            'reviewed': img.get('reviewed', False)
-                        })
-                    elif not img.get('id'):
-                        # 分配新ID
-                        max_image_id += 1
-                        new_images.append({
-                            'id': max_image_id,
-                            'filename': img['filename'],
-                            'tags': img.get('tags', []),
-                            'reviewed': img.get('reviewed', False)
-                        })
-
-            # 将新图片两两分组
-            for i in range(0, len(new_images), 2):
-                group_images = new_images[i:i+2]
-
-                # 合并tags
-                group_tags = []
-                for img in group_images:
-                    group_tags.extend(img.get('tags', []))
-                group_tags = list(set(group_tags))  # 去重
-
-                max_group_id += 1
-                new_group = {
-                    'id': max_group_id,
-                    'images': [{'id': img['id'], 'filename': img['filename']} for img in group_images],
-                    'primary_category': '',
-                    'confidence': [],
-                    'attributes': {
-                        '通用特征': {},
-                        '专属特征': {}
-                    },
-                    'tags': group_tags,
-                    'video_description': '',
-                    'reasoning': '',
-                    'reviewed': any(img.get('reviewed', False) for img in group_images),
-                    'modified': False
-                }
-                data['groups'].append(new_group)
-                imported_groups += 1
-
-        else:
-            return jsonify({'error': 'Unsupported data format. Expected either "images" array or single group with "output" field'}), 400
-
-        if imported_groups > 0:
-            save_data(data)
-            print(f"成功导入 {imported_groups} 个图片组")
+        try:
+            policy = parse_import_policy(request.args.get('policy'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        entries = None if is_legacy_payload(payload) else entries_from_payload(payload)
+        body, status = import_entries(entries, payload, policy,
+                                      parse_bool_arg(request.args.get('continue_on_error')), 'request')
+
+        # 单个记录因uid重复被跳过时，沿用原有的提示格式
+        if entries is not None and len(entries) == 1 and body.get('skipped_ids'):
+            uid = payload['task'].get('uid')
             return jsonify({
-                'success': True,
-                'message': f'成功导入 {imported_groups} 个图片组',
-                'groups_created': imported_groups
+                'success': False,
+                'message': f'UID {uid} 已存在，跳过导入',
+                'existing_group_id': body['skipped_ids'][0]
             })
-        else:
-            return jsonify({'error': 'No valid data to import'}), 400
+        return jsonify(body), status
 
     except Exception as e:
         print(f"导入数据时发生错误: {str(e)}")
@@ -665,71 +1006,74 @@ def import_data():
         return jsonify({'error': f'服务器内部错误: {str(e)}'}), 500
 
 
-def process_single_group_item(item_data, data, max_group_id_ref, max_image_id_ref):
-    """处理单个图片组对象的导入"""
-    # 检查是否已存在相同UID的图片组
-    import_uid = item_data.get('task', {}).get('uid')
-    if import_uid:
-        existing_group = None
-        for group in data.get('groups', []):
-            if group.get('task', {}).get('uid') == import_uid:
-                existing_group = group
-                break
-
-        if existing_group:
-            print(f"发现重复UID {import_uid}，跳过导入（现有组ID: {existing_group['id']}）")
-            return False  # 不算作成功导入
-
-    # 从cover_url和live_url创建图片
-    images = []
-    if item_data.get('task', {}).get('cover_url'):
-        max_image_id_ref[0] += 1
-        images.append({
-            'id': max_image_id_ref[0],
-            'url': item_data['task']['cover_url'],
-            'type': 'cover'
-        })
+def parse_import_content(text, is_jsonl):
+    """解析导入文件内容，返回(entries, payload)；JSONL逐行解析，坏行作为该行的错误"""
+    if is_jsonl:
+        print("检测到JSON Lines格式的文件")
+        return parse_jsonl(text), None
+    payload = codec.loads(text)
+    if is_legacy_payload(payload):
+        return None, payload
+    return entries_from_payload(payload), payload
 
-    if item_data.get('task', {}).get('live_url'):
-        max_image_id_ref[0] += 1
-        images.append({
-            'id': max_image_id_ref[0],
-            'url': item_data['task']['live_url'],
-            'type': 'live'
-        })
 
-    if images:
-        max_group_id_ref[0] += 1
-        output_data = item_data.get('output', {})
-        new_group = {
-            'id': max_group_id_ref[0],
-            'task': item_data.get('task', {}),
-            'provider': item_data.get('provider', ''),
-            'model': item_data.get('model', ''),
-            'timestamp': item_data.get('timestamp', ''),
-            'elapsed_seconds': item_data.get('elapsed_seconds', 0),
-            'usage': item_data.get('usage', {}),
-            'images': images,
-            'primary_category': output_data.get('primary_category', ''),
-            'confidence': output_data.get('confidence', []),
-            'attributes': output_data.get('attributes', {
-                '通用特征': {},
-                '专属特征': {}
-            }),
-            'tags': output_data.get('tags', []),
-            'video_description': output_data.get('video_description', ''),
-            'reasoning': output_data.get('reasoning', ''),
-            'push_title': output_data.get('push_title', ''),
-            '封面图包含文字': output_data.get('封面图包含文字', ''),
-            '直播图包含文字': output_data.get('直播图包含文字', ''),
-            'reviewed': False,
-            'modified': False
-        }
-        data['groups'].append(new_group)
-        print(f"成功导入单个图片组，ID: {max_group_id_ref[0]}, UID: {import_uid}")
-        return True
+def import_entries(entries, payload, policy, continue_on_error, source):
+    """统一的导入流程：校验、建组或按策略合并，一次性提交并生成错误报告
+
+    entries为None时按传统images数组格式导入payload；返回(响应体, 状态码)
+    """
+    if entries is not None and not entries:
+        return {'error': 'No valid data to import'}, 400
 
-    return False
+    start_time = time.time()
+    data = load_data()
+    try:
+        if entries is None:
+            result = import_legacy(data, payload)
+        else:
+            index = get_index(data)
+            groups = data.get('groups', [])
+            result = run_import(data, entries, lambda uid: index.find(groups, index.by_uid.get(uid)),
+                                policy, continue_on_error)
+    except ImportAborted as e:
+        print(f"导入中止（{source}）：{e}")
+        return {'error': str(e), 'line': e.line}, 400
+
+    elapsed = time.time() - start_time
+    metrics.IMPORT_DURATION.observe(elapsed)
+    for outcome, count in result.summary().items():
+        if outcome != 'total':
+            metrics.IMPORT_RECORDS.inc(count, result=outcome)
+
+    report_id = save_report(result, source)
+    body = {
+        'success': bool(result.created or result.updated),
+        'summary': result.summary(),
+        'groups_created': len(result.created),
+        'groups_updated': len(result.updated),
+        'skipped_ids': [item['existing_group_id'] for item in result.skipped
+                        if 'existing_group_id' in item][:MAX_INLINE_IMPORT_ITEMS],
+        'errors': result.errors[:MAX_INLINE_IMPORT_ITEMS],
+        'report_id': report_id,
+        'report_url': f'/api/import/reports/{report_id}' if report_id else None,
+        'elapsed_seconds': round(elapsed, 3)
+    }
+    if not body['success']:
+        body['error'] = 'No valid data to import'
+        return body, 400
+
+    if policy == 'replace' and result.updated:
+        prune_attribute_blocks(data)
+    batch_id = new_batch_id()
+    commit_changes(data, [(None, g) for g in result.created] + result.updated, 'import', batch_id=batch_id)
+    message = f'成功导入 {len(result.created)} 个图片组'
+    if result.updated:
+        message += f'，更新 {len(result.updated)} 个已有组'
+    if result.errors:
+        message += f'，{len(result.errors)} 行出错'
+    print(f"{message}（{source}）")
+    body.update({'batch_id': batch_id, 'message': message})
+    return body, 200
 
 
 @app.route('/api/import/file', methods=['POST'])
@@ -746,148 +1090,18 @@ def import_from_file():
         if not (file.filename.endswith('.json') or file.filename.endswith('.jsonl')):
             return jsonify({'error': 'Only JSON and JSONL files are allowed'}), 400
 
-        # 读取文件内容
-        file_content = file.read().decode('utf-8')
-
-        # 检查是否是JSON Lines格式（.jsonl文件）
-        if file.filename.endswith('.jsonl'):
-            print("检测到JSON Lines格式的文件")
-            # 解析JSON Lines格式
-            json_objects = []
-            for line_num, line in enumerate(file_content.strip().split('\n'), 1):
-                line = line.strip()
-                if line:  # 跳过空行
-                    try:
-                        json_obj = json.loads(line)
-                        json_objects.append(json_obj)
-                    except json.JSONDecodeError as e:
-                        return jsonify({'error': f'JSON解析错误在第{line_num}行: {str(e)}'}), 400
-
-            if not json_objects:
-                return jsonify({'error': 'JSONL文件中没有有效的JSON对象'}), 400
-
-            import_data = json_objects  # 对于JSONL，直接使用对象数组
-        else:
-            # 处理单个JSON对象
-            import_data = json.loads(file_content)
-            if not import_data:
-                return jsonify({'error': 'Empty JSON file'}), 400
-
-        # 合并导入的数据
-        data = load_data()
-
-        # 获取当前最大ID
-        max_group_id = max([g['id'] for g in data.get('groups', [])], default=0)
-        max_image_id = 0
-        for group in data.get('groups', []):
-            for img in group.get('images', []):
-                max_image_id = max(max_image_id, img.get('id', 0))
-
-        imported_groups = 0
-
-        # 处理数据：如果是JSON Lines数组，每个元素都是一个图片组对象
-        if isinstance(import_data, list):
-            print(f"处理JSON Lines格式，包含 {len(import_data)} 个对象")
-            max_group_id_ref = [max_group_id]
-            max_image_id_ref = [max_image_id]
-            for item_index, item_data in enumerate(import_data):
-                try:
-                    print(f"处理第 {item_index + 1} 个对象...")
-                    success = process_single_group_item(item_data, data, max_group_id_ref, max_image_id_ref)
-                    if success:
-                        imported_groups += 1
-                except Exception as e:
-                    print(f"处理第 {item_index + 1} 个对象时出错: {str(e)}")
-                    # 继续处理其他对象，不中断整个导入过程
-
-            # 更新外部变量
-            max_group_id = max_group_id_ref[0]
-            max_image_id = max_image_id_ref[0]
-
-        # 检查数据格式：如果是example.json格式的单个图片组
-        elif 'output' in import_data and 'task' in import_data:
-            print("检测到example.json格式的文件数据")
-            max_group_id_ref = [max_group_id]
-            max_image_id_ref = [max_image_id]
-            success = process_single_group_item(import_data, data, max_group_id_ref, max_image_id_ref)
-            if success:
-                imported_groups += 1
-                max_group_id = max_group_id_ref[0]
-                max_image_id = max_image_id_ref[0]
-
-        # 检查是否是原来的images数组格式
-        elif 'images' in import_data:
-            print("检测到传统images数组格式的文件数据")
-            # 收集现有图片ID
-            existing_image_ids = set()
-            for group in data.get('groups', []):
-                for img in group.get('images', []):
-                    existing_image_ids.add(img['id'])
-
-            # 收集需要导入的图片
-            new_images = []
-            for img in import_data['images']:
-                if 'filename' in img:
-                    if img.get('id') and img['id'] not in existing_image_ids:
-                        new_images.append({
-                            'id': img['id'],
-                            'filename': img['filename'],
-                            'tags': img.get('tags', []),
-                            'reviewed': img.get('reviewed', False)
-                        })
-                    elif not img.get('id'):
-                        max_image_id += 1
-                        new_images.append({
-                            'id': max_image_id,
-                            'filename': img['filename'],
-                            'tags': img.get('tags', []),
-                            'reviewed': img.get('reviewed', False)
-                        })
-
-            # 将新图片两两分组
-            for i in range(0, len(new_images), 2):
-                group_images = new_images[i:i+2]
-
-                # 合并tags
-                group_tags = []
-                for img in group_images:
-                    group_tags.extend(img.get('tags', []))
-                group_tags = list(set(group_tags))
-
-                max_group_id += 1
-                new_group = {
-                    'id': max_group_id,
-                    'images': [{'id': img['id'], 'filename': img['filename']} for img in group_images],
-                    'primary_category': '',
-                    'confidence': [],
-                    'attributes': {
-                        '通用特征': {},
-                        '专属特征': {}
-                    },
-                    'tags': group_tags,
-                    'video_description': '',
-                    'reasoning': '',
-                    'reviewed': any(img.get('reviewed', False) for img in group_images),
-                    'modified': False
-                }
-                data['groups'].append(new_group)
-                imported_groups += 1
+        try:
+            policy = parse_import_policy(request.form.get('policy') or request.args.get('policy'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        continue_on_error = parse_bool_arg(request.form.get('continue_on_error')
+                                           or request.args.get('continue_on_error'))
 
-        else:
-            return jsonify({'error': 'Unsupported JSON format. Expected either "images" array or single group with "output" field'}), 400
+        entries, payload = parse_import_content(file.read().decode('utf-8'), file.filename.endswith('.jsonl'))
+        body, status = import_entries(entries, payload, policy, continue_on_error, file.filename)
+        return jsonify(body), status
 
-        if imported_groups > 0:
-            save_data(data)
-            print(f"成功从文件导入 {imported_groups} 个图片组")
-            return jsonify({
-                'success': True,
-                'message': f'成功导入 {imported_groups} 个图片组',
-                'groups_created': imported_groups
-            })
-        else:
-            return jsonify({'error': 'No valid data to import from file'}), 400
-
-    except json.JSONDecodeError:
+    except codec.DecodeError:
         return jsonify({'error': 'Invalid JSON format'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -901,6 +1115,10 @@ def import_from_path():
         file_path = data.get('file_path')
         if not file_path:
             return jsonify({'error': 'No file path provided'}), 400
+        try:
+            policy = parse_import_policy(data.get('policy'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         # 安全检查：防止目录遍历攻击
         if '..' in file_path:
@@ -927,146 +1145,13 @@ def import_from_path():
         with open(file_path, 'r', encoding='utf-8') as f:
             file_content = f.read()
 
-        # 解析JSON
-        if file_path.endswith('.jsonl'):
-            print(f"检测到JSON Lines格式文件：{file_path}")
-            # 解析JSON Lines格式
-            json_objects = []
-            for line_num, line in enumerate(file_content.strip().split('\n'), 1):
-                line = line.strip()
-                if line:  # 跳过空行
-                    try:
-                        json_obj = json.loads(line)
-                        json_objects.append(json_obj)
-                    except json.JSONDecodeError as e:
-                        return jsonify({'error': f'JSON解析错误在第{line_num}行: {str(e)}'}), 400
-
-            if not json_objects:
-                return jsonify({'error': 'JSONL文件中没有有效的JSON对象'}), 400
-
-            import_data = json_objects  # 对于JSONL，直接使用对象数组
-        else:
-            # 处理单个JSON对象
-            import_data = json.loads(file_content)
-            if not import_data:
-                return jsonify({'error': 'Empty JSON file'}), 400
-
-        # 合并导入的数据
-        data_dict = load_data()
-
-        # 获取当前最大ID
-        max_group_id = max([g['id'] for g in data_dict.get('groups', [])], default=0)
-        max_image_id = 0
-        for group in data_dict.get('groups', []):
-            for img in group.get('images', []):
-                max_image_id = max(max_image_id, img.get('id', 0))
-
-        imported_groups = 0
-
-        # 处理数据：如果是JSON Lines数组，每个元素都是一个图片组对象
-        if isinstance(import_data, list):
-            print(f"处理JSON Lines格式，包含 {len(import_data)} 个对象")
-            max_group_id_ref = [max_group_id]
-            max_image_id_ref = [max_image_id]
-            for item_index, item_data in enumerate(import_data):
-                try:
-                    print(f"处理第 {item_index + 1} 个对象...")
-                    success = process_single_group_item(item_data, data_dict, max_group_id_ref, max_image_id_ref)
-                    if success:
-                        imported_groups += 1
-                except Exception as e:
-                    print(f"处理第 {item_index + 1} 个对象时出错: {str(e)}")
-                    # 继续处理其他对象，不中断整个导入过程
-
-            # 更新外部变量
-            max_group_id = max_group_id_ref[0]
-            max_image_id = max_image_id_ref[0]
-
-        # 检查数据格式：如果是example.json格式的单个图片组
-        elif 'output' in import_data and 'task' in import_data:
-            print("检测到example.json格式的文件数据")
-            max_group_id_ref = [max_group_id]
-            max_image_id_ref = [max_image_id]
-            success = process_single_group_item(import_data, data_dict, max_group_id_ref, max_image_id_ref)
-            if success:
-                imported_groups += 1
-                max_group_id = max_group_id_ref[0]
-                max_image_id = max_image_id_ref[0]
-
-        # 检查是否是原来的images数组格式
-        elif 'images' in import_data:
-            print("检测到传统images数组格式的文件数据")
-            # 收集现有图片ID
-            existing_image_ids = set()
-            for group in data_dict.get('groups', []):
-                for img in group.get('images', []):
-                    existing_image_ids.add(img['id'])
+        entries, payload = parse_import_content(file_content, file_path.endswith('.jsonl'))
+        body, status = import_entries(entries, payload, policy, bool(data.get('continue_on_error')), file_path)
+        if status == 200:
+            body['file_path'] = file_path
+        return jsonify(body), status
 
-            # 收集需要导入的图片
-            new_images = []
-            for img in import_data['images']:
-                if 'filename' in img:
-                    if img.get('id') and img['id'] not in existing_image_ids:
-                        new_images.append({
-                            'id': img['id'],
-                            'filename': img['filename'],
-                            'tags': img.get('tags', []),
-                            'reviewed': img.get('reviewed', False)
-                        })
-                    elif not img.get('id'):
-                        max_image_id += 1
-                        new_images.append({
-                            'id': max_image_id,
-                            'filename': img['filename'],
-                            'tags': img.get('tags', []),
-                            'reviewed': img.get('reviewed', False)
-                        })
-
-            # 将新图片两两分组
-            for i in range(0, len(new_images), 2):
-                group_images = new_images[i:i+2]
-
-                # 合并tags
-                group_tags = []
-                for img in group_images:
-                    group_tags.extend(img.get('tags', []))
-                group_tags = list(set(group_tags))  # 去重
-
-                max_group_id += 1
-                new_group = {
-                    'id': max_group_id,
-                    'images': [{'id': img['id'], 'filename': img['filename']} for img in group_images],
-                    'primary_category': '',
-                    'confidence': [],
-                    'attributes': {
-                        '通用特征': {},
-                        '专属特征': {}
-                    },
-                    'tags': group_tags,
-                    'video_description': '',
-                    'reasoning': '',
-                    'reviewed': any(img.get('reviewed', False) for img in group_images),
-                    'modified': False
-                }
-                data_dict['groups'].append(new_group)
-                imported_groups += 1
-
-        else:
-            return jsonify({'error': 'Unsupported JSON format. Expected either "images" array or single group with "output" field'}), 400
-
-        if imported_groups > 0:
-            save_data(data_dict)
-            print(f"成功从路径 {file_path} 导入 {imported_groups} 个图片组")
-            return jsonify({
-                'success': True,
-                'message': f'成功从路径导入 {imported_groups} 个图片组',
-                'groups_created': imported_groups,
-                'file_path': file_path
-            })
-        else:
-            return jsonify({'error': 'No valid data to import from path'}), 400
-
-    except json.JSONDecodeError:
+    except codec.DecodeError:
         return jsonify({'error': 'Invalid JSON format'}), 400
     except Exception as e:
         print(f"路径导入失败：{str(e)}")
@@ -1075,6 +1160,64 @@ def import_from_path():
         return jsonify({'error': f'服务器内部错误: {str(e)}'}), 500
 
 
+@app.route('/api/import/reports/<report_id>', methods=['GET'])
+def download_import_report(report_id):
+    """下载导入错误报告（JSON Lines：首行为汇总，其后每行一个出错或跳过的记录）"""
+    if not is_report_id(report_id) or not os.path.exists(import_report_path(report_id)):
+        return jsonify({'error': 'Report not found'}), 404
+    return send_file(os.path.abspath(import_report_path(report_id)), mimetype='application/x-ndjson',
+                     as_attachment=True, download_name=f'import_report_{report_id}.jsonl')
+
+
+@app.route('/api/export/dataset', methods=['POST'])
+def start_dataset_export():
+    """启动训练数据分片导出（后台执行，结果保存在exports/<任务ID>/）
+
+    请求体：{"format": "parquet"|"ndjson"|"tar", "shard_size": 10000, "all": false（默认只导出已审核的组）}
+    """
+    payload = request.get_json(silent=True) or {}
+    fmt = payload.get('format') or dataset_export.DEFAULT_FORMAT
+    try:
+        written_format = dataset_export.resolve_format(fmt)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        shard_size = int(payload.get('shard_size', dataset_export.DEFAULT_SHARD_SIZE))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'shard_size must be an integer'}), 400
+    if not 0 < shard_size <= dataset_export.MAX_SHARD_SIZE:
+        return jsonify({'error': f'shard_size must be between 1 and {dataset_export.MAX_SHARD_SIZE}'}), 400
+
+    job_id = dataset_export.jobs.start(fmt=fmt, shard_size=shard_size, reviewed_only=not payload.get('all'),
+                                       data_dir=DATA_DIR, snapshot_file=SNAPSHOT_FILE, image_folder=IMAGE_FOLDER)
+    if job_id is None:
+        return jsonify({'error': 'Another dataset export is running'}), 409
+    return jsonify({'success': True, 'job_id': job_id, 'format': written_format,
+                    'status_url': f'/api/export/dataset/{job_id}'}), 202
+
+
+@app.route('/api/export/dataset/<job_id>', methods=['GET'])
+def get_dataset_export(job_id):
+    """导出任务状态；完成后附带清单（各分片的组数、大小、sha256与下载地址）"""
+    status = dataset_export.jobs.status(job_id) if dataset_export.jobs.is_job_id(job_id) else None
+    if status is None:
+        return jsonify({'error': 'Export not found'}), 404
+    manifest = dataset_export.jobs.manifest(job_id) if status['state'] == 'done' else None
+    if manifest is not None:
+        for shard in manifest['shards']:
+            shard['url'] = f"/api/export/dataset/{job_id}/{shard['file']}"
+    return jsonify({'job_id': job_id, **status, 'manifest': manifest})
+
+
+@app.route('/api/export/dataset/<job_id>/<name>', methods=['GET'])
+def download_dataset_export(job_id, name):
+    """下载导出任务的分片或清单"""
+    path = dataset_export.jobs.file_path(job_id, name) if dataset_export.jobs.is_job_id(job_id) else None
+    if path is None:
+        return jsonify({'error': 'File not found'}), 404
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=f'{job_id}_{name}')
+
+
 # ========== 路由：文件上传 ==========
 @app.route('/api/upload', methods=['POST'])
 def upload_files():
@@ -1082,32 +1225,119 @@ def upload_files():
     if 'files' not in request.files:
         return jsonify({'error': 'No files provided'}), 400
 
+    results, _ = ingest_uploads(request.files.getlist('files'))
+
+    return jsonify({
+        'uploaded': sum(1 for r in results if r['status'] == 'uploaded'),
+        'duplicates': [{'filename': r['filename'], 'duplicate_of': r['duplicate_of']}
+                       for r in results if r['status'] == 'duplicate'],
+        'errors': [f"{r['filename']}: {r['error']}" for r in results if r['status'] in ('error', 'skipped')]
+    })
+
+
+@app.route('/api/upload/bulk', methods=['POST'])
+def upload_bulk():
+    """批量上传图片：支持多个图片文件及zip/tar压缩包，一次性入库并返回逐文件结果"""
     files = request.files.getlist('files')
-    uploaded = 0
-    errors = []
+    if not files:
+        return jsonify({'error': 'No files provided'}), 400
+
+    start_time = time.time()
+    results, groups_created = ingest_uploads(files, allow_archives=True)
+
+    summary = {}
+    for r in results:
+        summary[r['status']] = summary.get(r['status'], 0) + 1
+
+    return jsonify({
+        'success': True,
+        'summary': summary,
+        'groups_created': groups_created,
+        'elapsed_seconds': round(time.time() - start_time, 3),
+        'results': results
+    })
+
+
+def ingest_uploads(files, allow_archives=False):
+    """将上传的文件（及压缩包内条目）流式写盘、按哈希去重，并一次性登记入库
+
+    返回(逐文件结果列表, 新建组数)，结果status为uploaded / duplicate / skipped / error
+    """
+    hash_index = load_hash_index()
+    results = []
+    new_images = []
+
+    def _ingest(stream, name):
+        filename = secure_filename(os.path.basename(name))
+        if not filename or not allowed_file(filename):
+            results.append({'filename': name, 'status': 'skipped', 'error': 'Invalid file type'})
+            return
+        try:
+            # 边写盘边计算内容哈希，内容重复的文件不再保存
+            tmp_path, content_hash = save_stream_hashed(stream, IMAGE_FOLDER)
+            canonical = hash_index['by_hash'].get(content_hash)
+            if canonical and os.path.exists(os.path.join(IMAGE_FOLDER, canonical)):
+                os.remove(tmp_path)
+                results.append({'filename': name, 'status': 'duplicate', 'duplicate_of': canonical})
+                return
+
+            filename = unique_image_filename(filename, content_hash)
+            os.replace(tmp_path, os.path.join(IMAGE_FOLDER, filename))
+            register_image_hash(hash_index, filename, content_hash)
+            hash_index['by_hash'][content_hash] = filename
+            new_images.append((filename, content_hash))
+            results.append({'filename': name, 'status': 'uploaded', 'saved_as': filename, 'sha256': content_hash})
+        except Exception as e:
+            results.append({'filename': name, 'status': 'error', 'error': str(e)})
 
     for file in files:
         if file.filename == '':
             continue
-
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(IMAGE_FOLDER, filename)
+        lower_name = file.filename.lower()
+        if allow_archives and lower_name.endswith('.zip'):
+            try:
+                with zipfile.ZipFile(file.stream) as archive:
+                    for entry in archive.infolist():
+                        if entry.is_dir():
+                            continue
+                        with archive.open(entry) as entry_stream:
+                            _ingest(entry_stream, entry.filename)
+            except zipfile.BadZipFile as e:
+                results.append({'filename': file.filename, 'status': 'error', 'error': str(e)})
+        elif allow_archives and lower_name.endswith(('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')):
             try:
-                file.save(file_path)
-                uploaded += 1
-            except Exception as e:
-                errors.append(f"{filename}: {str(e)}")
+                # 流式模式逐条读取，不需要随机访问整个压缩包
+                with tarfile.open(fileobj=file.stream, mode='r|*') as archive:
+                    for entry in archive:
+                        if not entry.isfile():
+                            continue
+                        entry_stream = archive.extractfile(entry)
+                        _ingest(entry_stream, entry.name)
+            except tarfile.TarError as e:
+                results.append({'filename': file.filename, 'status': 'error', 'error': str(e)})
         else:
-            errors.append(f"{file.filename}: Invalid file type")
+            _ingest(file.stream, file.filename)
 
-    # 重新扫描图片目录以更新数据库
-    scan_and_add_images()
+    save_hash_index(hash_index)
 
-    return jsonify({
-        'uploaded': uploaded,
-        'errors': errors
-    })
+    # 所有新图片一次加载、一次保存，无需重新扫描目录
+    groups_created = 0
+    if new_images:
+        data = load_data()
+        groups_created = add_image_groups(data, new_images)
+        commit_changes(data, [(None, g) for g in data['groups'][-groups_created:]], 'upload',
+                       batch_id=new_batch_id())
+        print(f"[OK] Uploaded {len(new_images)} new images, created {groups_created} new groups")
+
+    return results, groups_created
+
+
+def unique_image_filename(filename, content_hash):
+    """同名文件已存在（且内容不同）时，在文件名后追加哈希前缀避免覆盖"""
+    if not os.path.exists(os.path.join(IMAGE_FOLDER, filename)):
+        return filename
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}_{content_hash[:8]}{ext}"
 
 
 def allowed_file(filename):
@@ -1120,6 +1350,9 @@ def allowed_file(filename):
 @app.route('/api/statistics', methods=['GET'])
 def get_statistics():
     """获取统计信息"""
+    cached = not_modified()
+    if cached is not None:
+        return cached
     data = load_data()
     groups = data.get('groups', [])
 
@@ -1151,7 +1384,6 @@ def get_statistics():
 @app.route('/api/groups/stats', methods=['GET'])
 def get_groups_stats():
     """获取图片组分页统计信息"""
-    scan_and_add_images()
     data = load_data()
     groups = data.get('groups', [])
 
@@ -1178,18 +1410,21 @@ def batch_delete_tag():
         return jsonify({'error': 'Tag not provided'}), 400
 
     data = load_data()
-    deleted_count = 0
+    changes = []
+    batch_id = new_batch_id()
 
-    for group in data.get('groups', []):
-        if tag in group.get('tags', []):
-            group['tags'].remove(tag)
-            group['modified'] = True
-            deleted_count += 1
+    for group in select_groups(data, {'tag': tag}):
+        before = copy.deepcopy(group)
+        group['tags'].remove(tag)
+        group['modified'] = True
+        changes.append((before, group))
 
-    save_data(data)
+    if changes:
+        commit_changes(data, changes, 'batch_delete_tag', batch_id=batch_id)
 
     return jsonify({
-        'message': f'从 {deleted_count} 个组中删除了标签 "{tag}"'
+        'message': f'从 {len(changes)} 个组中删除了标签 "{tag}"',
+        'batch_id': batch_id if changes else None
     })
 
 
@@ -1203,21 +1438,841 @@ def batch_replace_tag():
         return jsonify({'error': 'Both old_tag and new_tag are required'}), 400
 
     data = load_data()
-    replaced_count = 0
+    changes = []
+    batch_id = new_batch_id()
 
-    for group in data.get('groups', []):
-        if old_tag in group.get('tags', []):
-            group['tags'] = [new_tag if t == old_tag else t for t in group['tags']]
-            group['modified'] = True
-            replaced_count += 1
+    for group in select_groups(data, {'tag': old_tag}):
+        before = copy.deepcopy(group)
+        group['tags'] = [new_tag if t == old_tag else t for t in group['tags']]
+        group['modified'] = True
+        changes.append((before, group))
 
-    save_data(data)
+    if changes:
+        commit_changes(data, changes, 'batch_replace_tag', batch_id=batch_id)
 
     return jsonify({
-        'message': f'在 {replaced_count} 个组中将 "{old_tag}" 替换为 "{new_tag}"'
+        'message': f'在 {len(changes)} 个组中将 "{old_tag}" 替换为 "{new_tag}"',
+        'batch_id': batch_id if changes else None
     })
 
 
+BATCH_OPERATIONS = {
+    'set_reviewed': ('value',),
+    'add_tag': ('tag',),
+    'remove_tag': ('tag',),
+    'replace_tag': ('old_tag', 'new_tag'),
+    'set_attribute': ('category', 'key', 'values'),
+    'remove_attribute': ('category', 'key'),
+    'set_category': ('value',)
+}
+
+
+def apply_batch_operation(group, op):
+    """对单个组执行一项批量操作，返回组是否发生变化"""
+    name = op['op']
+
+    if name == 'set_reviewed':
+        if group.get('reviewed', False) == bool(op['value']):
+            return False
+        group['reviewed'] = bool(op['value'])
+        return True
+
+    if name == 'add_tag':
+        if op['tag'] in group.setdefault('tags', []):
+            return False
+        group['tags'].append(op['tag'])
+
+    elif name == 'remove_tag':
+        if op['tag'] not in group.get('tags', []):
+            return False
+        group['tags'].remove(op['tag'])
+
+    elif name == 'replace_tag':
+        if op['old_tag'] not in group.get('tags', []):
+            return False
+        # 替换后去重，避免新标签已存在时出现重复
+        new_tags = []
+        for tag in group['tags']:
+            tag = op['new_tag'] if tag == op['old_tag'] else tag
+            if tag not in new_tags:
+                new_tags.append(tag)
+        group['tags'] = new_tags
+
+    elif name == 'set_attribute':
+        attributes = group.setdefault('attributes', {'通用特征': {}, '专属特征': {}})
+        values = list(op['values'])
+        if attributes.get(op['category'], {}).get(op['key']) == values:
+            return False
+        attributes.setdefault(op['category'], {})[op['key']] = values
+
+    elif name == 'remove_attribute':
+        attrs = (group.get('attributes') or {}).get(op['category'], {})
+        if op['key'] not in attrs:
+            return False
+        if op.get('value') is None:
+            del attrs[op['key']]
+        else:
+            if op['value'] not in attrs[op['key']]:
+                return False
+            attrs[op['key']].remove(op['value'])
+            # 与单组删除一致：该key下没有值了，删除整个key
+            if not attrs[op['key']]:
+                del attrs[op['key']]
+
+    elif name == 'set_category':
+        if group.get('primary_category', '') == op['value']:
+            return False
+        group['primary_category'] = op['value']
+
+    group['modified'] = True
+    return True
+
+
+@app.route('/api/batch', methods=['POST'])
+def batch_mutate():
+    """按选择器批量修改图片组：一次加载、一次保存，返回影响的组
+
+    请求体：{"selector": {...}, "operations": [{"op": "...", ...}, ...], "dry_run": false}
+    """
+    payload = request.get_json(silent=True) or {}
+    selector = payload.get('selector') or {}
+    operations = payload.get('operations') or []
+
+    if not isinstance(selector, dict) or not selector:
+        return jsonify({'error': 'selector is required (use {"all": true} to target every group)'}), 400
+    if not operations:
+        return jsonify({'error': 'operations is required'}), 400
+    for op in operations:
+        required = BATCH_OPERATIONS.get(op.get('op')) if isinstance(op, dict) else None
+        if required is None:
+            return jsonify({'error': f'Unsupported operation: {op}'}), 400
+        missing = [f for f in required if f not in op or (f != 'value' and op[f] in (None, ''))]
+        if missing:
+            return jsonify({'error': f'Operation {op["op"]} requires {", ".join(required)}'}), 400
+
+    data = load_data()
+    matched = select_groups(data, selector)
+
+    changes = []
+    op_counts = {op['op']: 0 for op in operations}
+    for group in matched:
+        before = copy.deepcopy(group)
+        changed = False
+        for op in operations:
+            if apply_batch_operation(group, op):
+                op_counts[op['op']] += 1
+                changed = True
+        if changed:
+            changes.append((before, group))
+
+    batch_id = None
+    if changes and not payload.get('dry_run'):
+        batch_id = new_batch_id()
+        commit_changes(data, changes, 'batch', batch_id=batch_id)
+
+    return jsonify({
+        'success': True,
+        'dry_run': bool(payload.get('dry_run')),
+        'batch_id': batch_id,
+        'matched': len(matched),
+        'changed': len(changes),
+        'operation_counts': op_counts,
+        'affected_ids': [after['id'] for _, after in changes]
+    })
+
+
+# ========== 路由：变更推送 ==========
+CHANGE_STREAM_HEARTBEAT = 15  # 秒
+
+
+def change_stream_enabled():
+    """当前服务器能否常驻SSE连接
+
+    同步单线程worker会被长连接占满，其他请求一直排队到worker超时被杀；gunicorn.conf.py按worker类型设置
+    CHANGE_STREAM，其他服务器（如python app.py）按wsgi.multithread判断
+    """
+    setting = os.environ.get('CHANGE_STREAM')
+    if setting is not None:
+        return setting == '1'
+    return bool(request.environ.get('wsgi.multithread'))
+
+
+@app.route('/api/changes', methods=['GET'])
+def stream_changes():
+    """SSE变更推送：按数据代次推送组级增量和统计增量，支持Last-Event-ID断线续传"""
+    if not change_stream_enabled():
+        return jsonify({'error': 'Change stream requires a threaded or async worker'}), 503
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        last_seq = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_seq = None
+
+    def generate():
+        seq = last_seq
+        known_mtime = change_feed.source_mtime or data_file_mtime()
+        yield 'retry: 3000\n\n'
+        if seq is None:
+            seq = change_feed.latest_seq
+            yield f'id: {seq}\nevent: hello\ndata: {{"seq": {seq}}}\n\n'
+
+        while True:
+            events, reset = change_feed.wait(seq, CHANGE_STREAM_HEARTBEAT)
+            if reset:
+                seq = change_feed.latest_seq
+                yield f'id: {seq}\nevent: reset\ndata: {{"seq": {seq}}}\n\n'
+                continue
+            for event_seq, payload in events:
+                seq = event_seq
+                yield f'id: {event_seq}\nevent: change\ndata: {payload}\n\n'
+            if events:
+                known_mtime = change_feed.source_mtime
+                continue
+
+            # 无事件时检查数据文件是否被其他进程修改，是则通知客户端刷新
+            current_mtime = data_file_mtime()
+            if current_mtime != known_mtime and current_mtime != change_feed.source_mtime:
+                known_mtime = current_mtime
+                yield f'id: {seq}\nevent: reset\ndata: {{"seq": {seq}}}\n\n'
+            else:
+                yield ': keepalive\n\n'
+
+    # 生成器不依赖请求上下文，无需stream_with_context
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # 禁止反向代理缓冲
+    return response
+
+
+# ========== 路由：修改历史 ==========
+@app.route('/api/groups/<int:group_id>/history', methods=['GET'])
+def get_group_history(group_id):
+    """获取组的修改历史（最新在前）"""
+    limit = request.args.get('limit', 50, type=int)
+    records = get_history_store().group_history(group_id)
+    done, undone = undo_state(records)
+    return jsonify({
+        'group_id': group_id,
+        'history': list(reversed(records))[:limit],
+        'can_undo': bool(done),
+        'can_redo': bool(undone)
+    })
+
+
+def replace_group_state(data, group_id, current, new_state):
+    """用新状态替换数据中的组（None表示删除，current为None表示重新插入）"""
+    groups = data['groups']
+    if new_state is None:
+        groups.remove(current)
+    elif current is None:
+        # 按ID顺序插回原位置
+        pos = len(groups)
+        while pos > 0 and groups[pos - 1]['id'] > group_id:
+            pos -= 1
+        groups.insert(pos, new_state)
+    else:
+        groups[groups.index(current)] = new_state
+
+
+def revert_group(group_id, redo=False):
+    """撤销或重做组的最近一次修改"""
+    records = get_history_store().group_history(group_id)
+    done, undone = undo_state(records)
+    if redo and not undone:
+        return jsonify({'error': 'Nothing to redo'}), 409
+    if not redo and not done:
+        return jsonify({'error': 'Nothing to undo'}), 409
+
+    data = load_data()
+    current = find_group(data, group_id)
+    if redo:
+        target, undo_record = undone[-1]
+        new_state = reapply(target, undo_record, current)
+    else:
+        target = done[-1]
+        new_state = invert(target, current)
+
+    if current is None and new_state is None:
+        return jsonify({'error': 'Group not found'}), 404
+    if current is None and target['kind'] == 'update':
+        return jsonify({'error': 'Group no longer exists'}), 409
+
+    replace_group_state(data, group_id, current, new_state)
+    action = 'redo' if redo else 'undo'
+    commit_changes(data, [(current, new_state)], action, reverts=[target['seq']])
+
+    return jsonify({
+        'success': True,
+        'message': f'{"重做" if redo else "撤销"}了操作 {target["action"]}（#{target["seq"]}）',
+        'group': new_state,
+        'deleted': new_state is None
+    })
+
+
+@app.route('/api/groups/<int:group_id>/undo', methods=['POST'])
+def undo_group_change(group_id):
+    """撤销组的最近一次修改"""
+    return revert_group(group_id)
+
+
+@app.route('/api/groups/<int:group_id>/redo', methods=['POST'])
+def redo_group_change(group_id):
+    """重做组最近一次被撤销的修改"""
+    return revert_group(group_id, redo=True)
+
+
+@app.route('/api/history/batches/<batch_id>', methods=['GET'])
+def get_batch_history(batch_id):
+    """获取某次批量操作的全部记录"""
+    records = get_history_store().batch_history(batch_id)
+    if not records:
+        return jsonify({'error': 'Batch not found'}), 404
+    return jsonify({
+        'batch_id': batch_id,
+        'action': records[0]['action'],
+        'user': records[0]['user'],
+        'ts': records[0]['ts'],
+        'group_ids': [r['group_id'] for r in records],
+        'records': records
+    })
+
+
+@app.route('/api/history/batches/<batch_id>/rollback', methods=['POST'])
+def rollback_batch(batch_id):
+    """回滚一次批量操作（如误操作的batch_replace_tag）
+
+    之后又被修改过的组无法安全回滚，会跳过并在conflicts中返回
+    """
+    history_store = get_history_store()
+    records = history_store.batch_history(batch_id)
+    if not records:
+        return jsonify({'error': 'Batch not found'}), 404
+
+    data = load_data()
+    changes, reverts, conflicts = [], [], []
+    for record in reversed(records):
+        done, _ = undo_state(history_store.group_history(record['group_id']))
+        if not done or done[-1]['seq'] != record['seq']:
+            conflicts.append(record['group_id'])
+            continue
+        current = find_group(data, record['group_id'])
+        if current is None and record['kind'] == 'update':
+            conflicts.append(record['group_id'])
+            continue
+        new_state = invert(record, current)
+        replace_group_state(data, record['group_id'], current, new_state)
+        changes.append((current, new_state))
+        reverts.append(record['seq'])
+
+    rollback_id = None
+    if changes:
+        rollback_id = new_batch_id()
+        commit_changes(data, changes, 'undo', batch_id=rollback_id, reverts=reverts)
+
+    return jsonify({
+        'success': True,
+        'message': f'回滚了 {len(changes)} 个组，{len(conflicts)} 个组因后续修改被跳过',
+        'rollback_batch_id': rollback_id,
+        'reverted_ids': [(after or before)['id'] for before, after in changes],
+        'conflicts': conflicts
+    })
+
+
+# ========== 路由：词表补全 ==========
+def suggestion_limit():
+    """解析补全条数参数"""
+    try:
+        return min(max(int(request.args.get('limit', DEFAULT_SUGGESTIONS)), 1), MAX_SUGGESTIONS)
+    except ValueError:
+        return DEFAULT_SUGGESTIONS
+
+
+@app.route('/api/vocab/tags', methods=['GET'])
+def complete_tags():
+    """按前缀（或拼音首字母）补全已有标签，按使用次数排序"""
+    prefix = request.args.get('prefix', '').strip()
+    vocab = load_index().components['vocab']
+    return jsonify({'prefix': prefix, 'items': vocab.complete_tags(prefix, suggestion_limit())})
+
+
+@app.route('/api/vocab/attributes/<category>/<key>', methods=['GET'])
+def complete_attribute_values(category, key):
+    """按前缀（或拼音首字母）补全某个属性的已有取值，按使用次数排序"""
+    prefix = request.args.get('prefix', '').strip()
+    vocab = load_index().components['vocab']
+    items = vocab.complete_attribute(category, key, prefix, suggestion_limit())
+    if items is None:
+        return jsonify({'error': 'Attribute not found'}), 404
+    return jsonify({'prefix': prefix, 'items': items})
+
+
+# ========== 路由：标签分析 ==========
+@app.route('/api/analysis/tags', methods=['GET'])
+def analyze_tags():
+    """标签共现分析：PMI最高的标签对、疑似同义标签的合并建议、与属性取值重复的标签
+
+    合并建议和属性重复项都带有batch字段，可直接作为 /api/batch 的请求体提交
+    """
+    try:
+        min_count = max(int(request.args.get('min_count', DEFAULT_MIN_COUNT)), 1)
+        limit = max(int(request.args.get('limit', DEFAULT_REPORT_LIMIT)), 1)
+    except ValueError:
+        return jsonify({'error': 'min_count and limit must be integers'}), 400
+
+    cooccurrence = load_index().components['tag_cooccurrence']
+    return jsonify({
+        'total_groups': cooccurrence.total_groups,
+        'total_tags': len(cooccurrence.tag_counts),
+        'pmi_pairs': cooccurrence.pmi_pairs(min_count, limit),
+        'merge_candidates': cooccurrence.merge_candidates(min_count, limit),
+        'attribute_duplicates': cooccurrence.attribute_duplicates(limit=limit)
+    })
+
+
+# ========== 路由：多版本对比 ==========
+def group_runs(data, group):
+    """组的全部运行结果（旧数据没有版本列表时以当前内容作为唯一版本）"""
+    if 'versions' not in group:
+        return [run_from_group(group)]
+    return [expand_run(data, version) for version in group['versions']]
+
+
+@app.route('/api/groups/<int:group_id>/versions', methods=['GET'])
+def get_group_versions(group_id):
+    """列出组的各次模型运行结果"""
+    data = load_group_data(group_id)
+    group = find_group(data, group_id)
+    if group is None:
+        return jsonify({'error': 'Group not found'}), 404
+
+    active = group.get('active_version', 0)
+    return jsonify({
+        'group_id': group_id,
+        'uid': (group.get('task') or {}).get('uid'),
+        'active_version': active,
+        'versions': [dict(run, index=i, active=i == active) for i, run in enumerate(group_runs(data, group))]
+    })
+
+
+@app.route('/api/groups/<int:group_id>/versions/diff', methods=['GET'])
+def diff_group_versions(group_id):
+    """逐字段对比两个版本；a/b为版本序号，b=current表示组当前（含人工修改）的内容"""
+    data = load_group_data(group_id)
+    group = find_group(data, group_id)
+    if group is None:
+        return jsonify({'error': 'Group not found'}), 404
+
+    runs = group_runs(data, group)
+    selected = []
+    for param, default in (('a', '0'), ('b', 'current')):
+        value = request.args.get(param, default)
+        if value == 'current':
+            selected.append(run_from_group(group))
+            continue
+        try:
+            selected.append(runs[int(value)])
+        except (ValueError, IndexError):
+            return jsonify({'error': f'Invalid version {param}={value}'}), 400
+
+    return jsonify({
+        'group_id': group_id,
+        'a': request.args.get('a', '0'),
+        'b': request.args.get('b', 'current'),
+        **diff_runs(*selected)
+    })
+
+
+@app.route('/api/groups/<int:group_id>/versions/<int:version>/activate', methods=['POST'])
+def activate_group_version(group_id, version):
+    """将组的当前内容切换为指定版本（覆盖人工修改，可通过撤销恢复）"""
+    data = load_data()
+    group = find_group(data, group_id)
+    if group is None:
+        return jsonify({'error': 'Group not found'}), 404
+
+    before = copy.deepcopy(group)
+    ensure_versions(data, group)
+    if not 0 <= version < len(group['versions']):
+        return jsonify({'error': 'Version not found'}), 404
+
+    activate_run(group, expand_run(data, group['versions'][version]), version)
+    commit_changes(data, [(before, group)], 'activate_version')
+    return jsonify({'success': True, 'group': with_thumbnails(group)})
+
+
+# ========== 路由：近似重复 ==========
+def similarity_args():
+    """解析相似度阈值与条数参数，返回(threshold, limit)，非法时抛出ValueError"""
+    threshold = float(request.args.get('threshold', DEFAULT_SIMILARITY))
+    limit = int(request.args.get('limit', DEFAULT_REPORT_LIMIT))
+    if not 0 < threshold <= 1 or limit < 1:
+        raise ValueError('out of range')
+    return threshold, limit
+
+
+def similarity_summary(group, similarity=None):
+    """近似重复结果中的组摘要"""
+    summary = {
+        'id': group['id'],
+        'uid': (group.get('task') or {}).get('uid'),
+        'model': group.get('model', ''),
+        'primary_category': group.get('primary_category', ''),
+        'tags': group.get('tags', [])
+    }
+    if similarity is not None:
+        summary['similarity'] = similarity
+    return summary
+
+
+def groups_by_id(group_ids):
+    """按ID取少数组，返回 {组ID: 组}：优先从列式快照还原，快照不可用时只加载这些组所在的分片"""
+    if not group_ids:
+        return {}
+    snapshot = load_snapshot()
+    if snapshot is not None:
+        found = {gid: snapshot.find(gid) for gid in group_ids}
+    else:
+        data = load_groups_data(group_ids)
+        found = {gid: find_group(data, gid) for gid in group_ids}
+    return {gid: group for gid, group in found.items() if group is not None}
+
+
+@app.route('/api/groups/<int:group_id>/similar', methods=['GET'])
+def get_similar_groups(group_id):
+    """查找与指定组近似重复的组（MinHash估计的Jaccard相似度）"""
+    try:
+        threshold, limit = similarity_args()
+    except ValueError:
+        return jsonify({'error': 'threshold must be in (0, 1] and limit a positive integer'}), 400
+
+    # LSH查找只需索引（按数据文件mtime校验复用），结果中的组单独读取
+    index = load_index()
+    if group_id not in index.positions:
+        return jsonify({'error': 'Group not found'}), 404
+    similar = index.components['similarity'].similar(group_id, threshold, limit) or []
+    groups = groups_by_id([gid for gid, _ in similar])
+    return jsonify({
+        'group_id': group_id,
+        'threshold': threshold,
+        'similar': [similarity_summary(groups[gid], score) for gid, score in similar if gid in groups]
+    })
+
+
+@app.route('/api/analysis/near-duplicates', methods=['GET'])
+def near_duplicate_report():
+    """近似重复簇报告：同一主播多次运行或内容几乎相同的组"""
+    try:
+        threshold, limit = similarity_args()
+    except ValueError:
+        return jsonify({'error': 'threshold must be in (0, 1] and limit a positive integer'}), 400
+
+    clusters = load_index().components['similarity'].clusters(threshold)
+    groups = groups_by_id([gid for ids, _ in clusters[:limit] for gid in ids])
+    report = []
+    for ids, best in clusters[:limit]:
+        members = [similarity_summary(groups[gid]) for gid in ids if gid in groups]
+        uids = {m['uid'] for m in members if m['uid']}
+        report.append({
+            'size': len(ids),
+            'max_similarity': best,
+            'same_uid': len(uids) == 1 and all(m['uid'] for m in members),
+            'groups': members
+        })
+    return jsonify({
+        'threshold': threshold,
+        'total_clusters': len(clusters),
+        'grouped_ids': sum(len(ids) for ids, _ in clusters),
+        'clusters': report
+    })
+
+
+# ========== 路由：审核队列 ==========
+# 图片已失效的组在审核队列中的处理：last排在最后（默认），exclude不分发，include不区分
+DEAD_IMAGE_POLICIES = ('last', 'exclude', 'include')
+
+
+@app.route('/api/queue/next', methods=['POST'])
+def queue_next():
+    """为审核人租用接下来的N个未审核组
+
+    可按category、low_confidence（最高置信度低于该值）、disagreement（人工标注与主类别不一致）筛选，
+    租约到期未完成的组自动回到队列
+    """
+    payload = request.json or {}
+    reviewer = payload.get('reviewer') or current_user()
+    dead_images = payload.get('dead_images') or 'last'
+    if dead_images not in DEAD_IMAGE_POLICIES:
+        return jsonify({'error': f'dead_images must be one of {", ".join(DEAD_IMAGE_POLICIES)}'}), 400
+    try:
+        n = min(max(int(payload.get('n', 10)), 1), MAX_LEASE_BATCH)
+        lease_seconds = max(int(payload.get('lease_seconds', DEFAULT_LEASE_SECONDS)), 1)
+        low_confidence = payload.get('low_confidence')
+        low_confidence = float(low_confidence) if low_confidence not in (None, '') else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid n, lease_seconds or low_confidence'}), 400
+
+    # 队列堆在索引中，按数据文件mtime校验即可复用，只加载租出的组
+    index = load_index()
+    queue = index.components['review_queue']
+    filters = {'category': payload.get('category'), 'max_confidence': low_confidence,
+               'disagreement': bool(payload.get('disagreement'))}
+    dead = index.components['liveness'].dead() if dead_images != 'include' else set()
+    with review_leases.transaction() as table:
+        leased = set(table.active())
+        gids = queue.take(n, leased | dead, **filters)
+        if dead_images == 'last' and len(gids) < n:
+            # 图片可用的组不足时，再分发图片已失效的组
+            gids += queue.take(n - len(gids), leased | set(gids), **filters)
+        expires = table.acquire(gids, reviewer, lease_seconds)
+
+    data = load_groups_data(gids) if gids else None
+    groups = [find_group(data, gid) for gid in gids]
+    return jsonify({
+        'success': True,
+        'reviewer': reviewer,
+        'lease_expires': datetime.fromtimestamp(expires).strftime('%Y-%m-%d %H:%M:%S'),
+        'lease_expires_at': expires,
+        'groups': [with_thumbnails(group) for group in groups if group is not None],  # 期间被其他进程删除的组略过
+        'remaining': queue.pending_count(leased | set(gids))
+    })
+
+
+@app.route('/api/queue/complete', methods=['POST'])
+def queue_complete():
+    """标记组已审核并释放租约；由其他审核人持有租约的组会跳过"""
+    payload = request.json or {}
+    reviewer = payload.get('reviewer') or current_user()
+    group_ids = payload.get('ids') or []
+    if not isinstance(group_ids, list) or not group_ids:
+        return jsonify({'error': 'ids is required'}), 400
+
+    index = load_index()
+    known = [gid for gid in group_ids if isinstance(gid, int) and not isinstance(gid, bool) and gid in index.positions]
+    data = load_groups_data(known) if known else None
+    changes, conflicts, missing = [], [], []
+    with review_leases.transaction() as table:
+        active = table.active()
+        for gid in group_ids:
+            holder = active.get(gid, (None,))[0]
+            if holder not in (None, reviewer):
+                conflicts.append(gid)
+                continue
+            group = find_group(data, gid) if gid in known else None
+            if group is None:
+                missing.append(gid)
+                continue
+            if group.get('reviewed'):
+                continue
+            before = copy.deepcopy(group)
+            group['reviewed'] = True
+            changes.append((before, group))
+        table.release([gid for gid in group_ids if gid not in conflicts], reviewer)
+
+    if changes:
+        commit_changes(data, changes, 'review_complete', batch_id=new_batch_id(), user=reviewer)
+
+    return jsonify({
+        'success': True,
+        'completed_ids': [after['id'] for _, after in changes],
+        'conflicts': conflicts,
+        'missing': missing
+    })
+
+
+@app.route('/api/queue/release', methods=['POST'])
+def queue_release():
+    """放弃租约，组立即回到队列（未指定ids时释放该审核人的全部租约）"""
+    payload = request.json or {}
+    reviewer = payload.get('reviewer') or current_user()
+    with review_leases.transaction() as table:
+        group_ids = payload.get('ids') or [gid for gid, (holder, _) in table.active().items() if holder == reviewer]
+        released = table.release(group_ids, reviewer)
+    return jsonify({'success': True, 'released_ids': released})
+
+
+@app.route('/api/queue/stats', methods=['GET'])
+def queue_stats():
+    """审核队列概况（pending不含租约中的组）"""
+    queue = load_index().components['review_queue']
+    active = review_leases.active()
+    by_reviewer = {}
+    for holder, _ in active.values():
+        by_reviewer[holder] = by_reviewer.get(holder, 0) + 1
+    return jsonify({
+        'pending': queue.pending_count(active),
+        'leased': len(active),
+        'by_reviewer': by_reviewer
+    })
+
+
+# ========== 路由：图片可用性 ==========
+@app.route('/api/liveness/check', methods=['POST'])
+def start_liveness_check():
+    """提交远程图片可用性检查（后台执行）
+
+    请求体：{"selector": {...}（默认全部组）, "force": false（重新检查未过期的结果）}
+    """
+    payload = request.get_json(silent=True) or {}
+    selector = payload.get('selector') or {'all': True}
+    if not isinstance(selector, dict):
+        return jsonify({'error': 'selector must be an object'}), 400
+
+    index = load_index()
+    urls = index.components['liveness'].all_urls(index.select(selector))
+    queued = liveness.checker.submit(urls, force=bool(payload.get('force')))
+    return jsonify({'success': True, 'urls': len(urls), 'queued': queued,
+                    'checker': liveness.checker.status()}), 202
+
+
+@app.route('/api/liveness', methods=['GET'])
+def get_liveness_summary():
+    """检查进度、各状态的图片数与组数"""
+    statuses = load_index().components['liveness'].statuses()
+    group_counts = {status: 0 for status in liveness.GROUP_STATUSES}
+    for status in statuses.values():
+        group_counts[status] += 1
+    return jsonify({
+        'checker': liveness.checker.status(),
+        'images': liveness.store.counts(),
+        'groups': group_counts
+    })
+
+
+@app.route('/api/groups/<int:group_id>/liveness', methods=['GET'])
+def get_group_liveness(group_id):
+    """单个组各远程图片的最近一次检查结果"""
+    index = load_index()
+    component = index.components['liveness']
+    if group_id not in index.positions:
+        return jsonify({'error': 'Group not found'}), 404
+    return jsonify({
+        'group_id': group_id,
+        'status': component.status(group_id),
+        'images': [{'url': url, 'result': liveness.store.get(url)} for url in component.urls.get(group_id, ())]
+    })
+
+
+# ========== 路由：重新标注 ==========
+def store_relabel_runs(runs, batch_id):
+    """将重新标注的结果追加为组的新版本（后台任务按批调用，当前内容不变），返回保存的组数"""
+    with mutation_lock:
+        data = load_data()
+        changes = []
+        for group_id, run in runs:
+            group = find_group(data, group_id)
+            if group is None:
+                continue  # 标注期间组已被删除
+            # 追加版本只会新增versions/active_version键并向versions列表追加，复制顶层与该列表即可得到修改前的快照
+            before = dict(group, versions=list(group['versions'])) if 'versions' in group else dict(group)
+            if merge_run(data, group, run, 'append'):
+                changes.append((before, group))
+        if changes:
+            commit_changes(data, changes, 'relabel', batch_id=batch_id, user='relabel')
+    return len(changes)
+
+
+@app.route('/api/relabel/jobs', methods=['POST'])
+def start_relabel_job():
+    """提交重新标注任务（后台执行），结果作为新版本追加到各组，可在版本列表中对比与切换
+
+    请求体：{"selector": {...}（ids/tag/category等，只给max_confidence时为全部组）, "max_confidence": 0.6,
+    "prompt": 提示词, "model": 模型, "token_budget": token上限, "concurrency": 并发数}
+    """
+    payload = request.get_json(silent=True) or {}
+    selector = payload.get('selector') or {}
+    if not isinstance(selector, dict):
+        return jsonify({'error': 'selector must be an object'}), 400
+    try:
+        max_confidence = payload.get('max_confidence')
+        max_confidence = None if max_confidence is None else float(max_confidence)
+        token_budget = payload.get('token_budget')
+        token_budget = None if token_budget is None else int(token_budget)
+        concurrency = int(payload.get('concurrency', relabel.RELABEL_CONCURRENCY))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'max_confidence, token_budget and concurrency must be numbers'}), 400
+    if not 1 <= concurrency <= relabel.MAX_CONCURRENCY:
+        return jsonify({'error': f'concurrency must be between 1 and {relabel.MAX_CONCURRENCY}'}), 400
+    prompt = payload.get('prompt') or relabel.DEFAULT_PROMPT
+    model = payload.get('model') or relabel.RELABEL_MODEL
+    if not isinstance(prompt, str) or not isinstance(model, str):
+        return jsonify({'error': 'prompt and model must be strings'}), 400
+    if max_confidence is not None and not selector:
+        selector = {'all': True}
+    if not selector:
+        return jsonify({'error': 'selector or max_confidence is required'}), 400
+
+    items, skipped = relabel.select_items(select_groups(load_data(), selector), max_confidence)
+    if not items:
+        return jsonify({'error': 'No groups with remote images selected', 'skipped': skipped}), 400
+
+    batch_id = new_batch_id()
+    job = relabel.jobs.start(items, functools.partial(store_relabel_runs, batch_id=batch_id), prompt=prompt,
+                             model=model, token_budget=token_budget, concurrency=concurrency)
+    if job is None:
+        return jsonify({'error': 'Another relabel job is running'}), 409
+    return jsonify({'success': True, 'job_id': job.job_id, 'batch_id': batch_id, 'groups': len(items),
+                    'skipped': skipped, 'status_url': f'/api/relabel/jobs/{job.job_id}'}), 202
+
+
+@app.route('/api/relabel/jobs/<job_id>', methods=['GET'])
+def get_relabel_job(job_id):
+    """任务进度：完成/成功/缓存命中/失败数、已保存的版本数与token用量"""
+    status = relabel.jobs.status(job_id) if relabel.jobs.is_job_id(job_id) else None
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(status)
+
+
+@app.route('/api/relabel/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_relabel_job(job_id):
+    """取消运行中的任务：不再派发新的请求，已完成的结果照常保存"""
+    if not relabel.jobs.is_job_id(job_id) or not relabel.jobs.cancel(job_id):
+        return jsonify({'error': 'Job not running in this worker'}), 404
+    return jsonify({'success': True})
+
+
+# ========== 路由：运行指标 ==========
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus文本格式的运行指标（汇总所有worker进程）"""
+    return Response(metrics.render(metrics.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# ========== 路由：请求剖析 ==========
+@app.route('/api/debug/profiles', methods=['GET'])
+def list_request_profiles():
+    """已保存的请求剖析列表（最新的在前）"""
+    profiles = profiler.list_profiles()
+    for info in profiles:
+        info['url'] = f"/api/debug/profiles/{info['id']}"
+    return jsonify({
+        'profiles': profiles,
+        'slow_threshold_seconds': profiler.SLOW_REQUEST_SECONDS,
+        'max_profiles': profiler.MAX_PROFILES
+    })
+
+
+@app.route('/api/debug/profiles/<profile_id>', methods=['GET'])
+def get_request_profile(profile_id):
+    """下载剖析文件；format=text 时返回可读文本（pstats可用sort/limit参数）"""
+    info = profiler.load_profile_info(profile_id) if profiler.is_profile_id(profile_id) else None
+    if info is None:
+        return jsonify({'error': 'Profile not found'}), 404
+
+    if request.args.get('format') == 'text':
+        sort = request.args.get('sort', 'cumulative')
+        if sort not in ('cumulative', 'tottime', 'calls'):
+            return jsonify({'error': 'sort must be one of cumulative, tottime, calls'}), 400
+        try:
+            limit = max(1, min(int(request.args.get('limit', 50)), 500))
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        return Response(profiler.render_text(info, limit, sort), content_type='text/plain; charset=utf-8')
+
+    return send_file(os.path.abspath(profiler.profile_path(profile_id, info['kind'])), as_attachment=True,
+                     download_name=f"{profile_id}.{info['format']}")
+
+
 # ========== 主程序入口 ==========
 def create_app():
     """应用工厂函数，用于生产环境部署"""
@@ -1225,6 +2280,12 @@ def create_app():
     init_sample_data()
     scan_and_add_images()
 
+    # 快照缺失或过期时重建一次，之后的重启直接映射快照
+    if load_snapshot() is None:
+        mtime = data_file_mtime()
+        write_snapshot(load_data(), SNAPSHOT_FILE, mtime)
+        print("[OK] Snapshot rebuilt")
+
     print("[OK] Data initialization completed")
     return app
 
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""
+基准与压测套件
+
+- datagen: 生成与lotsof.jsonl结构一致的合成数据（1k/10k/100k/1m）
+- micro:   存储加载/保存、导入、导出、统计、检索的微基准
+- load:    模拟审核员操作组合的并发HTTP压测
+- compare: 对比两次运行的JSON结果
+
+各模块均可通过 python -m benchmarks.<模块> --help 查看参数，结果以JSON输出便于对比
+"""
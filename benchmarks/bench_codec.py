@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+JSON编解码基准
+用法：python -m benchmarks.bench_codec [--groups 100000]
+对比原有格式（标准库 indent=2）与各可用后端紧凑格式的保存/加载耗时和文件大小
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+from benchmarks.datagen import make_dataset  # noqa: E402
+
+
+def legacy_dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def bench(label, dumps, loads, data, path):
+    start = time.perf_counter()
+    with open(path, 'wb') as f:
+        f.write(dumps(data))
+    save_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        loads(f.read())
+    load_time = time.perf_counter() - start
+
+    size = os.path.getsize(path)
+    print(f'{label:<18} save {save_time:>7.3f}s  load {load_time:>7.3f}s  size {size / 1024 / 1024:>8.1f} MB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON编解码基准')
+    parser.add_argument('--groups', type=int, default=100000)
+    args = parser.parse_args()
+
+    data = make_dataset(args.groups)
+    print(f'{args.groups} groups, default codec: {codec.codec_name()}')
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'annotations.json')
+        bench('stdlib indent=2', legacy_dumps, json.loads, data, path)
+        for backend in codec.available_codecs():
+            bench(f'{backend.name} compact', backend.dumps, backend.loads, data, path)
+
+
+if __name__ == '__main__':
+    main()
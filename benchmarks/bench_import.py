@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+导入流水线吞吐基准
+用法：python -m benchmarks.bench_import [--records 50000] [--bad-ratio 0.01]
+分别测量JSONL解析、模式校验与完整导入（解析+校验+建组，不含保存）的每秒记录数
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.datagen import make_record  # noqa: E402
+from importer import parse_jsonl, run_import, validate_record  # noqa: E402
+
+
+def make_jsonl(count, bad_ratio, seed=0):
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        roll = rng.random()
+        if roll < bad_ratio / 2:
+            lines.append('{"task": {"uid": "broken"')  # 截断的JSON
+        elif roll < bad_ratio:
+            record = make_record(i, rng)
+            record['output']['tags'] = 'not-a-list'  # 模式错误
+            lines.append(json.dumps(record, ensure_ascii=False))
+        else:
+            lines.append(json.dumps(make_record(i, rng), ensure_ascii=False))
+    return '\n'.join(lines)
+
+
+def measure(label, count, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<12} {count / elapsed:>12,.0f} records/s  ({elapsed:.3f}s)')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='导入流水线吞吐基准')
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--bad-ratio', type=float, default=0.01)
+    args = parser.parse_args()
+
+    text = make_jsonl(args.records, args.bad_ratio)
+    print(f'{args.records} records, {len(text) / 1024 / 1024:.1f} MB, bad ratio {args.bad_ratio}')
+
+    entries = measure('parse', args.records, lambda: parse_jsonl(text))
+    records = [record for _, record, error in entries if error is None]
+    measure('validate', len(records), lambda: [validate_record(r) for r in records])
+
+    def full_import():
+        data = {'groups': []}
+        return run_import(data, parse_jsonl(text), lambda uid: None, 'skip', continue_on_error=True)
+
+    result = measure('import', args.records, full_import)
+    print('summary:', result.summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+列式快照基准
+用法：python -m benchmarks.bench_snapshot [--groups 100000]
+对比解析整份JSON与映射快照后读取首页/按ID查找的耗时，以及快照写入耗时和文件大小
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+from benchmarks.datagen import make_dataset  # noqa: E402
+from snapshot import open_snapshot, write_snapshot  # noqa: E402
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f'{label:<28} {time.perf_counter() - start:>8.4f}s')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='列式快照基准')
+    parser.add_argument('--groups', type=int, default=100000)
+    args = parser.parse_args()
+
+    data = make_dataset(args.groups)
+    middle_id = data['groups'][args.groups // 2]['id']
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, 'annotations.json')
+        snap_path = os.path.join(tmp, 'annotations.snap')
+        with open(json_path, 'wb') as f:
+            f.write(codec.dumps(data))
+        timed('write snapshot', lambda: write_snapshot(data, snap_path, 1))
+        print(f'json {os.path.getsize(json_path) / 1024 / 1024:.1f} MB, '
+              f'snapshot {os.path.getsize(snap_path) / 1024 / 1024:.1f} MB')
+
+        def json_first_page():
+            with open(json_path, 'rb') as f:
+                return codec.loads(f.read())['groups'][:10]
+
+        def snapshot_first_page():
+            return open_snapshot(snap_path).records(0, 10)
+
+        timed(f'json load + page ({codec.codec_name()})', json_first_page)
+        timed('snapshot open + page', snapshot_first_page)
+        snapshot = open_snapshot(snap_path)
+        timed('snapshot find by id', lambda: snapshot.find(middle_id))
+        timed('snapshot filenames vocab', lambda: snapshot.vocab('filenames'))
+        snapshot.close()
+
+
+if __name__ == '__main__':
+    main()
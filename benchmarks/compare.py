@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+对比两次基准结果
+用法：python -m benchmarks.compare base.json new.json [--threshold 10]
+按结果名称对齐，输出吞吐与p50/p99的变化百分比；p99变差超过阈值时以非零状态退出，便于在CI中把关
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+
+METRICS = ('throughput_per_s', 'p50_ms', 'p99_ms', 'peak_rss_mb')
+
+
+def load_results(path):
+    with open(path, 'rb') as f:
+        report = codec.loads(f.read())
+    return report, {result['name']: result for result in report['results']}
+
+
+def change(old, new):
+    if not old or new is None:
+        return None
+    return (new - old) / old * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比两次基准结果')
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=10, help='p99变差超过该百分比时返回非零状态')
+    args = parser.parse_args()
+
+    base_report, base = load_results(args.base)
+    new_report, new = load_results(args.new)
+    print(f"base {base_report.get('git_commit')} ({base_report['created_at']})  ->  "
+          f"new {new_report.get('git_commit')} ({new_report['created_at']})")
+    print(f"{'name':<24}" + ''.join(f'{metric:>20}' for metric in METRICS))
+
+    regressions = []
+    for name in [n for n in base if n in new]:
+        cells = []
+        for metric in METRICS:
+            delta = change(base[name].get(metric), new[name].get(metric))
+            cells.append(f'{"n/a":>20}' if delta is None else f'{delta:>+19.1f}%')
+        print(f'{name:<24}' + ''.join(cells))
+        delta = change(base[name].get('p99_ms'), new[name].get('p99_ms'))
+        if delta is not None and delta > args.threshold:
+            regressions.append(name)
+
+    for name in sorted(set(base) ^ set(new)):
+        print(f'{name:<24} only in {"base" if name in base else "new"}')
+    if regressions:
+        print(f'[WARN] p99 regressed more than {args.threshold}%: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+合成数据生成
+用法：python -m benchmarks.datagen --scale 100k --jsonl out.jsonl
+      python -m benchmarks.datagen --scale 10k --data data/annotations.json
+记录结构与lotsof.jsonl一致（task/output，通用/专属特征属性），标签服从长尾分布；同一seed结果完全相同
+"""
+
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+from importer import build_group  # noqa: E402
+
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000}
+
+# 主类别及占比（参照样例数据）
+CATEGORIES = [('聊天陪伴类', 0.55), ('才艺类', 0.25), ('美妆穿搭类', 0.12), ('美食类', 0.05), ('户外探索类', 0.03)]
+
+COMMON_ATTRIBUTES = {
+    '光线条件': ['明亮', '昏暗', '正常', '高对比'],
+    '画面稳定度': ['手持摇晃', '稳定'],
+    '拍摄角度': ['右侧面', '正面', '左侧面'],
+    '拍摄高度': ['中位', '俯拍', '仰拍'],
+    '色彩风格': ['暖色调', '自然', '高饱和'],
+    '基础场景': ['专业直播间', '卧室', '厨房', '客厅', '室内', '户外城市', '无法判断'],
+    '主播姿势': ['坐', '站立'],
+    '环境整洁度': ['凌乱', '整洁', '无'],
+    '环境美观度': ['不美观', '无', '美观'],
+    '环境档次': ['中档', '低档', '无', '高档'],
+    '环境明暗氛围': ['无', '明亮', '昏暗', '暖色调', '霓虹'],
+    '是否有背景墙': ['无', '有'],
+    '背景墙风格': ['其他主题', '无特殊背景', '粉色少女风', '纯色背景', '霓虹灯'],
+    '封面图风格': ['AI图', '海报', '照片'],
+    '封面图着装': ['不暴露', '暴露'],
+    '封面图画面吸引力': ['中', '高', '低'],
+    '直播图着装': ['不暴露', '暴露'],
+    '直播图画面吸引力': ['中', '高', '低']
+}
+
+SPECIFIC_ATTRIBUTES = {
+    '聊天陪伴类': {'性别': ['女', '男'], '年龄段': ['成年', '青年'], '表情': ['可爱', '微笑', '性感', '惊讶'],
+              '发型': ['卷发', '短发', '辫子', '长发'], '妆容': ['性感妆', '日常妆', '素颜'],
+              '着装风格': ['性感', '日常', '潮流', '甜美'], '身材': ['丰满', '标准']},
+    '才艺类': {'性别': ['女', '男'], '才艺类别': ['唱歌', '跳舞', '乐器'], '麦克风类型': ['专业麦克风', '耳麦'],
+            '乐器种类': ['贝斯', '吉他', '钢琴', '萨克斯']},
+    '美妆穿搭类': {'类型': ['妆容', '穿搭'], '风格': ['日常', '潮流'], '表现形式': ['前后改造', '教程'],
+              '妆容步骤': ['唇妆', '底妆', '眉眼'], '展示方式': ['上身试穿', '全身镜', '半身镜']},
+    '美食类': {'料理类别': ['家常', '烘焙', '烧烤'], '制作过程': ['备料', '下锅', '装盘'], '镜头侧重': ['步骤近景', '成品特写']},
+    '户外探索类': {'场景': ['城市街道', '山野', '海边'], '出行方式': ['步行', '骑行', '自驾']}
+}
+
+COMMON_TAGS = ['滤镜', '美颜', '美女', '镜头直视', '日常妆', '帅哥', '专业麦克风', '直播互动', '日常聊天', '唱歌',
+               '霓虹灯', '才艺表演', '音乐直播', '现场演唱', '脸部特效', '可爱妆', '日常穿搭', '聊天陪伴', '素颜',
+               '猫耳滤镜', '直播陪伴', '美颜滤镜', '粉色少女风', '长发', '穿搭分享', 'ootd', '韩系妆容', '变装特效']
+LONG_TAIL_TAGS = 5000  # 长尾标签数量，按Zipf分布抽取
+
+DESCRIPTION = '画面为一位年轻主播的近景特写，正对镜头，背景是布置整洁的直播间，灯光柔和。'
+REASONING = '画面主体为主播近距离直视镜头，无明显才艺或商品展示，符合聊天陪伴类特征。'
+
+
+def _zipf_tag(rng):
+    rank = int(LONG_TAIL_TAGS ** rng.random())  # 对数均匀近似Zipf：小序号出现得多
+    return f'长尾标签{rank}'
+
+
+def make_record(i, rng):
+    """第i条合成记录（task/output格式）"""
+    category = rng.choices([c for c, _ in CATEGORIES], [w for _, w in CATEGORIES])[0]
+    common = {key: [rng.choice(values)] for key, values in COMMON_ATTRIBUTES.items() if rng.random() < 0.9}
+    specific = {key: [rng.choice(values)] for key, values in SPECIFIC_ATTRIBUTES[category].items()}
+    tags = rng.sample(COMMON_TAGS, rng.randint(3, 5))
+    tags += [tag for tag in {_zipf_tag(rng) for _ in range(rng.randint(0, 3))} if tag not in tags]
+    specific['常见Tag'] = tags[:3]
+    return {
+        'task': {
+            'uid': str(1000000 + i),
+            'human_label': category if rng.random() < 0.85 else rng.choice(CATEGORIES)[0],
+            'cover_url': f'https://example.com/cover/{i}.png',
+            'live_url': f'https://example.com/live/{i}.jpg'
+        },
+        'provider': 'qwen',
+        'model': 'qwen3-vl-plus',
+        'timestamp': '2025-12-19 11:11:08',
+        'elapsed_seconds': round(rng.uniform(10, 40), 3),
+        'usage': {'input_tokens': 0, 'output_tokens': 0, 'total_tokens': 0, 'image_tokens': 2},
+        'output': {
+            'primary_category': category,
+            'confidence': [f'{category}@{rng.choice([0.5, 0.6, 0.7, 0.85, 0.95])}'],
+            'attributes': {'通用特征': common, '专属特征': specific},
+            'tags': tags,
+            'video_description': DESCRIPTION * rng.randint(1, 3),
+            'reasoning': REASONING,
+            'push_title': '在线陪你聊',
+            '封面图包含文字': '',
+            '直播图包含文字': ''
+        }
+    }
+
+
+def make_records(count, seed=0):
+    rng = random.Random(seed)
+    return [make_record(i, rng) for i in range(count)]
+
+
+def make_dataset(count, seed=0):
+    """与data/annotations.json结构一致的数据"""
+    groups = [build_group(record, i + 1, 2 * i + 1) for i, record in enumerate(make_records(count, seed))]
+    return {'groups': groups, 'generation': 1}
+
+
+def parse_scale(value):
+    """1k/10k/100k/1m 或直接给出数量"""
+    return SCALES[value.lower()] if value.lower() in SCALES else int(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='合成数据生成')
+    parser.add_argument('--scale', default='10k', help='1k/10k/100k/1m 或组数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--jsonl', help='输出导入用的JSON Lines文件')
+    parser.add_argument('--data', help='输出数据文件（annotations.json格式）')
+    args = parser.parse_args()
+    if not args.jsonl and not args.data:
+        parser.error('need --jsonl and/or --data')
+
+    count = parse_scale(args.scale)
+    if args.jsonl:
+        with open(args.jsonl, 'wb') as f:
+            for record in make_records(count, args.seed):
+                f.write(codec.dumps(record) + b'\n')
+        print(f'{count} records -> {args.jsonl}')
+    if args.data:
+        with open(args.data, 'wb') as f:
+            f.write(codec.dumps(make_dataset(count, args.seed)))
+        print(f'{count} groups -> {args.data}')
+
+
+if __name__ == '__main__':
+    main()
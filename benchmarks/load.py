@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+并发HTTP压测：按审核员的典型操作组合（翻页、查看、增删标签、批量替换）回放请求
+用法：python -m benchmarks.load --scale 10k --concurrency 8 --duration 30 --output load.json
+      python -m benchmarks.load --url http://127.0.0.1:5000 ...   # 压测已启动的服务（会修改其数据）
+      python -m benchmarks.load --slow-clients 2 --server single   # 慢速下载导出时的审核员延迟（单线程对比多线程）
+未指定--url时在临时目录生成数据并在本进程内启动服务（--server single模拟gunicorn sync工作类）
+"""
+
+import argparse
+import collections
+import os
+import random
+import sys
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.datagen import make_dataset, parse_scale  # noqa: E402
+from benchmarks.report import new_report, print_result, summarize, workspace, write_data_file, write_report  # noqa: E402
+
+# 操作 -> 权重（参照审核员实际使用：以浏览为主，少量写入）
+OPERATION_MIX = {
+    'page': 45,
+    'view': 25,
+    'add_tag': 12,
+    'delete_tag': 12,
+    'batch_replace': 6
+}
+PER_PAGE = 20
+REQUEST_TIMEOUT = 60
+
+# 慢客户端：反复下载JSONL导出，每读取一块后暂停，模拟慢速网络下的大文件下载
+SLOW_CLIENT_CHUNK = 64 * 1024
+SLOW_CLIENT_DELAY = 0.05
+
+
+class Reviewer:
+    """单个压测线程：随机选择操作并记录每次请求的耗时与结果"""
+
+    def __init__(self, base_url, total_groups, seed):
+        self.base_url = base_url
+        self.total_groups = total_groups
+        self.rng = random.Random(seed)
+        self.session = requests.Session()
+        self.added = []  # 本线程添加过的 (组ID, 标签)，删除标签时优先删除它们
+
+    def run_once(self):
+        name = self.rng.choices(list(OPERATION_MIX), list(OPERATION_MIX.values()))[0]
+        method, path, body = getattr(self, f'op_{name}')()
+        start = time.perf_counter()
+        try:
+            resp = self.session.request(method, self.base_url + path, json=body, timeout=REQUEST_TIMEOUT)
+            ok = resp.status_code < 500
+            resp.content  # noqa: B018 读取完整响应体
+        except requests.RequestException:
+            ok = False
+        return name, time.perf_counter() - start, ok
+
+    def _group_id(self):
+        return self.rng.randint(1, self.total_groups)
+
+    def op_page(self):
+        page = self.rng.randint(1, max(self.total_groups // PER_PAGE, 1))
+        return 'GET', f'/api/groups?page={page}&per_page={PER_PAGE}', None
+
+    def op_view(self):
+        return 'GET', f'/api/groups/{self._group_id()}', None
+
+    def op_add_tag(self):
+        gid, tag = self._group_id(), f'压测标签{self.rng.randint(1, 50)}'
+        self.added.append((gid, tag))
+        return 'POST', f'/api/groups/{gid}/tags', {'tag': tag}
+
+    def op_delete_tag(self):
+        if self.added:
+            gid, tag = self.added.pop(self.rng.randrange(len(self.added)))
+        else:
+            gid, tag = self._group_id(), '滤镜'
+        return 'DELETE', f'/api/groups/{gid}/tags', {'tag': tag}
+
+    def op_batch_replace(self):
+        # 长尾标签影响的组较少，接近日常的小范围批量修正
+        old, new = self.rng.sample(range(1000, 5000), 2)
+        return 'POST', '/api/batch/replace-tag', {'old_tag': f'长尾标签{old}', 'new_tag': f'长尾标签{new}'}
+
+
+def slow_download(session, base_url, deadline):
+    """慢速下载一次导出（到达deadline时中断），返回是否成功"""
+    try:
+        with session.get(base_url + '/api/export/jsonl', stream=True, timeout=REQUEST_TIMEOUT) as resp:
+            for _ in resp.iter_content(SLOW_CLIENT_CHUNK):
+                if time.perf_counter() >= deadline:
+                    break
+                time.sleep(SLOW_CLIENT_DELAY)
+            return resp.status_code < 500
+    except requests.RequestException:
+        return False
+
+
+def run_load(base_url, total_groups, concurrency, duration, seed=0, slow_clients=0):
+    """并发执行直到duration秒，返回 (操作 -> [(耗时, 是否成功)], 墙钟时间)
+
+    slow_clients: 同时进行慢速导出下载的客户端数，其耗时记为slow_export
+    """
+    samples = collections.defaultdict(list)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(i):
+        reviewer = Reviewer(base_url, total_groups, seed + i)
+        local = []
+        while time.perf_counter() < deadline:
+            local.append(reviewer.run_once())
+        with lock:
+            for name, elapsed, ok in local:
+                samples[name].append((elapsed, ok))
+
+    def slow_worker():
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            ok = slow_download(session, base_url, deadline)
+            with lock:
+                samples['slow_export'].append((time.perf_counter() - start, ok))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=slow_worker) for _ in range(slow_clients)]
+    threads += [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - start
+
+
+def start_local_server(threaded=True):
+    """在本进程内启动服务（threaded=False时逐个处理请求，相当于单个sync worker），返回 (base_url, server)"""
+    from werkzeug.serving import make_server
+
+    import app as app_module  # 进入临时目录后再导入
+    app_module.create_app()
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=threaded)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+def build_results(samples, wall_time):
+    results = []
+    all_samples = []
+    for name in OPERATION_MIX:
+        items = samples.get(name, [])
+        all_samples += items
+        if items:
+            results.append(summarize(f'load.{name}', [e for e, _ in items], wall_time=wall_time,
+                                     errors=sum(1 for _, ok in items if not ok)))
+    results.append(summarize('load.total', [e for e, _ in all_samples], wall_time=wall_time,
+                             errors=sum(1 for _, ok in all_samples if not ok)))
+    if samples.get('slow_export'):
+        items = samples['slow_export']
+        results.append(summarize('load.slow_export', [e for e, _ in items], wall_time=wall_time,
+                                 errors=sum(1 for _, ok in items if not ok)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='审核员操作组合的并发HTTP压测')
+    parser.add_argument('--scale', default='10k', help='本地服务的数据规模：1k/10k/100k/1m 或组数')
+    parser.add_argument('--url', help='压测已启动的服务（不生成数据）')
+    parser.add_argument('--groups', type=int, help='配合--url使用：服务中的组数（默认读取/api/groups）')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--slow-clients', type=int, default=0, help='同时慢速下载导出的客户端数')
+    parser.add_argument('--server', choices=['threaded', 'single'], default='threaded',
+                        help='本地服务模式：多线程，或逐个处理请求（模拟sync worker）')
+    parser.add_argument('--output', help='结果JSON路径（默认输出到stdout）')
+    args = parser.parse_args()
+
+    if args.url:
+        total = args.groups or requests.get(f'{args.url}/api/groups?per_page=1',
+                                            timeout=REQUEST_TIMEOUT).json()['pagination']['total_groups']
+        report = new_report('load', url=args.url, groups=total, concurrency=args.concurrency,
+                            duration=args.duration, slow_clients=args.slow_clients, mix=OPERATION_MIX)
+        samples, wall_time = run_load(args.url, total, args.concurrency, args.duration, args.seed,
+                                      args.slow_clients)
+    else:
+        total = parse_scale(args.scale)
+        report = new_report('load', scale=total, concurrency=args.concurrency, duration=args.duration,
+                            slow_clients=args.slow_clients, server=args.server, mix=OPERATION_MIX)
+        with workspace():
+            write_data_file(make_dataset(total))
+            base_url, server = start_local_server(threaded=args.server == 'threaded')
+            try:
+                samples, wall_time = run_load(base_url, total, args.concurrency, args.duration, args.seed,
+                                              args.slow_clients)
+            finally:
+                server.shutdown()
+
+    report['results'] = build_results(samples, wall_time)
+    for result in report['results']:
+        print_result(result)
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+微基准：存储加载/保存、导入、导出、统计与检索
+用法：python -m benchmarks.micro --scale 10k --repeat 5 --output micro.json [--only storage,search]
+在临时目录中生成数据并直接调用应用函数/测试客户端，结果以JSON输出（p50/p99、吞吐、峰值内存）
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.datagen import make_dataset, make_records, parse_scale  # noqa: E402
+from benchmarks.report import new_report, print_result, summarize, workspace, write_data_file, write_report  # noqa: E402
+
+GROUPS = ('storage', 'import', 'export', 'statistics', 'search')
+SEARCH_QUERIES = 200
+
+
+def timed_runs(func, repeat):
+    """重复调用func，返回每次耗时（秒）"""
+    return timed_each(lambda _: func(), range(repeat))
+
+
+def timed_each(func, args):
+    """对每个参数调用一次func，返回每次耗时（秒）"""
+    durations = []
+    for arg in args:
+        start = time.perf_counter()
+        func(arg)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def bench_storage(app, count, repeat):
+    data = app.load_data()
+    yield summarize('storage.load', timed_runs(app.load_data, repeat), count)
+    yield summarize('storage.save', timed_runs(lambda: app.save_data(data), repeat), count)
+
+    # 单组修改：只读写该组所在的分片
+    group_id = data['groups'][len(data['groups']) // 2]['id']
+    part = app.load_group_data(group_id)
+    group = app.find_group(part, group_id)
+    yield summarize('storage.load_group', timed_runs(lambda: app.load_group_data(group_id), repeat), count)
+    yield summarize('storage.save_group', timed_runs(lambda: app.save_data(part, [(group, group)]), repeat), count)
+
+
+def bench_import(app, count, repeat):
+    import codec
+    from importer import parse_jsonl, run_import
+
+    text = '\n'.join(codec.dumps_str(record) for record in make_records(count, seed=1))
+
+    def full_import():
+        run_import({'groups': []}, parse_jsonl(text), lambda uid: None, 'skip', continue_on_error=True)
+
+    yield summarize('import.parse', timed_runs(lambda: parse_jsonl(text), repeat), count)
+    yield summarize('import.pipeline', timed_runs(full_import, repeat), count)
+
+
+def bench_export(app, count, repeat):
+    client = app.app.test_client()
+    for name, url in (('export.json', '/api/export'), ('export.jsonl', '/api/export/jsonl')):
+        size = len(client.get(url).data)
+        yield summarize(name, timed_runs(lambda: client.get(url).data, repeat), count, bytes=size)
+
+
+def bench_statistics(app, count, repeat):
+    client = app.app.test_client()
+    yield summarize('statistics', timed_runs(lambda: client.get('/api/statistics'), repeat), count)
+
+
+def bench_search(app, count, repeat):
+    from indexes import GroupIndex
+
+    data = app.load_data()
+    groups = data['groups']
+    yield summarize('search.index_build', timed_runs(lambda: GroupIndex(groups, 0), repeat), count)
+
+    index = app.get_index(data)
+    rng = random.Random(0)
+    tags = sorted(index.by_tag)
+    attrs = sorted(index.by_attr)
+    selectors = []
+    for _ in range(SEARCH_QUERIES):
+        category, key, value = rng.choice(attrs)
+        selectors.append(rng.choice([
+            {'tag': rng.choice(tags)},
+            {'tags': rng.sample(tags, 2), 'reviewed': False},
+            {'attribute': {'category': category, 'key': key, 'value': value}, 'category': '聊天陪伴类'}
+        ]))
+    yield summarize('search.select', timed_each(index.select, selectors * repeat))
+
+    client = app.app.test_client()
+    urls = [f'/api/groups?tag={rng.choice(tags)}&per_page=20' for _ in range(repeat)]
+    yield summarize('search.http_tag_page', timed_each(client.get, urls))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='存储/导入/导出/统计/检索微基准')
+    parser.add_argument('--scale', default='10k', help='1k/10k/100k/1m 或组数')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', help=f'逗号分隔，可选 {",".join(GROUPS)}')
+    parser.add_argument('--output', help='结果JSON路径（默认输出到stdout）')
+    args = parser.parse_args()
+
+    count = parse_scale(args.scale)
+    selected = args.only.split(',') if args.only else GROUPS
+    report = new_report('micro', scale=count, repeat=args.repeat, only=list(selected))
+    with workspace():
+        write_data_file(make_dataset(count))
+        import app  # 进入临时目录后再导入，数据与日志写在临时目录中
+
+        for group in selected:
+            for result in globals()[f'bench_{group}'](app, count, args.repeat):
+                print_result(result)
+                report['results'].append(result)
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
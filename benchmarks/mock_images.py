@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+远程图片的本地模拟服务，用于验证图片可用性检查（liveness.py）
+用法：python -m benchmarks.mock_images --port 8002
+路径决定响应：/ok/* 返回图片，/nohead/* 的HEAD返回405（Range GET返回图片），/missing/* 返回404，
+/expired/* 返回200的HTML错误页，/flaky/* 返回503；refused_url() 给出一个拒绝连接的地址，GET /stats 查看请求统计
+"""
+
+import argparse
+import collections
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+IMAGE_BYTES = b'\xff\xd8\xff\xe0' + b'\0' * 60  # JPEG文件头
+
+
+def make_handler(stats, lock):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, content_type, body, head=False):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if not head:
+                self.wfile.write(body)
+
+        def _respond(self, head):
+            kind = self.path.strip('/').split('/', 1)[0]
+            with lock:
+                stats[f'{self.command} {kind}'] += 1
+            if kind == 'stats':
+                body = ','.join(f'{key}={value}' for key, value in sorted(stats.items())).encode('utf-8')
+                return self._send(200, 'text/plain', body, head)
+            if kind == 'ok' or (kind == 'nohead' and not head):
+                if self.headers.get('Range'):
+                    return self._send(206, 'image/jpeg', IMAGE_BYTES[:1], head)
+                return self._send(200, 'image/jpeg', IMAGE_BYTES, head)
+            if kind == 'nohead':
+                return self._send(405, 'text/plain', b'method not allowed', head)
+            if kind == 'expired':
+                return self._send(200, 'text/html', b'<html>link expired</html>', head)
+            if kind == 'flaky':
+                return self._send(503, 'text/plain', b'unavailable', head)
+            self._send(404, 'text/plain', b'not found', head)
+
+        def do_HEAD(self):
+            self._respond(head=True)
+
+        def do_GET(self):
+            self._respond(head=False)
+
+    return Handler
+
+
+def serve(port=0):
+    """在后台线程启动模拟服务，返回(server, 根地址)；server.stats 记录 '方法 路径类别' -> 请求数"""
+    stats, lock = collections.Counter(), threading.Lock()
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(stats, lock))
+    server.daemon_threads = True
+    server.stats = stats
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def refused_url(path='/img.jpg'):
+    """一个没有服务监听的本地地址（连接被拒，模拟已下线的临时主机）"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f'http://127.0.0.1:{port}{path}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='远程图片的本地模拟服务')
+    parser.add_argument('--port', type=int, default=8002)
+    args = parser.parse_args()
+    server, base = serve(args.port)
+    print(f'[OK] Mock image host: {base}  (/ok /nohead /missing /expired /flaky)')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
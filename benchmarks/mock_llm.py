@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+OpenAI兼容接口的本地模拟服务（/v1/chat/completions），用于在不消耗真实额度的情况下验证重新标注流程
+用法：python -m benchmarks.mock_llm --port 8001 --latency 0.2 --fail-rate 0.1
+      RELABEL_API_BASE=http://127.0.0.1:8001/v1 python app.py
+返回的标注由图片URL确定性生成；按比例返回429/503（带Retry-After）模拟限流与故障，GET /stats 查看请求统计
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CATEGORIES = ['聊天陪伴类', '才艺类', '美妆穿搭类', '美食类', '户外探索类']
+TAGS = ['颜值', '唱歌', '跳舞', '聊天', '美食', '户外', '穿搭', '游戏']
+
+
+def fake_output(urls):
+    """由图片URL确定性生成一份标注"""
+    seed = int(hashlib.sha1('\n'.join(urls).encode('utf-8')).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    first, second = rng.sample(CATEGORIES, 2)
+    score = round(rng.uniform(0.5, 0.95), 2)
+    return {
+        'primary_category': first,
+        'confidence': [f'{first}@{score}', f'{second}@{round(1 - score, 2)}'],
+        'attributes': {'通用特征': {'光线条件': [rng.choice(['明亮', '昏暗', '正常'])]}, '专属特征': {}},
+        'tags': rng.sample(TAGS, 3),
+        'video_description': f'模拟描述 {seed % 1000}',
+        'reasoning': '模拟服务生成',
+        'push_title': '',
+        '封面图包含文字': '否',
+        '直播图包含文字': '否'
+    }
+
+
+class MockState:
+    def __init__(self, latency, fail_rate, seed):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'ok': 0, 'failed': 0, 'in_flight': 0, 'max_in_flight': 0}
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status, body, headers=None):
+            payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path.rstrip('/') == '/stats':
+                with state.lock:
+                    return self._json(200, dict(state.stats))
+            self._json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                return self._json(404, {'error': 'not found'})
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            with state.lock:
+                state.stats['requests'] += 1
+                state.stats['in_flight'] += 1
+                state.stats['max_in_flight'] = max(state.stats['max_in_flight'], state.stats['in_flight'])
+                fail = state.rng.random() < state.fail_rate
+            try:
+                time.sleep(state.latency)
+                if fail:
+                    with state.lock:
+                        state.stats['failed'] += 1
+                    status = state.rng.choice((429, 503))
+                    return self._json(status, {'error': {'message': 'mock failure'}}, {'Retry-After': '0'})
+                urls = [part['image_url']['url'] for message in body.get('messages', [])
+                        if isinstance(message.get('content'), list)
+                        for part in message['content'] if part.get('type') == 'image_url']
+                prompt_tokens = 85 * len(urls) + 200
+                output = json.dumps(fake_output(urls), ensure_ascii=False)
+                with state.lock:
+                    state.stats['ok'] += 1
+                self._json(200, {
+                    'id': f'mock-{state.stats["requests"]}',
+                    'object': 'chat.completion',
+                    'model': body.get('model', 'mock'),
+                    'choices': [{'index': 0, 'finish_reason': 'stop',
+                                 'message': {'role': 'assistant', 'content': output}}],
+                    'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': len(output),
+                              'total_tokens': prompt_tokens + len(output)}
+                })
+            finally:
+                with state.lock:
+                    state.stats['in_flight'] -= 1
+
+    return Handler
+
+
+def serve(port=0, latency=0.0, fail_rate=0.0, seed=0):
+    """在后台线程启动模拟服务，返回(server, 接口地址)"""
+    state = MockState(latency, fail_rate, seed)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/v1'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OpenAI兼容接口的本地模拟服务')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.2, help='每个请求的处理时间（秒）')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='返回429/503的比例')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    server, base = serve(args.port, args.latency, args.fail_rate, args.seed)
+    print(f'[OK] Mock LLM endpoint: {base}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
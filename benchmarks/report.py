@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+基准结果的统计与输出：延迟分位数、吞吐、峰值内存，以JSON保存便于多次运行对比
+"""
+
+import contextlib
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(samples, p):
+    """最近秩法分位数，samples无需预先排序"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * p // 100))  # ceil
+    return ordered[int(rank) - 1]
+
+
+def peak_rss_mb():
+    """本进程至今的峰值常驻内存（MB），不支持的平台返回None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def summarize(name, durations, items=1, wall_time=None, **extra):
+    """由单次耗时（秒）列表生成结果条目
+
+    items: 每次操作处理的条目数（如记录数），吞吐按 items/秒 计算；
+    wall_time: 并发场景下的总墙钟时间，提供时吞吐按其计算
+    """
+    total = wall_time if wall_time is not None else sum(durations)
+    ms = [d * 1000 for d in durations]
+    return {
+        'name': name,
+        'iterations': len(durations),
+        'items_per_iteration': items,
+        'throughput_per_s': round(len(durations) * items / total, 2) if total else None,
+        'p50_ms': _round(percentile(ms, 50)),
+        'p99_ms': _round(percentile(ms, 99)),
+        'mean_ms': _round(sum(ms) / len(ms)) if ms else None,
+        'max_ms': _round(max(ms)) if ms else None,
+        'peak_rss_mb': peak_rss_mb(),
+        **extra
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def new_report(suite, **params):
+    """结果文件的公共头部：运行环境与参数"""
+    return {
+        'suite': suite,
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'codec': codec.codec_name(),
+        'params': params,
+        'results': []
+    }
+
+
+def print_result(result):
+    print(f"{result['name']:<24} {result['throughput_per_s'] or 0:>12,.1f}/s  "
+          f"p50 {result['p50_ms'] or 0:>9.3f}ms  p99 {result['p99_ms'] or 0:>9.3f}ms  "
+          f"rss {result['peak_rss_mb'] or 0:>7.1f}MB", file=sys.stderr)
+
+
+def write_report(report, path=None):
+    """写出JSON结果；未指定路径时输出到stdout"""
+    report['peak_rss_mb'] = peak_rss_mb()
+    payload = codec.dumps(report, pretty=True)
+    if path:
+        with open(path, 'wb') as f:
+            f.write(payload)
+        print(f'[OK] Results written to {path}', file=sys.stderr)
+    else:
+        sys.stdout.write(payload.decode('utf-8') + '\n')
+
+
+@contextlib.contextmanager
+def workspace():
+    """在临时目录中运行（应用的数据/日志路径均相对当前目录），结束后恢复并清理
+
+    必须在导入app之前进入，使其创建的data/等目录落在临时目录中
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='bench-') as tmp:
+        os.chdir(tmp)
+        os.makedirs('data', exist_ok=True)
+        try:
+            yield tmp
+        finally:
+            os.chdir(cwd)
+
+
+def write_data_file(data):
+    """将数据写入工作目录下的data/annotations.json"""
+    with open(os.path.join('data', 'annotations.json'), 'wb') as f:
+        f.write(codec.dumps(data))
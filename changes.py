@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+变更推送模块
+功能：以数据代次为序号缓存最近的组级变更和统计增量，供SSE接口推送与断线续传
+"""
+
+import collections
+import threading
+
+import codec
+
+# 内存中保留的最近事件数，客户端断线超出该范围时需整体刷新
+FEED_BUFFER_SIZE = 1000
+
+# 变更事件中逐组携带字段的上限，超过时只推送ID（如大批量导入）
+MAX_GROUPS_PER_EVENT = 200
+
+
+def stats_delta(changes):
+    """计算一组变更对统计信息的增量"""
+    delta = {'total_groups': 0, 'total_images': 0, 'modified_groups': 0, 'total_tags': 0}
+    for before, after in changes:
+        for group, sign in ((before, -1), (after, 1)):
+            if group is None:
+                continue
+            delta['total_groups'] += sign
+            delta['total_images'] += sign * len(group.get('images', []))
+            delta['modified_groups'] += sign * (1 if group.get('modified') else 0)
+            delta['total_tags'] += sign * len(group.get('tags', []))
+    return {k: v for k, v in delta.items() if v}
+
+
+def build_event(action, changes):
+    """将变更列表转换为推送事件：修改只带变化的字段，新增/删除只带ID"""
+    updated, created, deleted = [], [], []
+    for before, after in changes:
+        if before is None:
+            created.append(after['id'])
+        elif after is None:
+            deleted.append(before['id'])
+        else:
+            fields = {k: v for k, v in after.items() if before.get(k) != v}
+            fields.update({k: None for k in before.keys() - after.keys()})
+            if fields:
+                updated.append({'id': after['id'], 'fields': fields})
+
+    if len(updated) > MAX_GROUPS_PER_EVENT:
+        # 大批量修改时只告知ID，由客户端按需刷新当前页
+        updated = [{'id': item['id']} for item in updated]
+
+    return {
+        'action': action,
+        'updated': updated,
+        'created': created,
+        'deleted': deleted,
+        'stats': stats_delta(changes)
+    }
+
+
+class ChangeFeed:
+    """有界的变更事件缓冲区，支持阻塞等待新事件"""
+
+    def __init__(self, maxlen=FEED_BUFFER_SIZE):
+        self.events = collections.deque(maxlen=maxlen)  # [(seq, 已编码的事件JSON)]
+        self.latest_seq = 0
+        self.source_mtime = None  # 最近一次发布时数据文件的修改时间，用于发现外部写入
+        self._cond = threading.Condition()
+
+    def publish(self, seq, event, source_mtime=None):
+        """发布事件，seq应单调递增（使用保存后的数据代次）"""
+        payload = codec.dumps_str(event)
+        with self._cond:
+            self.events.append((seq, payload))
+            self.latest_seq = max(self.latest_seq, seq)
+            self.source_mtime = source_mtime
+            self._cond.notify_all()
+
+    def since(self, last_seq):
+        """返回(last_seq之后的事件, 是否需要整体刷新)"""
+        with self._cond:
+            if last_seq is None:
+                return [], False
+            if self.events and self.events[0][0] > last_seq + 1 and last_seq < self.latest_seq:
+                # 客户端落后太多，缓冲区已覆盖其断点
+                return [], True
+            return [(seq, payload) for seq, payload in self.events if seq > last_seq], False
+
+    def wait(self, last_seq, timeout):
+        """阻塞等待last_seq之后的新事件，超时返回空列表"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.latest_seq > (last_seq or 0), timeout=timeout)
+        return self.since(last_seq)
+
+
+feed = ChangeFeed()
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+JSON编解码模块
+功能：统一存储、导入导出与接口响应的JSON编解码，优先使用orjson/msgspec（可选依赖），否则回退到标准库json
+"""
+
+import contextlib
+import gc
+import json
+import os
+import threading
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# ========== 配置 ==========
+# 可通过环境变量强制指定编解码后端（orjson / msgspec / stdlib），默认自动选择
+CODEC_ENV = 'JSON_CODEC'
+
+
+class StdlibCodec:
+    """标准库json：紧凑输出、保留中文"""
+    name = 'stdlib'
+
+    @staticmethod
+    def dumps(obj, pretty=False):
+        if pretty:
+            return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    """orjson：与标准库一样允许非字符串字典键"""
+    name = 'orjson'
+
+    @staticmethod
+    def dumps(obj, pretty=False):
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        return orjson.dumps(obj, option=option)
+
+    @staticmethod
+    def loads(data):
+        return orjson.loads(data)
+
+
+class MsgspecCodec:
+    name = 'msgspec'
+    _encoder = msgspec.json.Encoder() if msgspec else None
+    _decoder = msgspec.json.Decoder() if msgspec else None
+
+    @classmethod
+    def dumps(cls, obj, pretty=False):
+        encoded = cls._encoder.encode(obj)
+        return msgspec.json.format(encoded, indent=2) if pretty else encoded
+
+    @classmethod
+    def loads(cls, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        return cls._decoder.decode(data)
+
+
+def available_codecs():
+    """当前环境可用的编解码后端，按优先级排列"""
+    codecs = []
+    if orjson is not None:
+        codecs.append(OrjsonCodec)
+    if msgspec is not None:
+        codecs.append(MsgspecCodec)
+    codecs.append(StdlibCodec)
+    return codecs
+
+
+def get_codec(name=None):
+    """按名称获取后端，未指定时取环境变量或可用的最快后端"""
+    name = name or os.environ.get(CODEC_ENV)
+    codecs = available_codecs()
+    if name:
+        for codec in codecs:
+            if codec.name == name:
+                return codec
+        print(f"[WARN] JSON codec {name} is not available, using {codecs[0].name}")
+    return codecs[0]
+
+
+_codec = get_codec()
+
+
+def dumps(obj, pretty=False):
+    """编码为UTF-8字节串（默认紧凑格式）"""
+    return _codec.dumps(obj, pretty)
+
+
+def dumps_str(obj, pretty=False):
+    """编码为字符串"""
+    return _codec.dumps(obj, pretty).decode('utf-8')
+
+
+def loads(data):
+    """解码字节串或字符串"""
+    return _codec.loads(data)
+
+
+_gc_lock = threading.Lock()
+_gc_pauses = 0
+_gc_was_enabled = False
+
+
+@contextlib.contextmanager
+def gc_paused():
+    """解码整份数据期间暂停循环垃圾回收
+
+    解码会连续新建大量容器，触发的分代回收每次都要遍历进程中常驻的索引与缓存，耗时可达解码本身的数倍；
+    解码结果不含引用环，暂停回收不会泄漏。多线程同时解码时按计数暂停，最后一个结束的线程恢复
+    """
+    global _gc_pauses, _gc_was_enabled
+    with _gc_lock:
+        if _gc_pauses == 0:
+            _gc_was_enabled = gc.isenabled()
+            gc.disable()
+        _gc_pauses += 1
+    try:
+        yield
+    finally:
+        with _gc_lock:
+            _gc_pauses -= 1
+            if _gc_pauses == 0 and _gc_was_enabled:
+                gc.enable()
+
+
+def codec_name():
+    return _codec.name
+
+
+# 各后端解析失败时抛出的异常类型，供调用方统一捕获
+DecodeError = tuple(cls for cls in (json.JSONDecodeError,
+                                    getattr(orjson, 'JSONDecodeError', None),
+                                    getattr(msgspec, 'DecodeError', None)) if cls is not None)
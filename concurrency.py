@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+进程内并发控制模块
+功能：多线程worker（gunicorn gthread）下的数据并发控制，跨进程仍由数据文件的portalocker保证
+- mutation_lock：修改请求（读取-修改-保存）之间互斥，同一进程内不丢失更新；只修改单个组的请求按分片互斥，
+  不同分片上的修改并行
+- data_lock：读写锁，读请求共享持有；提交修改（保存文件并原地更新内存索引、分页缓存）时独占，
+  读请求不会看到更新到一半的索引，修改请求在提交之前的读取与计算也不阻塞读请求
+"""
+
+import contextlib
+import threading
+import time
+
+import metrics
+
+LOCK_WAIT = metrics.histogram('data_rwlock_wait_seconds', '进程内数据读写锁等待时间')
+
+
+class ReadWriteLock:
+    """读写锁（写优先）：有写者等待时新的读者排队，避免持续的读请求使修改请求饿死
+
+    不可重入：同一线程持有锁期间不能再次获取
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        start = time.perf_counter()
+        with self._cond:
+            self._cond.wait_for(lambda: not self._writing and not self._waiting_writers)
+            self._readers += 1
+        LOCK_WAIT.observe(time.perf_counter() - start, mode='shared')
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        start = time.perf_counter()
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                self._cond.wait_for(lambda: not self._writing and not self._readers)
+            finally:
+                self._waiting_writers -= 1
+            self._writing = True
+        LOCK_WAIT.observe(time.perf_counter() - start, mode='exclusive')
+
+    def release_write(self):
+        with self._cond:
+            self._writing = False
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+    def state(self):
+        with self._cond:
+            return {'readers': self._readers, 'writing': self._writing, 'waiting_writers': self._waiting_writers}
+
+
+class MutationLock:
+    """修改请求锁：独占模式与所有修改互斥；分片模式只与同一分片的修改及独占模式互斥（独占优先）
+
+    独占模式的用法与threading.Lock相同（acquire/release/with），不可重入
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._exclusive = False
+        self._waiting_exclusive = 0
+        self._shard_holders = 0
+        self._shards = set()  # 正在被修改的分片
+
+    def acquire(self, blocking=True):
+        start = time.perf_counter()
+        with self._cond:
+            if not blocking:
+                if self._exclusive or self._shard_holders:
+                    return False
+            else:
+                self._waiting_exclusive += 1
+                try:
+                    self._cond.wait_for(lambda: not self._exclusive and not self._shard_holders)
+                finally:
+                    self._waiting_exclusive -= 1
+            self._exclusive = True
+        LOCK_WAIT.observe(time.perf_counter() - start, mode='mutation')
+        return True
+
+    def release(self):
+        with self._cond:
+            self._exclusive = False
+            self._cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def acquire_shard(self, key):
+        start = time.perf_counter()
+        with self._cond:
+            self._cond.wait_for(lambda: not self._exclusive and not self._waiting_exclusive and key not in self._shards)
+            self._shard_holders += 1
+            self._shards.add(key)
+        LOCK_WAIT.observe(time.perf_counter() - start, mode='shard')
+
+    def release_shard(self, key):
+        with self._cond:
+            self._shard_holders -= 1
+            self._shards.discard(key)
+            self._cond.notify_all()
+
+    def state(self):
+        with self._cond:
+            return {'exclusive': self._exclusive, 'waiting_exclusive': self._waiting_exclusive,
+                    'shards': sorted(self._shards)}
+
+
+# 修改请求之间互斥（单组修改按分片互斥）
+mutation_lock = MutationLock()
+# 标注数据文件及其内存索引、分页缓存等派生状态
+data_lock = ReadWriteLock()
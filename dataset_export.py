@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+"""
+训练数据导出模块
+功能：将（已审核的）组按固定组数切分为分片，由进程池并行写出：列式Parquet（未安装pyarrow时为gzip压缩的NDJSON），
+或webdataset风格的tar分片（内嵌本地图片/远程快照缓存中的图片字节）；全部分片完成后写出清单manifest.json
+用法：python dataset_export.py --format tar --out exports/train --shard-size 10000
+"""
+
+import argparse
+import gzip
+import io
+import multiprocessing
+import os
+import re
+import tarfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import codec
+from indexes import group_categories
+from media import remote_cache_path, stream_sha256
+from snapshot import open_snapshot, write_snapshot
+from storage import DATA_DIR, ShardedStore
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow为可选依赖，缺失时列式导出回退为压缩NDJSON
+    pa = pq = None
+
+# ========== 配置 ==========
+EXPORT_FOLDER = 'exports'
+SNAPSHOT_FILE = 'data/annotations.snap'
+IMAGE_FOLDER = 'static/images'
+
+FORMATS = ('parquet', 'ndjson', 'tar')
+DEFAULT_FORMAT = 'parquet'
+EXTENSIONS = {'parquet': 'parquet', 'ndjson': 'ndjson.gz', 'tar': 'tar'}
+DEFAULT_SHARD_SIZE = 10000  # 每个分片的组数
+MAX_SHARD_SIZE = 1000000
+EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', os.cpu_count() or 1))
+PARQUET_COMPRESSION = 'zstd'
+NDJSON_GZIP_LEVEL = 5
+
+MANIFEST_FILE = 'manifest.json'
+STATUS_FILE = 'status.json'
+PINNED_SNAPSHOT = '.source.snap'  # 导出期间固定使用的快照（硬链接或重建），完成后删除
+
+# 按文件头识别缓存图片的扩展名（远程快照缓存文件没有扩展名，webdataset按扩展名解码）
+IMAGE_SIGNATURES = ((b'\xff\xd8\xff', 'jpg'), (b'\x89PNG\r\n\x1a\n', 'png'), (b'GIF8', 'gif'))
+
+_JOB_ID = re.compile(r'^[0-9a-f]{12}$')
+_SHARD_FILE = re.compile(r'^shard-\d{5}\.(parquet|ndjson\.gz|tar)$')
+
+
+# ========== 记录格式 ==========
+def processed_result(group):
+    """组 -> 完整的处理结果（与导入的task/output格式一致）"""
+    result = {
+        "task": group.get("task", {}),
+        "provider": group.get("provider", ""),
+        "model": group.get("model", ""),
+        "timestamp": group.get("timestamp", ""),
+        "elapsed_seconds": group.get("elapsed_seconds", 0),
+        "output": {
+            "primary_category": group.get("primary_category", ""),
+            "confidence": group.get("confidence", []),
+            "attributes": group.get("attributes", {
+                "通用特征": {},
+                "专属特征": {}
+            }),
+            "tags": group.get("tags", []),
+            "video_description": group.get("video_description", ""),
+            "reasoning": group.get("reasoning", ""),
+            "push_title": group.get("push_title", ""),
+            "封面图包含文字": group.get("封面图包含文字", ""),
+            "直播图包含文字": group.get("直播图包含文字", "")
+        }
+    }
+    # 如果有usage字段，也包含进去
+    if "usage" in group:
+        result["usage"] = group["usage"]
+    return result
+
+
+def image_entries(group):
+    """组内图片的描述（类型、来源、内容哈希），不含缩略图等展示字段"""
+    entries = []
+    for i, img in enumerate(group.get('images', [])):
+        entry = {'type': img.get('type') or f'image{i}'}
+        for field in ('filename', 'url', 'sha256'):
+            if img.get(field):
+                entry[field] = img[field]
+        entries.append(entry)
+    return entries
+
+
+def training_record(group):
+    """训练样本：处理结果 + 组ID、审核状态与图片描述"""
+    return {
+        'group_id': group['id'],
+        'reviewed': bool(group.get('reviewed')),
+        'modified': bool(group.get('modified')),
+        'images': image_entries(group),
+        **processed_result(group)
+    }
+
+
+def image_path(entry, image_folder):
+    """图片字节的本地来源：本地文件或远程快照缓存，都不存在时返回None"""
+    if entry.get('filename'):
+        path = os.path.join(image_folder, entry['filename'])
+    elif entry.get('url'):
+        path = remote_cache_path(entry['url'])
+    else:
+        return None
+    return path if os.path.isfile(path) else None
+
+
+def image_extension(entry, head):
+    """图片扩展名：本地文件沿用文件名，缓存文件按文件头识别"""
+    if entry.get('filename'):
+        ext = os.path.splitext(entry['filename'])[1].lstrip('.').lower()
+        if ext:
+            return 'jpg' if ext == 'jpeg' else ext
+    for signature, ext in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return 'bin'
+
+
+# ========== 分片写出（在进程池中执行） ==========
+_worker_snapshots = {}  # 快照路径 -> Snapshot，每个工作进程只映射一次
+
+
+def _worker_snapshot(path):
+    snapshot = _worker_snapshots.get(path)
+    if snapshot is None:
+        snapshot = _worker_snapshots[path] = open_snapshot(path)
+        if snapshot is None:
+            raise ValueError(f'{path} is not a snapshot file')
+    return snapshot
+
+
+def _tar_member(tar, name, fileobj, size):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(time.time())
+    tar.addfile(info, fileobj)
+
+
+def _write_parquet(path, records):
+    columns = {
+        'group_id': pa.array([r['group_id'] for r in records], pa.int64()),
+        'uid': pa.array([str((r['task'] or {}).get('uid') or '') for r in records], pa.string()),
+        'primary_categories': pa.array([[c for c in group_categories(r['output']) if c] for r in records],
+                                       pa.list_(pa.string())),
+        'tags': pa.array([r['output']['tags'] or [] for r in records], pa.list_(pa.string())),
+        'reviewed': pa.array([r['reviewed'] for r in records], pa.bool_()),
+        'record': pa.array([codec.dumps_str(r) for r in records], pa.string())
+    }
+    pq.write_table(pa.table(columns), path, compression=PARQUET_COMPRESSION)
+
+
+def _write_ndjson(path, records):
+    with gzip.open(path, 'wb', compresslevel=NDJSON_GZIP_LEVEL) as f:
+        for record in records:
+            f.write(codec.dumps(record) + b'\n')
+
+
+def _write_tar(path, records, image_folder):
+    """每个组一个样本：<组ID>.json 以及 <组ID>.<图片类型>.<扩展名>，返回(内嵌图片数, 缺失图片数)"""
+    images = missing = 0
+    with tarfile.open(path, 'w') as tar:
+        for record in records:
+            key = str(record['group_id'])
+            for entry in record['images']:
+                src = image_path(entry, image_folder)
+                if src is None:
+                    entry['file'] = None
+                    missing += 1
+                    continue
+                with open(src, 'rb') as f:
+                    head = f.read(12)
+                    f.seek(0)
+                    entry['file'] = f"{key}.{entry['type']}.{image_extension(entry, head)}"
+                    _tar_member(tar, entry['file'], f, os.fstat(f.fileno()).st_size)
+                images += 1
+            payload = codec.dumps(record)
+            _tar_member(tar, f'{key}.json', io.BytesIO(payload), len(payload))
+    return images, missing
+
+
+def write_shard(task):
+    """写出一个分片（先写临时文件再改名），返回分片信息
+
+    task: {'snapshot': 快照路径, 'positions': 组的存储下标, 'path': 分片路径, 'format': 格式, 'image_folder': 图片目录}
+    """
+    snapshot = _worker_snapshot(task['snapshot'])
+    records = [training_record(snapshot.record(pos)) for pos in task['positions']]
+    tmp_path = f"{task['path']}.tmp"
+    images = missing = 0
+    if task['format'] == 'parquet':
+        _write_parquet(tmp_path, records)
+    elif task['format'] == 'tar':
+        images, missing = _write_tar(tmp_path, records, task['image_folder'])
+    else:
+        _write_ndjson(tmp_path, records)
+    with open(tmp_path, 'rb') as f:
+        digest = stream_sha256(f)
+    os.replace(tmp_path, task['path'])
+    return {
+        'file': os.path.basename(task['path']),
+        'groups': len(records),
+        'bytes': os.path.getsize(task['path']),
+        'sha256': digest,
+        'first_id': records[0]['group_id'] if records else None,
+        'last_id': records[-1]['group_id'] if records else None,
+        'images': images,
+        'missing_images': missing
+    }
+
+
+# ========== 导出 ==========
+def resolve_format(fmt):
+    """请求的格式 -> 实际写出的格式（parquet在未安装pyarrow时回退为ndjson），非法时抛出ValueError"""
+    fmt = fmt or DEFAULT_FORMAT
+    if fmt not in FORMATS:
+        raise ValueError(f'format must be one of {", ".join(FORMATS)}')
+    if fmt == 'parquet' and pq is None:
+        return 'ndjson'
+    return fmt
+
+
+def pin_snapshot(data_dir, snapshot_file, path):
+    """为导出固定一份与标注数据一致的快照，返回打开的快照
+
+    现有快照未过期时硬链接过来（服务端随后替换快照不影响导出），否则读取全部分片重建
+    """
+    store = ShardedStore(data_dir)
+    mtime = store.mtime()
+    if os.path.exists(path):
+        os.remove(path)
+    try:
+        os.link(snapshot_file, path)
+        snapshot = open_snapshot(path, mtime)
+        if snapshot is not None:
+            return snapshot
+    except OSError:
+        pass
+    data, mtime = store.load()
+    if data is None:
+        raise FileNotFoundError(f'No annotation data under {data_dir}')
+    write_snapshot(data, path, mtime)
+    return open_snapshot(path)
+
+
+def clear_output(out_dir):
+    """删除输出目录中上一次导出的清单与分片"""
+    for name in os.listdir(out_dir):
+        if name == MANIFEST_FILE or _SHARD_FILE.match(name) or name.endswith('.tmp'):
+            os.remove(os.path.join(out_dir, name))
+
+
+def export_dataset(out_dir, fmt=DEFAULT_FORMAT, shard_size=DEFAULT_SHARD_SIZE, workers=EXPORT_WORKERS,
+                   reviewed_only=True, data_dir=DATA_DIR, snapshot_file=SNAPSHOT_FILE, image_folder=IMAGE_FOLDER,
+                   progress=None):
+    """导出训练数据分片并写出清单，返回清单内容
+
+    progress: 可选回调 progress(已完成分片数, 分片总数)
+    """
+    written_format = resolve_format(fmt)
+    os.makedirs(out_dir, exist_ok=True)
+    clear_output(out_dir)
+    start = time.perf_counter()
+
+    pinned = os.path.join(out_dir, PINNED_SNAPSHOT)
+    snapshot = pin_snapshot(data_dir, snapshot_file, pinned)
+    try:
+        positions = [pos for pos in range(len(snapshot)) if not reviewed_only or snapshot.reviewed(pos)]
+        source = {'generation': snapshot.generation, 'data_mtime_ns': snapshot.source_mtime,
+                  'groups_total': len(snapshot)}
+        snapshot.close()
+
+        ext = EXTENSIONS[written_format]
+        tasks = [{
+            'snapshot': pinned,
+            'positions': positions[i:i + shard_size],
+            'path': os.path.join(out_dir, f'shard-{n:05d}.{ext}'),
+            'format': written_format,
+            'image_folder': image_folder
+        } for n, i in enumerate(range(0, len(positions), shard_size))]
+
+        shards = []
+        if tasks:
+            # 服务端在多线程worker中调用：子进程以spawn方式启动，不继承其他线程持有的锁
+            with ProcessPoolExecutor(max_workers=max(1, min(workers, len(tasks))),
+                                     mp_context=multiprocessing.get_context('spawn')) as executor:
+                for shard in executor.map(write_shard, tasks):
+                    shards.append(shard)
+                    if progress is not None:
+                        progress(len(shards), len(tasks))
+    finally:
+        if os.path.exists(pinned):
+            os.remove(pinned)
+
+    manifest = {
+        'format': written_format,
+        'requested_format': fmt,
+        'extension': EXTENSIONS[written_format],
+        'selection': 'reviewed' if reviewed_only else 'all',
+        'shard_size': shard_size,
+        'source': source,
+        'groups': sum(shard['groups'] for shard in shards),
+        'images': sum(shard['images'] for shard in shards),
+        'missing_images': sum(shard['missing_images'] for shard in shards),
+        'bytes': sum(shard['bytes'] for shard in shards),
+        'elapsed_seconds': round(time.perf_counter() - start, 3),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'shards': shards
+    }
+    # 清单最后写出：清单存在即表示全部分片已完成
+    tmp_path = os.path.join(out_dir, f'{MANIFEST_FILE}.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(codec.dumps(manifest, pretty=True))
+    os.replace(tmp_path, os.path.join(out_dir, MANIFEST_FILE))
+    return manifest
+
+
+# ========== 后台导出任务 ==========
+class ExportJobs:
+    """服务端的后台导出：每个任务输出到 exports/<任务ID>/，状态写入status.json（任一worker进程都可查询）"""
+
+    def __init__(self, folder=EXPORT_FOLDER):
+        self.folder = folder
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def job_dir(self, job_id):
+        return os.path.join(self.folder, job_id)
+
+    def is_job_id(self, value):
+        """任务ID为12位十六进制（防止路径遍历）"""
+        return isinstance(value, str) and bool(_JOB_ID.match(value))
+
+    def start(self, **options):
+        """启动后台导出，返回任务ID；本进程已有导出在运行时返回None"""
+        with self._lock:
+            if self._running:
+                return None
+            job_id = uuid.uuid4().hex[:12]
+            self._running.add(job_id)
+        os.makedirs(self.job_dir(job_id), exist_ok=True)
+        self._write_status(job_id, {'state': 'running', 'options': options, 'shards_done': 0, 'shards_total': None,
+                                    'started_at': time.strftime('%Y-%m-%dT%H:%M:%S')})
+        threading.Thread(target=self._run, args=(job_id, options), name=f'dataset-export-{job_id}',
+                         daemon=True).start()
+        return job_id
+
+    def _run(self, job_id, options):
+        status = self.status(job_id)
+
+        def _progress(done, total):
+            status.update(shards_done=done, shards_total=total)
+            self._write_status(job_id, status)
+
+        try:
+            manifest = export_dataset(self.job_dir(job_id), progress=_progress, **options)
+            status.update(state='done', groups=manifest['groups'], shards_total=len(manifest['shards']))
+            print(f"[OK] Dataset export {job_id}: {manifest['groups']} groups in {len(manifest['shards'])} shards")
+        except Exception as e:
+            print(f"[ERROR] Dataset export {job_id} failed: {e}")
+            status.update(state='failed', error=str(e))
+        finally:
+            status['finished_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+            self._write_status(job_id, status)
+            with self._lock:
+                self._running.discard(job_id)
+
+    def _write_status(self, job_id, status):
+        path = os.path.join(self.job_dir(job_id), STATUS_FILE)
+        with open(f'{path}.tmp', 'wb') as f:
+            f.write(codec.dumps(status))
+        os.replace(f'{path}.tmp', path)
+
+    def status(self, job_id):
+        """任务状态，不存在返回None"""
+        try:
+            with open(os.path.join(self.job_dir(job_id), STATUS_FILE), 'rb') as f:
+                return codec.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    def manifest(self, job_id):
+        try:
+            with open(os.path.join(self.job_dir(job_id), MANIFEST_FILE), 'rb') as f:
+                return codec.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    def file_path(self, job_id, name):
+        """任务输出中可下载的文件（清单或分片），不存在返回None"""
+        if name != MANIFEST_FILE and not _SHARD_FILE.match(name):
+            return None
+        path = os.path.join(self.job_dir(job_id), name)
+        return path if os.path.isfile(path) else None
+
+
+jobs = ExportJobs()
+
+
+# ========== 命令行 ==========
+def main():
+    parser = argparse.ArgumentParser(description='导出训练数据分片（Parquet/NDJSON/webdataset tar）')
+    parser.add_argument('--format', default=DEFAULT_FORMAT, choices=FORMATS,
+                        help='parquet需要pyarrow，未安装时写出ndjson.gz')
+    parser.add_argument('--out', required=True, help='输出目录')
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE, help='每个分片的组数')
+    parser.add_argument('--workers', type=int, default=EXPORT_WORKERS, help='写分片的进程数')
+    parser.add_argument('--all', action='store_true', help='导出全部组（默认只导出已审核的组）')
+    parser.add_argument('--data', default=DATA_DIR, help='分片存储目录')
+    parser.add_argument('--snapshot', default=SNAPSHOT_FILE)
+    parser.add_argument('--images', default=IMAGE_FOLDER, help='本地图片目录')
+    args = parser.parse_args()
+    if not 0 < args.shard_size <= MAX_SHARD_SIZE:
+        parser.error(f'--shard-size must be between 1 and {MAX_SHARD_SIZE}')
+
+    def _progress(done, total):
+        print(f'\r{done}/{total} shards', end='', flush=True)
+
+    manifest = export_dataset(args.out, args.format, args.shard_size, args.workers, not args.all,
+                              args.data, args.snapshot, args.images, _progress)
+    print()
+    if manifest['format'] != args.format:
+        print(f"[WARN] pyarrow is not installed, wrote {manifest['format']} instead of {args.format}")
+    print(f"[OK] {manifest['groups']} groups, {len(manifest['shards'])} shards, {manifest['bytes']} bytes "
+          f"({manifest['missing_images']} images missing) in {manifest['elapsed_seconds']}s -> {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,19 @@
-# Gunicorn配置文件 - 单进程模式
+# Gunicorn配置文件 - 单进程多线程模式
 import multiprocessing
+import os
 
 # 服务器配置
 bind = "127.0.0.1:5000"
 backlog = 2048
 
 # 工作进程配置
-workers = 1  # 单进程模式，避免文件锁冲突
-worker_class = "sync"  # 同步工作类
+workers = 1  # 单进程模式，避免文件锁冲突（内存索引与分页缓存按进程维护）
+# 多线程工作类：慢客户端、大文件导出、远程图片获取与SSE变更推送各占一个线程，不再阻塞其他审核员；
+# 进程内由数据读写锁（concurrency.py）保证读取-修改-保存不丢失更新。设为sync可回退到同步模式
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 16))  # 每个SSE连接常驻占用一个线程，按在线审核员数调整
+# SSE变更推送需要多线程或异步worker：同步单线程时长连接会占满唯一的worker，此时前端不订阅推送（见app.py）
+os.environ.setdefault("CHANGE_STREAM", "0" if worker_class in ("sync", "gthread") and threads <= 1 else "1")
 worker_connections = 1000
 timeout = 30
 keepalive = 2
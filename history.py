@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+修改历史模块
+功能：以紧凑差异记录每次修改（用户、时间），追加写入分段文件，按组ID建立偏移索引，支持撤销/重做与批量回滚
+"""
+
+import copy
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import portalocker
+
+import codec
+
+# ========== 配置 ==========
+HISTORY_FOLDER = 'data/history'
+SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+
+os.makedirs(HISTORY_FOLDER, exist_ok=True)
+
+# 差异中表示“字段不存在”的标记
+ABSENT = {'$absent': True}
+
+
+# ========== 差异计算 ==========
+def compute_diff(before, after):
+    """计算两个字典的紧凑差异
+
+    普通字段记为 [旧值, 新值]；嵌套字典记为 {"~": 子差异}；缺失字段用ABSENT表示
+    """
+    diff = {}
+    for key in before.keys() | after.keys():
+        old = before.get(key, ABSENT)
+        new = after.get(key, ABSENT)
+        if old == new:
+            continue
+        if isinstance(old, dict) and isinstance(new, dict) and old is not ABSENT and new is not ABSENT:
+            diff[key] = {'~': compute_diff(old, new)}
+        else:
+            diff[key] = [old, new]
+    return diff
+
+
+def apply_diff(target, diff, reverse=False):
+    """将差异应用到字典上（reverse=True时恢复为旧值）"""
+    for key, change in diff.items():
+        if isinstance(change, dict):
+            apply_diff(target.setdefault(key, {}), change['~'], reverse)
+            continue
+        value = change[0] if reverse else change[1]
+        if value == ABSENT:
+            target.pop(key, None)
+        else:
+            target[key] = value
+    return target
+
+
+def new_batch_id():
+    """生成批量操作ID"""
+    return uuid.uuid4().hex[:12]
+
+
+# ========== 存储 ==========
+class HistoryStore:
+    """追加写入的历史存储
+
+    记录写入 segment-NNNNNN.jsonl，索引文件每行记录 [seq, 组ID, 批次ID, 段号, 偏移, 长度]，
+    启动时只加载索引（不扫描记录本身），按组ID查询时按偏移直接读取对应记录
+    """
+
+    def __init__(self, folder=HISTORY_FOLDER):
+        self.folder = folder
+        self.index_file = os.path.join(folder, 'index.jsonl')
+        self.by_group = {}   # 组ID -> [(seq, 段号, 偏移, 长度), ...]
+        self.by_batch = {}   # 批次ID -> [(seq, 段号, 偏移, 长度), ...]
+        self.last_seq = 0
+        self.segment = 1
+        self._index_size = 0
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def _segment_path(self, segment):
+        return os.path.join(self.folder, f'segment-{segment:06d}.jsonl')
+
+    def _load_index(self, offset=0):
+        """从offset处读取索引增量（其他进程追加的部分）"""
+        if not os.path.exists(self.index_file):
+            return
+        with open(self.index_file, 'r', encoding='utf-8') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith('\n'):
+                    break  # 写入中的不完整行，下次再读
+                self._add_index_entry(codec.loads(line))
+            self._index_size = f.tell()
+
+    def _add_index_entry(self, entry):
+        seq, group_id, batch_id, segment, offset, length = entry
+        location = (seq, segment, offset, length)
+        self.by_group.setdefault(group_id, []).append(location)
+        if batch_id:
+            self.by_batch.setdefault(batch_id, []).append(location)
+        self.last_seq = max(self.last_seq, seq)
+        self.segment = max(self.segment, segment)
+
+    def append(self, records):
+        """追加一批历史记录（自动分配seq），返回写入的记录"""
+        if not records:
+            return []
+        with self._lock, open(self.index_file, 'a+', encoding='utf-8') as index_f:
+            portalocker.lock(index_f, portalocker.LOCK_EX)
+            try:
+                # 先追平其他进程写入的索引，保证seq全局递增
+                index_f.seek(0, os.SEEK_END)
+                if index_f.tell() != self._index_size:
+                    self._load_index(self._index_size)
+
+                segment_path = self._segment_path(self.segment)
+                if os.path.exists(segment_path) and os.path.getsize(segment_path) >= SEGMENT_MAX_BYTES:
+                    self.segment += 1
+                    segment_path = self._segment_path(self.segment)
+
+                index_lines = []
+                with open(segment_path, 'ab') as seg_f:
+                    offset = seg_f.tell()
+                    for record in records:
+                        self.last_seq += 1
+                        record['seq'] = self.last_seq
+                        line = codec.dumps(record) + b'\n'
+                        seg_f.write(line)
+                        entry = [record['seq'], record['group_id'], record.get('batch_id'),
+                                 self.segment, offset, len(line)]
+                        index_lines.append(codec.dumps_str(entry) + '\n')
+                        self._add_index_entry(entry)
+                        offset += len(line)
+                    seg_f.flush()
+                    os.fsync(seg_f.fileno())
+
+                index_f.write(''.join(index_lines))
+                index_f.flush()
+                self._index_size = index_f.tell()
+            finally:
+                portalocker.unlock(index_f)
+        return records
+
+    def refresh(self):
+        """追平其他进程追加的索引"""
+        with self._lock:
+            if os.path.exists(self.index_file) and os.path.getsize(self.index_file) != self._index_size:
+                self._load_index(self._index_size)
+
+    def _read(self, locations):
+        records = []
+        handles = {}
+        try:
+            for seq, segment, offset, length in locations:
+                f = handles.get(segment)
+                if f is None:
+                    f = handles[segment] = open(self._segment_path(segment), 'rb')
+                f.seek(offset)
+                records.append(codec.loads(f.read(length)))
+        finally:
+            for f in handles.values():
+                f.close()
+        return records
+
+    def group_history(self, group_id, limit=None):
+        """按时间顺序返回组的历史记录（只读取该组的记录）"""
+        self.refresh()
+        locations = list(self.by_group.get(group_id, []))
+        if limit:
+            locations = locations[-limit:]
+        return self._read(locations)
+
+    def batch_history(self, batch_id):
+        """返回某个批次内的全部记录"""
+        self.refresh()
+        return self._read(list(self.by_batch.get(batch_id, [])))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """懒加载全局历史存储"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore()
+        return _store
+
+
+# ========== 记录与撤销 ==========
+def build_record(action, before, after, user, batch_id=None, reverts=None):
+    """根据组的前后快照构建历史记录
+
+    新增只记录事件本身；删除保存完整快照以便撤销；修改只保存差异
+    """
+    group_id = (after or before)['id']
+    record = {
+        'ts': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'time': time.time(),
+        'user': user,
+        'action': action,
+        'group_id': group_id,
+        'batch_id': batch_id
+    }
+    if reverts is not None:
+        record['reverts'] = reverts
+    if before is None:
+        record['kind'] = 'create'
+    elif after is None:
+        record['kind'] = 'delete'
+        record['snapshot'] = before
+    else:
+        record['kind'] = 'update'
+        record['diff'] = compute_diff(before, after)
+    return record
+
+
+def record_changes(action, changes, user, batch_id=None, reverts=None):
+    """记录一组变更（忽略无实际差异的修改），返回写入的记录
+
+    reverts: 撤销/重做时与changes一一对应的目标记录seq
+    """
+    records = []
+    for i, (before, after) in enumerate(changes):
+        record = build_record(action, before, after, user, batch_id, reverts[i] if reverts else None)
+        if record['kind'] == 'update' and not record['diff']:
+            continue
+        records.append(record)
+    return get_store().append(records)
+
+
+def undo_state(records):
+    """根据组的历史记录推导可撤销/可重做的记录栈
+
+    返回(done, undone)：done栈顶为下一次撤销目标；undone元素为(被撤销记录, 撤销记录)，栈顶为下一次重做目标
+    """
+    by_seq = {r['seq']: r for r in records}
+    done, undone = [], []
+    for record in records:
+        if record['action'] == 'undo':
+            target = by_seq.get(record['reverts'])
+            if target in done:
+                done.remove(target)
+                undone.append((target, record))
+        elif record['action'] == 'redo':
+            target = by_seq.get(record['reverts'])
+            for item in undone:
+                if item[0] is target:
+                    undone.remove(item)
+                    done.append(target)
+                    break
+        else:
+            done.append(record)
+            undone.clear()
+    return done, undone
+
+
+def invert(record, current):
+    """计算撤销某条记录后组应处于的状态（None表示组应被删除）"""
+    if record['kind'] == 'create':
+        return None
+    if record['kind'] == 'delete':
+        return copy.deepcopy(record['snapshot'])
+    return apply_diff(copy.deepcopy(current), record['diff'], reverse=True)
+
+
+def reapply(record, undo_record, current):
+    """计算重做某条记录后组应处于的状态（None表示组应被删除）
+
+    新增记录不含快照，重做时取撤销记录中保存的删除前快照
+    """
+    if record['kind'] == 'delete':
+        return None
+    if record['kind'] == 'create':
+        return copy.deepcopy(undo_record.get('snapshot') or current)
+    return apply_diff(copy.deepcopy(current), record['diff'])
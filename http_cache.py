@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP缓存模块
+功能：以数据代次生成强ETag并处理If-None-Match条件请求，大响应按Accept-Encoding做gzip/br压缩，
+为静态资源与图片设置Cache-Control
+"""
+
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ========== 配置 ==========
+COMPRESS_MIN_BYTES = 1024  # 小于该大小的响应不压缩（压缩收益抵不过CPU开销）
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+
+# 依赖数据的接口：浏览器每次都需向服务端确认（带If-None-Match），未变化时返回304
+REVALIDATE = 'no-cache'
+# 按文件名引用的本地原图（同名文件内容基本不变）
+IMAGE_MAX_AGE = 86400
+# 带内容哈希的缩略图地址内容不可变
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+# ========== ETag ==========
+def make_etag(generation, encoding=None):
+    """由数据代次生成强ETag；不同的内容编码对应不同的表示，需区分ETag"""
+    suffix = f'-{encoding}' if encoding else ''
+    return f'"g{generation}{suffix}"'
+
+
+def matching_etag(if_none_match, generation):
+    """If-None-Match（werkzeug ETags）中与该代次匹配的ETag（任一内容编码），不匹配返回None"""
+    if generation is None or not if_none_match:
+        return None
+    base = make_etag(generation).strip('"')
+    if if_none_match.star_tag:
+        return f'"{base}"'
+    for tag in if_none_match.as_set():
+        if tag == base or tag.startswith(f'{base}-'):
+            return f'"{tag}"'
+    return None
+
+
+# ========== 压缩 ==========
+def choose_encoding(accept_encodings):
+    """按客户端Accept-Encoding选择br（已安装brotli时）或gzip，都不接受时返回None"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response, accept_encodings):
+    """就地压缩可压缩的响应，返回使用的编码（未压缩返回None）
+
+    流式响应、send_file直通响应与已编码的响应保持原样
+    """
+    if (response.is_streamed or response.direct_passthrough or response.status_code != 200
+            or 'Content-Encoding' in response.headers
+            or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)):
+        return None
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return None
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return None
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(body, compresslevel=GZIP_LEVEL)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return encoding
+
+
+# ========== Cache-Control ==========
+def static_cache_control(path, query):
+    """静态文件与图片接口的Cache-Control
+
+    path: 请求路径；query: 请求参数（缩略图带内容哈希h时视为不可变）
+    """
+    if path.startswith('/api/thumbnail'):
+        return IMMUTABLE if query.get('h') else f'public, max-age={IMAGE_MAX_AGE}'
+    if path.startswith('/static/images/'):
+        return f'public, max-age={IMAGE_MAX_AGE}'
+    # JS/CSS等随版本更新，需每次确认（send_file已附带ETag/Last-Modified）
+    return REVALIDATE
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""
+导入流水线模块
+功能：统一JSON/JSONL导入的解析、模式校验、建组与按uid合并，逐行收集错误并生成可下载的错误报告
+"""
+
+import copy
+import os
+import uuid
+
+import codec
+from versions import merge_run, run_from_item
+
+# ========== 配置 ==========
+IMPORT_REPORT_FOLDER = 'data/import_reports'
+
+os.makedirs(IMPORT_REPORT_FOLDER, exist_ok=True)
+
+# task/output记录的模式：字段 -> (允许的类型, 是否必填, 子模式/元素类型)
+_STR = (str,)
+RECORD_SCHEMA = {
+    'task': (dict, True, {
+        'uid': ((str, int), False, None),
+        'human_label': (_STR, False, None),
+        'cover_url': (_STR, False, None),
+        'live_url': (_STR, False, None)
+    }),
+    'output': (dict, True, {
+        'primary_category': ((str, list), False, _STR),
+        'confidence': (list, False, _STR),
+        'attributes': (dict, False, 'attributes'),
+        'tags': (list, False, _STR),
+        'video_description': (_STR, False, None),
+        'reasoning': (_STR, False, None),
+        'push_title': (_STR, False, None),
+        '封面图包含文字': ((str, list), False, _STR),
+        '直播图包含文字': ((str, list), False, _STR)
+    }),
+    'provider': (_STR, False, None),
+    'model': (_STR, False, None),
+    'timestamp': (_STR, False, None),
+    'elapsed_seconds': ((int, float), False, None),
+    'usage': (dict, False, None)
+}
+
+
+class ImportAborted(Exception):
+    """未开启continue_on_error时遇到错误，整个导入放弃"""
+
+    def __init__(self, line, message):
+        super().__init__(f'第{line}行: {message}')
+        self.line = line
+        self.message = message
+
+
+# ========== 校验 ==========
+def _check_attributes(value, path):
+    for category, attrs in value.items():
+        if not isinstance(attrs, dict):
+            return f'{path}.{category} 应为对象'
+        for key, values in attrs.items():
+            if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+                return f'{path}.{category}.{key} 应为字符串数组'
+    return None
+
+
+def compile_validator(schema, path=''):
+    """将模式预编译为校验函数列表，返回 validate(obj) -> 错误信息或None
+
+    每个字段生成一个闭包，校验时只做类型判断，不再解释模式本身
+    """
+    checks = []
+    for field, (types, required, inner) in schema.items():
+        field_path = f'{path}{field}'
+
+        def check(obj, field=field, field_path=field_path, types=types, required=required, inner=inner,
+                  inner_check=compile_validator(inner, f'{field_path}.') if isinstance(inner, dict) else None):
+            value = obj.get(field)
+            if value is None:
+                return f'缺少必填字段 {field_path}' if required else None
+            if not isinstance(value, types) or isinstance(value, bool):
+                return f'{field_path} 类型错误（{type(value).__name__}）'
+            if inner_check is not None:
+                return inner_check(value)
+            if inner == 'attributes':
+                return _check_attributes(value, field_path)
+            if inner is not None and isinstance(value, list) and not all(isinstance(v, inner) for v in value):
+                return f'{field_path} 应为字符串数组'
+            return None
+
+        checks.append(check)
+
+    def validate(obj):
+        for check in checks:
+            error = check(obj)
+            if error:
+                return error
+        return None
+
+    return validate
+
+
+validate_record = compile_validator(RECORD_SCHEMA)
+
+
+# ========== 解析 ==========
+def parse_jsonl(text):
+    """逐行解析JSON Lines，返回 [(行号, 记录或None, 错误或None)]，坏行不影响其他行"""
+    entries = []
+    for line_num, line in enumerate(text.split('\n'), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entries.append((line_num, codec.loads(line), None))
+        except codec.DecodeError as e:
+            entries.append((line_num, None, f'JSON解析错误: {e}'))
+    return entries
+
+
+def entries_from_payload(payload):
+    """将已解析的JSON（单个记录或记录数组）转换为 [(序号, 记录, None)]"""
+    records = payload if isinstance(payload, list) else [payload]
+    return [(i, record, None) for i, record in enumerate(records, 1)]
+
+
+def is_legacy_payload(payload):
+    """传统的images数组格式"""
+    return isinstance(payload, dict) and 'images' in payload and 'output' not in payload
+
+
+# ========== 建组 ==========
+def build_group(record, group_id, next_image_id):
+    """由task/output记录构建新组，没有可用图片时返回None"""
+    task = record['task']
+    output = record['output']
+    images = []
+    for image_type in ('cover', 'live'):
+        url = task.get(f'{image_type}_url')
+        if url:
+            images.append({'id': next_image_id + len(images), 'url': url, 'type': image_type})
+    if not images:
+        return None
+    return {
+        'id': group_id,
+        'task': task,
+        'provider': record.get('provider', ''),
+        'model': record.get('model', ''),
+        'timestamp': record.get('timestamp', ''),
+        'elapsed_seconds': record.get('elapsed_seconds', 0),
+        'usage': record.get('usage', {}),
+        'images': images,
+        'primary_category': output.get('primary_category', ''),
+        'confidence': output.get('confidence', []),
+        'attributes': output.get('attributes', {'通用特征': {}, '专属特征': {}}),
+        'tags': output.get('tags', []),
+        'video_description': output.get('video_description', ''),
+        'reasoning': output.get('reasoning', ''),
+        'push_title': output.get('push_title', ''),
+        '封面图包含文字': output.get('封面图包含文字', ''),
+        '直播图包含文字': output.get('直播图包含文字', ''),
+        'reviewed': False,
+        'modified': False
+    }
+
+
+def build_legacy_groups(payload, groups, next_group_id, next_image_id):
+    """传统images数组格式：图片两两分组，返回新建的组列表"""
+    existing_image_ids = {img['id'] for group in groups for img in group.get('images', []) if 'id' in img}
+    new_images = []
+    for img in payload['images']:
+        if 'filename' not in img:
+            continue
+        if img.get('id') and img['id'] not in existing_image_ids:
+            image_id = img['id']
+        elif not img.get('id'):
+            image_id = next_image_id
+            next_image_id += 1
+        else:
+            continue
+        new_images.append({'id': image_id, 'filename': img['filename'],
+                           'tags': img.get('tags', []), 'reviewed': img.get('reviewed', False)})
+
+    created = []
+    for i in range(0, len(new_images), 2):
+        group_images = new_images[i:i+2]
+        group_tags = list({tag for img in group_images for tag in img['tags']})
+        created.append({
+            'id': next_group_id,
+            'images': [{'id': img['id'], 'filename': img['filename']} for img in group_images],
+            'primary_category': '',
+            'confidence': [],
+            'attributes': {'通用特征': {}, '专属特征': {}},
+            'tags': group_tags,
+            'video_description': '',
+            'reasoning': '',
+            'reviewed': any(img['reviewed'] for img in group_images),
+            'modified': False
+        })
+        next_group_id += 1
+    return created
+
+
+# ========== 流水线 ==========
+class ImportResult:
+    """一次导入的结果汇总"""
+
+    def __init__(self):
+        self.created = []    # 新建的组
+        self.updated = []    # 按策略修改的已有组 [(修改前, 修改后)]
+        self.skipped = []    # [{'line', 'uid', 'reason', 'existing_group_id'}]
+        self.errors = []     # [{'line', 'uid', 'error'}]
+        self.total = 0
+
+    def summary(self):
+        return {
+            'total': self.total,
+            'created': len(self.created),
+            'updated': len(self.updated),
+            'skipped': len(self.skipped),
+            'errors': len(self.errors)
+        }
+
+
+def run_import(data, entries, find_existing, policy, continue_on_error=False):
+    """执行导入：校验每条记录，新uid建组追加到data['groups']，已有uid按policy合并
+
+    find_existing(uid): 查找已保存数据中的组；本次导入内的重复uid由流水线自行记录；
+    未开启continue_on_error时遇到第一条错误抛出ImportAborted（data尚未保存，调用方直接丢弃即可）
+    """
+    groups = data.setdefault('groups', [])
+    result = ImportResult()
+    next_group_id = max((g['id'] for g in groups), default=0) + 1
+    next_image_id = max((img.get('id', 0) for g in groups for img in g.get('images', [])), default=0) + 1
+    pending = {}     # 本次导入新建组的 uid -> 组
+    touched = set()  # 本次导入已修改的已有组ID（同一组只保留首次修改前的快照）
+
+    for line, record, error in entries:
+        result.total += 1
+        uid = None
+        if error is None:
+            if isinstance(record, dict):
+                error = validate_record(record)
+                if error is None:
+                    uid = record['task'].get('uid')
+            else:
+                error = '记录应为JSON对象'
+        if error is not None:
+            if not continue_on_error:
+                raise ImportAborted(line, error)
+            if isinstance(record, dict) and isinstance(record.get('task'), dict):
+                uid = record['task'].get('uid')
+            result.errors.append({'line': line, 'uid': uid, 'error': error})
+            continue
+
+        if isinstance(uid, int):
+            # 快速路径之外唯一需要的规范化：数字uid统一为字符串
+            uid = record['task']['uid'] = str(uid)
+
+        existing = (pending.get(uid) or find_existing(uid)) if uid else None
+        if existing is not None:
+            is_new = pending.get(uid) is existing
+            before = None if is_new or existing['id'] in touched else copy.deepcopy(existing)
+            if merge_run(data, existing, run_from_item(record), policy):
+                if before is not None:
+                    touched.add(existing['id'])
+                    result.updated.append((before, existing))
+            else:
+                result.skipped.append({'line': line, 'uid': uid, 'reason': 'duplicate_uid',
+                                       'existing_group_id': existing['id']})
+            continue
+
+        group = build_group(record, next_group_id, next_image_id)
+        if group is None:
+            result.skipped.append({'line': line, 'uid': uid, 'reason': 'no_images'})
+            continue
+        next_group_id += 1
+        next_image_id += len(group['images'])
+        groups.append(group)
+        result.created.append(group)
+        if uid:
+            pending[uid] = group
+
+    return result
+
+
+def import_legacy(data, payload):
+    """导入传统images数组格式，返回ImportResult"""
+    groups = data.setdefault('groups', [])
+    result = ImportResult()
+    next_group_id = max((g['id'] for g in groups), default=0) + 1
+    next_image_id = max((img.get('id', 0) for g in groups for img in g.get('images', [])), default=0) + 1
+    result.created = build_legacy_groups(payload, groups, next_group_id, next_image_id)
+    result.total = len(payload.get('images') or [])
+    groups.extend(result.created)
+    return result
+
+
+def save_report(result, source):
+    """将逐行错误与跳过项写入报告文件，返回报告ID（没有可报告内容时返回None）"""
+    if not result.errors and not result.skipped:
+        return None
+    report_id = uuid.uuid4().hex[:12]
+    with open(report_path(report_id), 'w', encoding='utf-8') as f:
+        f.write(codec.dumps_str({'source': source, **result.summary()}) + '\n')
+        for item in sorted(result.errors + result.skipped, key=lambda item: item['line']):
+            f.write(codec.dumps_str(item) + '\n')
+    return report_id
+
+
+def report_path(report_id):
+    return os.path.join(IMPORT_REPORT_FOLDER, f'{report_id}.jsonl')
+
+
+def is_report_id(value):
+    """报告ID为12位十六进制（防止路径遍历）"""
+    return isinstance(value, str) and len(value) == 12 and all(c in '0123456789abcdef' for c in value)
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+组索引模块
+功能：按标签/属性/类别/UID等维度建立倒排索引，按数据代次(generation)缓存并增量维护
+"""
+
+import threading
+
+# 顶层数据的代次字段：每次保存递增，用于判断内存索引是否与磁盘数据一致
+GENERATION_KEY = 'generation'
+
+# 可扩展的索引组件：name -> 工厂函数，组件需实现 add(group) / remove(group)，可选实现 build(groups)
+_component_factories = {}
+
+
+def register_component(name, factory):
+    """注册索引组件：全量重建时调用组件的build(groups)（未实现时逐组add），增量更新时调用add/remove
+
+    build只在新建的空组件上调用一次，应一次性收集后整体排序/建堆，避免逐条有序插入的平方代价
+    """
+    _component_factories[name] = factory
+
+
+class GroupIndex:
+    """图片组倒排索引"""
+
+    def __init__(self, groups, generation):
+        self.generation = generation
+        self.source_mtime = None  # 建立/同步索引时数据文件的修改时间，由调用方维护
+        self.positions = {}     # 组ID -> 在groups列表中的下标
+        self.by_tag = {}        # 标签 -> 组ID集合
+        self.by_attr = {}       # (特征类别, 属性名, 属性值) -> 组ID集合
+        self.by_attr_key = {}   # (特征类别, 属性名) -> 组ID集合
+        self.by_category = {}   # 主类别 -> 组ID集合（多类别组登记在每个类别下）
+        self.by_uid = {}        # task.uid -> 组ID
+        self.reviewed = set()
+        self.modified = set()
+        self.components = {name: factory() for name, factory in _component_factories.items()}
+        self._positions_dirty = False
+
+        for pos, group in enumerate(groups):
+            self.positions[group['id']] = pos
+            self._add_tables(group)
+        for component in self.components.values():
+            build = getattr(component, 'build', None)
+            if build is not None:
+                build(groups)
+            else:
+                for group in groups:
+                    component.add(group)
+
+    # ---------- 维护 ----------
+    def add(self, group):
+        """将组加入各倒排表"""
+        self._add_tables(group)
+        for component in self.components.values():
+            component.add(group)
+
+    def _add_tables(self, group):
+        gid = group['id']
+        for tag in group.get('tags', []):
+            self.by_tag.setdefault(tag, set()).add(gid)
+        for category, attrs in (group.get('attributes') or {}).items():
+            for key, values in (attrs or {}).items():
+                self.by_attr_key.setdefault((category, key), set()).add(gid)
+                for value in values or []:
+                    self.by_attr.setdefault((category, key, value), set()).add(gid)
+        for category in group_categories(group):
+            self.by_category.setdefault(category, set()).add(gid)
+        uid = (group.get('task') or {}).get('uid')
+        if uid:
+            self.by_uid[uid] = gid
+        if group.get('reviewed'):
+            self.reviewed.add(gid)
+        if group.get('modified'):
+            self.modified.add(gid)
+
+    def remove(self, group):
+        """将组从各倒排表移除"""
+        gid = group['id']
+        for tag in group.get('tags', []):
+            _discard(self.by_tag, tag, gid)
+        for category, attrs in (group.get('attributes') or {}).items():
+            for key, values in (attrs or {}).items():
+                _discard(self.by_attr_key, (category, key), gid)
+                for value in values or []:
+                    _discard(self.by_attr, (category, key, value), gid)
+        for category in group_categories(group):
+            _discard(self.by_category, category, gid)
+        uid = (group.get('task') or {}).get('uid')
+        if uid and self.by_uid.get(uid) == gid:
+            del self.by_uid[uid]
+        self.reviewed.discard(gid)
+        self.modified.discard(gid)
+        for component in self.components.values():
+            component.remove(group)
+
+    def apply(self, groups, changes):
+        """按变更列表增量更新索引
+
+        changes: [(before, after), ...]，before为None表示新增，after为None表示删除
+        """
+        appended = False
+        for before, after in changes:
+            if before is not None:
+                self.remove(before)
+                if after is None:
+                    # 删除会使后续组下标前移，需整体重算
+                    self.positions.pop(before['id'], None)
+                    self._positions_dirty = True
+            if after is not None:
+                self.add(after)
+                appended = appended or after['id'] not in self.positions
+
+        if self._positions_dirty:
+            self.positions = {g['id']: pos for pos, g in enumerate(groups)}
+            self._positions_dirty = False
+        elif appended:
+            # 新组总是追加在末尾，从尾部补齐下标即可
+            for pos in range(len(groups) - 1, -1, -1):
+                gid = groups[pos]['id']
+                if self.positions.get(gid) == pos:
+                    break
+                self.positions[gid] = pos
+
+    # ---------- 查询 ----------
+    def find(self, groups, group_id):
+        """按ID取组，不存在返回None"""
+        pos = self.positions.get(group_id)
+        if pos is None or pos >= len(groups) or groups[pos]['id'] != group_id:
+            return None
+        return groups[pos]
+
+    def select(self, selector):
+        """按选择器求交集，返回匹配的组ID集合
+
+        selector支持：ids, uids, tag/tags（任一）, category, attribute{category,key[,value]},
+        reviewed, modified, all
+        """
+        candidates = None
+
+        def _narrow(ids):
+            nonlocal candidates
+            candidates = set(ids) if candidates is None else candidates & set(ids)
+
+        if selector.get('ids') is not None:
+            _narrow(gid for gid in selector['ids'] if gid in self.positions)
+        if selector.get('uids') is not None:
+            _narrow(self.by_uid[uid] for uid in selector['uids'] if uid in self.by_uid)
+        tags = selector.get('tags') or ([selector['tag']] if selector.get('tag') else None)
+        if tags:
+            _narrow(set().union(*(self.by_tag.get(tag, set()) for tag in tags)))
+        if selector.get('category') is not None:
+            _narrow(self.by_category.get(selector['category'], set()))
+        attribute = selector.get('attribute')
+        if attribute:
+            if attribute.get('value') is not None:
+                _narrow(self.by_attr.get((attribute.get('category'), attribute.get('key'), attribute['value']), set()))
+            else:
+                _narrow(self.by_attr_key.get((attribute.get('category'), attribute.get('key')), set()))
+        if selector.get('reviewed') is not None:
+            _narrow(self.reviewed if selector['reviewed'] else set(self.positions) - self.reviewed)
+        if selector.get('modified') is not None:
+            _narrow(self.modified if selector['modified'] else set(self.positions) - self.modified)
+
+        if candidates is None:
+            # 空选择器默认不匹配任何组，必须显式指定all才作用于全部
+            return set(self.positions) if selector.get('all') else set()
+        return candidates
+
+
+def group_categories(group):
+    """返回组的主类别列表（primary_category可能是字符串或多类别列表）"""
+    category = group.get('primary_category', '')
+    if isinstance(category, list):
+        return category
+    return [category]
+
+
+def confidence_pairs(group):
+    """解析置信度列表（如 "聊天陪伴类@0.7"）为 [(类别, 分值)]，按分值从高到低返回"""
+    pairs = []
+    for item in group.get('confidence') or []:
+        try:
+            category, score = str(item).rsplit('@', 1)
+            pairs.append((category, float(score)))
+        except ValueError:
+            continue
+    return sorted(pairs, key=lambda pair: pair[1], reverse=True)
+
+
+def confidence_scores(group):
+    """按分值从高到低返回置信度分值"""
+    return [score for _, score in confidence_pairs(group)]
+
+
+def label_disagrees(group):
+    """人工标注与模型主类别是否不一致（无人工标注视为一致）"""
+    human_label = (group.get('task') or {}).get('human_label')
+    return bool(human_label) and human_label not in group_categories(group)
+
+
+def _discard(table, key, gid):
+    ids = table.get(key)
+    if ids is not None:
+        ids.discard(gid)
+        if not ids:
+            del table[key]
+
+
+# ========== 缓存 ==========
+_index = None
+_index_lock = threading.RLock()
+
+
+def get_index(data):
+    """获取与data代次一致的索引，不一致时全量重建"""
+    global _index
+    generation = data.get(GENERATION_KEY, 0)
+    with _index_lock:
+        if _index is None or _index.generation != generation:
+            _index = GroupIndex(data.get('groups', []), generation)
+        return _index
+
+
+def update_index(data, old_generation, changes):
+    """保存后增量更新索引；索引不是基于old_generation时丢弃，下次查询重建"""
+    global _index
+    with _index_lock:
+        if _index is None or _index.generation != old_generation:
+            _index = None
+            return
+        _index.apply(data.get('groups', []), changes)
+        _index.generation = data.get(GENERATION_KEY, 0)
+
+
+def peek_index():
+    """返回当前缓存的索引（可能已过期，由调用方校验），没有则返回None"""
+    return _index
+
+
+def invalidate_index():
+    """丢弃缓存索引"""
+    global _index
+    with _index_lock:
+        _index = None
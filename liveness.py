@@ -0,0 +1,428 @@
+# -*- coding: utf-8 -*-
+"""
+图片可用性检查模块
+功能：后台并发检查远程图片（task.cover_url/live_url快照）是否仍可访问：复用连接池的会话发送HEAD
+（不支持时改用Range GET），按主机限制并发；结果按图片URL缓存并带有效期，持久化到 data/liveness.json，
+据此筛选或降低图片已失效的组的优先级
+"""
+
+import collections
+import hashlib
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import portalocker
+import requests
+from requests.adapters import HTTPAdapter
+
+import codec
+import metrics
+from indexes import register_component
+from media import REMOTE_CACHE_FOLDER
+
+# ========== 配置 ==========
+LIVENESS_FILE = 'data/liveness.json'
+CHECK_WORKERS = int(os.environ.get('LIVENESS_WORKERS', 16))
+PER_HOST_CONCURRENCY = 4   # 同一主机同时进行的检查数上限
+CHECK_TIMEOUT = (3, 5)     # (连接, 读取) 超时秒数
+HOST_FAILURE_LIMIT = 3     # 同一主机连续连接失败达到该次数后，本轮其余URL直接判为失效（临时IP已下线）
+SAVE_EVERY = 200           # 每检查该数量的URL持久化一次结果
+
+# 结果有效期（秒）：过期后再次提交时重新检查；筛选时仍使用最近一次结果
+RESULT_TTL = {
+    'alive': 6 * 3600,
+    'dead': 24 * 3600,   # 过期的临时地址很少恢复
+    'error': 15 * 60     # 超时、5xx、限流等暂时性错误，较快重试
+}
+
+# HEAD返回这些状态码时改用Range GET（部分CDN/对象存储不支持HEAD）
+HEAD_FALLBACK_STATUSES = {400, 403, 405, 501}
+# 组的图片状态
+GROUP_STATUSES = ('alive', 'partial', 'dead', 'unknown')
+
+CHECKS = metrics.counter('liveness_checks_total', '远程图片可用性检查次数，按结果分类')
+
+
+# ========== 单个URL ==========
+def make_session(pool_size=CHECK_WORKERS):
+    """连接池大小与并发数一致的会话（同一主机的连接可复用）"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def classify(status_code, content_type):
+    """HTTP响应 -> alive/dead/error"""
+    if 200 <= status_code < 300:
+        # 过期的签名地址有时返回200的错误页面
+        return 'dead' if (content_type or '').startswith('text/html') else 'alive'
+    if status_code == 429 or status_code >= 500:
+        return 'error'
+    return 'dead'
+
+
+def probe(session, url, timeout=CHECK_TIMEOUT):
+    """检查单个URL，返回结果 {'state', 'http_status', 'error', 'checked_at'}"""
+    result = {'state': 'error', 'http_status': None, 'error': None, 'checked_at': time.time()}
+    try:
+        resp = session.head(url, timeout=timeout, allow_redirects=True, verify=False)
+        if resp.status_code in HEAD_FALLBACK_STATUSES:
+            # 只请求第一个字节，不读取响应体
+            with session.get(url, headers={'Range': 'bytes=0-0'}, timeout=timeout, stream=True,
+                             verify=False) as resp:
+                pass
+        result['http_status'] = resp.status_code
+        result['state'] = classify(resp.status_code, resp.headers.get('Content-Type'))
+    except (requests.exceptions.ConnectionError, requests.exceptions.InvalidURL,
+            requests.exceptions.MissingSchema, requests.exceptions.InvalidSchema) as e:
+        # 连接被拒、DNS失败、连接超时：临时主机已下线（ConnectTimeout是ConnectionError的子类）
+        result['state'] = 'dead'
+        result['error'] = type(e).__name__
+    except (requests.RequestException, ValueError) as e:
+        result['error'] = type(e).__name__
+    return result
+
+
+def is_expired(result, now=None):
+    now = time.time() if now is None else now
+    return result is None or now - result['checked_at'] >= RESULT_TTL[result['state']]
+
+
+def url_host(url):
+    try:
+        return urlsplit(url).netloc.lower()
+    except ValueError:
+        return ''
+
+
+def interleave_by_host(urls):
+    """按主机轮流排列URL，避免同一主机的URL集中占满工作线程"""
+    by_host = collections.OrderedDict()
+    for url in urls:
+        by_host.setdefault(url_host(url), []).append(url)
+    return [url for batch in itertools.zip_longest(*by_host.values()) for url in batch if url is not None]
+
+
+# ========== 结果存储 ==========
+class LivenessStore:
+    """URL -> 最近一次检查结果；多进程共享同一文件，保存时与文件中较新的结果合并"""
+
+    def __init__(self, path=LIVENESS_FILE):
+        self.path = path
+        self.results = {}
+        self.version = 0       # 结果变化时递增，供状态缓存判断是否过期
+        self._file_mtime = None
+        self._dirty = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """数据文件被其他进程更新后重新加载"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._file_mtime:
+            return
+        loaded = self._read()
+        with self._lock:
+            self._file_mtime = mtime
+            self._merge(loaded)
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as f:
+                portalocker.lock(f, portalocker.LOCK_SH)
+                content = f.read()
+                portalocker.unlock(f)
+            return codec.loads(content) if content else {}
+        except (FileNotFoundError, *codec.DecodeError):
+            return {}
+
+    def _merge(self, results):
+        """并入较新的结果（调用方持有锁）"""
+        changed = False
+        for url, result in results.items():
+            current = self.results.get(url)
+            if current is None or current['checked_at'] < result['checked_at']:
+                self.results[url] = result
+                changed = True
+        if changed:
+            self.version += 1
+
+    def get(self, url):
+        return self.results.get(url)
+
+    def put(self, url, result):
+        with self._lock:
+            self.results[url] = result
+            self._dirty[url] = result
+            self.version += 1
+
+    def save(self):
+        """将本进程的新结果合并写入文件（加锁后读取-合并-写入）"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+        try:
+            with open(os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o666), 'r+b') as f:
+                portalocker.lock(f, portalocker.LOCK_EX)
+                content = f.read()
+                stored = codec.loads(content) if content else {}
+                for url, result in dirty.items():
+                    if url not in stored or stored[url]['checked_at'] < result['checked_at']:
+                        stored[url] = result
+                f.seek(0)
+                f.truncate()
+                f.write(codec.dumps(stored))
+                f.flush()
+                mtime = os.fstat(f.fileno()).st_mtime_ns
+                portalocker.unlock(f)
+        except portalocker.LockException:
+            with self._lock:
+                self._dirty = {**dirty, **self._dirty}
+            return
+        with self._lock:
+            self._file_mtime = mtime
+            self._merge(stored)
+
+    def counts(self):
+        with self._lock:
+            return dict(collections.Counter(result['state'] for result in self.results.values()))
+
+
+store = LivenessStore()
+
+
+# ========== 后台检查 ==========
+class LivenessChecker:
+    """后台检查任务：提交的URL按主机轮流排队，由线程池并发检查，同一主机受信号量限制"""
+
+    def __init__(self, store, workers=CHECK_WORKERS, per_host=PER_HOST_CONCURRENCY, session=None):
+        self.store = store
+        self.workers = workers
+        self.per_host = per_host
+        self.session = session
+        self._queue = collections.deque()
+        self._queued = set()
+        self._host_slots = {}
+        self._host_failures = collections.Counter()
+        self._progress = collections.Counter()
+        self._started_at = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, urls, force=False):
+        """提交待检查的URL（未过期的结果跳过，force=True时全部重新检查），返回新排队的数量"""
+        now = time.time()
+        urls = [url for url in dict.fromkeys(urls)
+                if url and (force or is_expired(self.store.get(url), now))]
+        with self._lock:
+            urls = [url for url in urls if url not in self._queued]
+            self._queue.extend(interleave_by_host(urls))
+            self._queued.update(urls)
+            if urls and self._thread is None:
+                self._progress = collections.Counter()
+                self._host_failures = collections.Counter()
+                self._started_at = time.time()
+                self._thread = threading.Thread(target=self._run, name='liveness-checker', daemon=True)
+                self._thread.start()
+        return len(urls)
+
+    def status(self):
+        with self._lock:
+            return {'running': self._thread is not None,
+                    'queued': len(self._queue), 'checked': sum(self._progress.values()),
+                    'results': dict(self._progress), 'started_at': self._started_at}
+
+    def _next_url(self):
+        with self._lock:
+            if not self._queue:
+                return None
+            return self._queue.popleft()
+
+    def _run(self):
+        session = self.session or make_session(self.workers)
+        unsaved = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='liveness') as executor:
+            in_flight = set()
+            while True:
+                # 线程池中最多保持workers个任务，其余留在队列中（保持按主机轮流，且可随时追加）
+                while len(in_flight) < self.workers:
+                    url = self._next_url()
+                    if url is None:
+                        break
+                    in_flight.add(executor.submit(self._check, session, url))
+                if not in_flight:
+                    self.store.save()
+                    with self._lock:
+                        if not self._queue:
+                            self._thread = None  # 在锁内结束，submit据此判断是否需要启动新线程
+                            return
+                    continue
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                unsaved += len(done)
+                if unsaved >= SAVE_EVERY:
+                    self.store.save()
+                    unsaved = 0
+
+    def _check(self, session, url):
+        host = url_host(url)
+        with self._lock:
+            slots = self._host_slots.setdefault(host, threading.BoundedSemaphore(self.per_host))
+        with slots:
+            if self._host_failures[host] >= HOST_FAILURE_LIMIT:
+                result = {'state': 'dead', 'http_status': None, 'error': 'host unreachable',
+                          'checked_at': time.time()}
+            else:
+                result = probe(session, url)
+                with self._lock:
+                    if result['http_status'] is None and result['state'] == 'dead':
+                        self._host_failures[host] += 1
+                    else:
+                        self._host_failures[host] = 0
+        self.store.put(url, result)
+        CHECKS.inc(result=result['state'])
+        with self._lock:
+            self._queued.discard(url)
+            self._progress[result['state']] += 1
+
+
+checker = LivenessChecker(store)
+
+
+# ========== 组状态 ==========
+def remote_urls(group):
+    """组中远程图片的URL（本地文件图片不参与检查）"""
+    return tuple(img['url'] for img in group.get('images', []) if img.get('url') and not img.get('filename'))
+
+
+def cached_url_hashes():
+    """已缓存到本地的远程图片（按URL的sha1命名），远程失效后仍可查看"""
+    try:
+        return set(os.listdir(REMOTE_CACHE_FOLDER))
+    except FileNotFoundError:
+        return set()
+
+
+def url_state(url, cached):
+    """单张图片的可用状态：alive/dead/unknown（本地已缓存视为可用）"""
+    if hashlib.sha1(url.encode('utf-8')).hexdigest() in cached:
+        return 'alive'
+    result = store.get(url)
+    if result is None or result['state'] == 'error':
+        return 'unknown'
+    return result['state']
+
+
+def combine_states(states):
+    """各图片状态 -> 组状态：全部可用alive，全部失效dead，部分失效partial，其余unknown"""
+    if not states or all(state == 'alive' for state in states):
+        return 'alive'
+    if all(state == 'dead' for state in states):
+        return 'dead'
+    if 'dead' in states:
+        return 'partial'
+    return 'unknown'
+
+
+class ImageUrlIndex:
+    """组ID -> 远程图片URL（索引组件），按需计算各组的图片状态并缓存"""
+
+    def __init__(self):
+        self.urls = {}
+        self.url_refs = {}  # URL -> 引用它的组数
+        self.version = 0
+        self._statuses = None
+        self._statuses_key = None
+        self._lock = threading.Lock()
+
+    def build(self, groups):
+        urls, url_refs = {}, {}
+        for group in groups:
+            group_urls = remote_urls(group)
+            if group_urls:
+                urls[group['id']] = group_urls
+                for url in group_urls:
+                    url_refs[url] = url_refs.get(url, 0) + 1
+        with self._lock:
+            self.urls, self.url_refs = urls, url_refs
+            self.version += 1
+
+    def add(self, group):
+        urls = remote_urls(group)
+        with self._lock:
+            if urls:
+                self.urls[group['id']] = urls
+                for url in urls:
+                    self.url_refs[url] = self.url_refs.get(url, 0) + 1
+            self.version += 1
+
+    def remove(self, group):
+        with self._lock:
+            for url in self.urls.pop(group['id'], ()):
+                if self.url_refs.get(url, 0) <= 1:
+                    self.url_refs.pop(url, None)
+                else:
+                    self.url_refs[url] -= 1
+            self.version += 1
+
+    def has_url(self, url):
+        """URL是否为某个组中的远程图片"""
+        with self._lock:
+            return url in self.url_refs
+
+    def all_urls(self, group_ids=None):
+        with self._lock:
+            if group_ids is None:
+                return [url for urls in self.urls.values() for url in urls]
+            return [url for gid in group_ids for url in self.urls.get(gid, ())]
+
+    def statuses(self):
+        """组ID -> 组状态（只含有远程图片的组；检查结果、索引或本地缓存变化后重新计算）"""
+        store.refresh()
+        try:
+            cache_mtime = os.stat(REMOTE_CACHE_FOLDER).st_mtime_ns
+        except FileNotFoundError:
+            cache_mtime = None
+        with self._lock:
+            key = (self.version, store.version, cache_mtime)
+            if self._statuses_key != key:
+                cached = cached_url_hashes()
+                self._statuses = {gid: combine_states([url_state(url, cached) for url in urls])
+                                  for gid, urls in self.urls.items()}
+                self._statuses_key = key
+            return self._statuses
+
+    def status(self, group_id):
+        """单个组的状态，没有远程图片的组为alive"""
+        return self.statuses().get(group_id, 'alive')
+
+    def filter(self, group_ids, allowed):
+        """保留图片状态在allowed中的组ID"""
+        statuses = self.statuses()
+        return {gid for gid in group_ids if statuses.get(gid, 'alive') in allowed}
+
+    def dead(self):
+        return {gid for gid, status in self.statuses().items() if status == 'dead'}
+
+
+register_component('liveness', ImageUrlIndex)
+
+
+def parse_statuses(value):
+    """解析逗号分隔的组状态列表，未提供返回None；包含未知状态时抛出ValueError"""
+    if not value:
+        return None
+    statuses = {status.strip() for status in value.split(',') if status.strip()}
+    unknown = statuses - set(GROUP_STATUSES)
+    if unknown:
+        raise ValueError(f'Unknown image status: {", ".join(sorted(unknown))} '
+                         f'(expected {", ".join(GROUP_STATUSES)})')
+    return statuses
@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+"""
+图片处理模块
+功能：内容哈希与去重索引、缩略图生成（内容寻址缓存）、远程快照缓存
+"""
+
+import collections
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from urllib.parse import urlencode
+
+import portalocker
+import requests
+
+import codec
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow为可选依赖，缺失时直接返回原图
+    Image = None
+
+# ========== 配置 ==========
+THUMB_FOLDER = 'static/thumbs'
+REMOTE_CACHE_FOLDER = 'data/remote_cache'
+HASH_INDEX_FILE = 'data/image_hashes.json'
+
+THUMB_WIDTHS = (240, 480)  # 列表卡片宽度及其2倍（高分屏）
+THUMB_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+THUMB_QUALITY = {'webp': 75, 'jpeg': 80}
+THUMB_WORKERS = int(os.environ.get('THUMB_WORKERS', min(4, os.cpu_count() or 1)))
+THUMB_WAIT_SECONDS = 10
+
+HASH_CHUNK_SIZE = 1024 * 1024
+LOCAL_HASH_CACHE_SIZE = 20000  # 本地文件哈希缓存条数（按路径，最近最少使用的先淘汰）
+REMOTE_FETCH_TIMEOUT = 15
+REMOTE_MAX_BYTES = 20 * 1024 * 1024
+
+# 缓存目录的保留上限：总大小超出时从最久未使用的文件开始删除（命中时刷新修改时间作为使用时间）
+THUMB_CACHE_MAX_BYTES = int(os.environ.get('THUMB_CACHE_MAX_MB', 1024)) * 1024 * 1024
+THUMB_CACHE_MAX_AGE = int(os.environ.get('THUMB_CACHE_MAX_AGE_DAYS', 30)) * 86400  # 缩略图可重新生成，久未使用即删除
+# 远程快照地址会过期，缓存可能是唯一副本，只按总大小淘汰
+REMOTE_CACHE_MAX_BYTES = int(os.environ.get('REMOTE_CACHE_MAX_MB', 4096)) * 1024 * 1024
+CACHE_PRUNE_INTERVAL = 600  # 两次清理的最短间隔（秒），写入新缓存后在后台线程中清理
+CACHE_TOUCH_INTERVAL = 3600  # 命中时刷新修改时间的最短间隔（秒）
+STALE_TMP_SECONDS = 3600  # 进程中断遗留的临时文件超过该时长后删除
+
+os.makedirs(THUMB_FOLDER, exist_ok=True)
+os.makedirs(REMOTE_CACHE_FOLDER, exist_ok=True)
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = {}  # content_hash -> Future，避免同一图片重复提交
+_pending_lock = threading.Lock()
+_local_hash_cache = collections.OrderedDict()  # 路径 -> (mtime_ns, 大小, sha256)，按最近使用排列
+_local_hash_lock = threading.Lock()
+_last_prune = 0.0
+_prune_lock = threading.Lock()
+
+
+# ========== 内容哈希 ==========
+def stream_sha256(fileobj):
+    """流式计算文件对象的SHA256（不整体读入内存）"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_content_hash(value):
+    """检查是否为合法的SHA256十六进制串（防止拼接路径时目录遍历）"""
+    return isinstance(value, str) and len(value) == 64 and all(c in '0123456789abcdef' for c in value)
+
+
+def file_sha256(path):
+    """计算本地文件的SHA256；按路径缓存，修改时间与大小不变时复用，超过LOCAL_HASH_CACHE_SIZE条时淘汰最久未用的"""
+    st = os.stat(path)
+    with _local_hash_lock:
+        cached = _local_hash_cache.get(path)
+        if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+            _local_hash_cache.move_to_end(path)
+            return cached[2]
+    with open(path, 'rb') as f:
+        content_hash = stream_sha256(f)
+    with _local_hash_lock:
+        _local_hash_cache[path] = (st.st_mtime_ns, st.st_size, content_hash)
+        _local_hash_cache.move_to_end(path)
+        while len(_local_hash_cache) > LOCAL_HASH_CACHE_SIZE:
+            _local_hash_cache.popitem(last=False)
+    return content_hash
+
+
+def save_stream_hashed(stream, dest_dir):
+    """将上传流边写盘边计算SHA256，返回(临时文件路径, 哈希)
+
+    调用方根据哈希决定重命名为正式文件或作为重复文件丢弃
+    """
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=dest_dir, prefix='.upload-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                f.write(chunk)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest()
+
+
+# ========== 哈希索引 ==========
+def load_hash_index():
+    """加载图片内容哈希索引
+
+    by_hash: 哈希 -> 规范文件名（该内容首次入库时的文件）
+    by_name: 文件名 -> 哈希（包括被链接到规范文件的重复文件）
+    """
+    try:
+        with open(HASH_INDEX_FILE, 'rb') as f:
+            portalocker.lock(f, portalocker.LOCK_SH)
+            content = f.read()
+            portalocker.unlock(f)
+        index = codec.loads(content) if content else {}
+    except FileNotFoundError:
+        index = {}
+    except codec.DecodeError as e:
+        print(f"[WARN] Image hash index {HASH_INDEX_FILE} is unreadable, rebuilding from scratch: {e}")
+        index = {}
+    except portalocker.LockException:
+        time.sleep(0.1)
+        return load_hash_index()
+    index.setdefault('by_hash', {})
+    index.setdefault('by_name', {})
+    return index
+
+
+def save_hash_index(index):
+    """保存图片内容哈希索引"""
+    try:
+        # 加锁后才清空文件（以'w'打开会在加锁前截断，并发读者可能读到空文件）
+        with open(os.open(HASH_INDEX_FILE, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o666), 'r+b') as f:
+            portalocker.lock(f, portalocker.LOCK_EX)
+            f.truncate()
+            f.write(codec.dumps(index))
+            portalocker.unlock(f)
+    except portalocker.LockException:
+        time.sleep(0.1)
+        save_hash_index(index)
+
+
+def register_image_hash(index, filename, content_hash):
+    """登记图片哈希，返回该内容的规范文件名
+
+    返回值与filename不同时，说明该文件是已有图片的重复副本
+    """
+    canonical = index['by_hash'].setdefault(content_hash, filename)
+    index['by_name'][filename] = content_hash
+    return canonical
+
+
+def is_linked_duplicate(index, filename):
+    """文件是否已被登记为其他图片的重复副本"""
+    content_hash = index['by_name'].get(filename)
+    return content_hash is not None and index['by_hash'].get(content_hash) != filename
+
+
+# ========== 缩略图生成 ==========
+def thumb_path(content_hash, width, fmt):
+    """缩略图的内容寻址存储路径：thumbs/<前2位>/<哈希>_<宽度>.<格式>"""
+    return os.path.join(THUMB_FOLDER, content_hash[:2], f'{content_hash}_{width}.{fmt}')
+
+
+def generate_thumbnails(src_path, content_hash):
+    """为源图生成全部尺寸/格式的缩略图（在进程池中执行）
+
+    已存在的变体会被跳过，返回生成的文件数
+    """
+    if Image is None:
+        return 0
+
+    targets = [(w, fmt) for w in THUMB_WIDTHS for fmt in THUMB_FORMATS
+               if not os.path.exists(thumb_path(content_hash, w, fmt))]
+    if not targets:
+        return 0
+
+    os.makedirs(os.path.join(THUMB_FOLDER, content_hash[:2]), exist_ok=True)
+    generated = 0
+    with Image.open(src_path) as img:
+        img.draft('RGB', (max(THUMB_WIDTHS), max(THUMB_WIDTHS) * 4))  # JPEG解码时直接降采样
+        img = img.convert('RGB')
+        for width, fmt in targets:
+            variant = img.copy()
+            variant.thumbnail((width, width * 4))
+            out_path = thumb_path(content_hash, width, fmt)
+            tmp_path = f'{out_path}.{os.getpid()}.tmp'
+            variant.save(tmp_path, THUMB_FORMATS[fmt], quality=THUMB_QUALITY[fmt], optimize=True)
+            os.replace(tmp_path, out_path)  # 原子替换，避免读到半成品
+            generated += 1
+    return generated
+
+
+def _get_executor():
+    """懒加载进程池（gunicorn预加载模式下需在fork之后创建）
+
+    多线程worker中其他线程可能正持有锁，子进程以spawn方式启动，不继承fork时的锁状态
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=THUMB_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def submit_thumbnails(src_path, content_hash):
+    """提交缩略图生成任务到进程池，同一哈希只提交一次"""
+    if Image is None:
+        return None
+    with _pending_lock:
+        future = _pending.get(content_hash)
+        if future is not None:
+            return future
+        future = _get_executor().submit(generate_thumbnails, src_path, content_hash)
+        _pending[content_hash] = future
+
+    def _done(_):
+        with _pending_lock:
+            _pending.pop(content_hash, None)
+
+    future.add_done_callback(_done)
+    return future
+
+
+def ensure_thumbnail(src_path, content_hash, width, fmt):
+    """确保缩略图存在，必要时同步等待进程池生成；失败返回None"""
+    path = thumb_path(content_hash, width, fmt)
+    if _cache_hit(path):
+        return path
+    future = submit_thumbnails(src_path, content_hash)
+    if future is None:
+        return None
+    try:
+        future.result(timeout=THUMB_WAIT_SECONDS)
+    except FutureTimeoutError:
+        return None
+    except Exception as e:
+        print(f"[ERROR] Thumbnail generation failed for {src_path}: {e}")
+        return None
+    schedule_cache_prune()
+    return path if os.path.exists(path) else None
+
+
+# ========== 远程快照缓存 ==========
+def remote_cache_path(url):
+    """远程图片在本地缓存中的路径（按URL哈希命名）"""
+    return os.path.join(REMOTE_CACHE_FOLDER, hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+
+def fetch_remote_snapshot(url):
+    """下载远程图片到本地缓存（流式写盘），已缓存则直接返回路径
+
+    远程快照地址会过期，首次成功拉取后即以缓存为准；调用方需确认url是已入库的组图片
+    """
+    path = remote_cache_path(url)
+    if _cache_hit(path):
+        return path
+
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with requests.get(url, stream=True, timeout=REMOTE_FETCH_TIMEOUT) as resp:
+            resp.raise_for_status()
+            received = 0
+            with open(tmp_path, 'wb') as f:
+                for chunk in resp.iter_content(HASH_CHUNK_SIZE):
+                    received += len(chunk)
+                    if received > REMOTE_MAX_BYTES:
+                        raise ValueError('remote image too large')
+                    f.write(chunk)
+        os.replace(tmp_path, path)
+        schedule_cache_prune()
+        return path
+    except Exception as e:
+        print(f"[ERROR] Failed to fetch remote image {url}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+
+# ========== 缓存清理 ==========
+def _cache_hit(path):
+    """缓存文件是否存在；存在时刷新其修改时间，清理时按修改时间判断最近使用"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    if time.time() - st.st_mtime > CACHE_TOUCH_INTERVAL:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+    return True
+
+
+def prune_cache(folder, max_bytes, max_age=None):
+    """清理缓存目录：删除超过max_age秒未使用的文件，总大小仍超过max_bytes时从最久未使用的开始删除
+
+    返回(删除的文件数, 释放的字节数)；写入中的临时文件不计入，遗留超过STALE_TMP_SECONDS的直接删除
+    """
+    now = time.time()
+    files = []
+    removed = freed = 0
+    for root, _, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if name.endswith('.tmp'):
+                if now - st.st_mtime > STALE_TMP_SECONDS and _remove(path):
+                    removed, freed = removed + 1, freed + st.st_size
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    for mtime, size, path in files:
+        if total <= max_bytes and (max_age is None or now - mtime <= max_age):
+            break  # 按使用时间升序，之后的文件都更新
+        total -= size
+        if _remove(path):
+            removed, freed = removed + 1, freed + size
+    return removed, freed
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def prune_caches():
+    """按保留上限清理缩略图与远程快照缓存"""
+    for folder, max_bytes, max_age in ((THUMB_FOLDER, THUMB_CACHE_MAX_BYTES, THUMB_CACHE_MAX_AGE),
+                                       (REMOTE_CACHE_FOLDER, REMOTE_CACHE_MAX_BYTES, None)):
+        try:
+            removed, freed = prune_cache(folder, max_bytes, max_age)
+        except OSError as e:
+            print(f"[ERROR] Failed to prune {folder}: {e}")
+            continue
+        if removed:
+            print(f"[OK] Pruned {removed} cached files ({freed / 1024 / 1024:.1f} MB) from {folder}")
+
+
+def schedule_cache_prune():
+    """写入新缓存后调用：距上次清理超过CACHE_PRUNE_INTERVAL时在后台线程中清理"""
+    global _last_prune
+    with _prune_lock:
+        now = time.time()
+        if now - _last_prune < CACHE_PRUNE_INTERVAL:
+            return
+        _last_prune = now
+    threading.Thread(target=prune_caches, name='cache-prune', daemon=True).start()
+
+
+# ========== 响应辅助 ==========
+def image_source(img):
+    """返回图片的(源标识, 原图地址)：本地图片用文件名，远程图片用URL"""
+    if img.get('filename'):
+        return img['filename'], f"/static/images/{img['filename']}"
+    return img.get('url'), img.get('url')
+
+
+def thumbnail_urls(img):
+    """构建单张图片的缩略图URL（含srcset），供列表视图使用"""
+    src, original = image_source(img)
+    if not src:
+        return {}
+
+    def _url(width, fmt):
+        params = {'src': src, 'w': width, 'fmt': fmt}
+        if img.get('sha256'):
+            params['h'] = img['sha256']
+        return '/api/thumbnail?' + urlencode(params)
+
+    small, large = THUMB_WIDTHS[0], THUMB_WIDTHS[-1]
+    return {
+        'thumb_url': _url(small, 'jpeg'),
+        'thumb_srcset': f"{_url(small, 'webp')} 1x, {_url(large, 'webp')} 2x",
+        'thumb_srcset_jpeg': f"{_url(small, 'jpeg')} 1x, {_url(large, 'jpeg')} 2x",
+        'original_url': original
+    }
+
+
+def with_thumbnails(group):
+    """返回附带缩略图URL的组副本（不修改存储数据）"""
+    annotated = dict(group)
+    annotated['images'] = [{**img, **thumbnail_urls(img)} for img in group.get('images', [])]
+    return annotated
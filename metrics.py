@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+运行指标模块
+功能：进程内计数器/直方图，按Prometheus文本格式输出；每个worker定期将自身指标写入独立文件，
+/metrics 汇总所有进程的文件，gunicorn多worker下同样适用
+"""
+
+import math
+import os
+import threading
+import time
+
+import codec
+
+# ========== 配置 ==========
+METRICS_FOLDER = 'data/metrics'
+FLUSH_INTERVAL = 5  # 秒，请求结束时最多每隔该时间将本进程指标写盘一次
+ARCHIVE_FILE = 'archived.json'  # 已退出进程的指标合并到此文件，避免worker重启后文件无限增多
+
+# 直方图默认分桶（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+os.makedirs(METRICS_FOLDER, exist_ok=True)
+
+
+# ========== 指标类型 ==========
+class Counter:
+    """单调递增计数器"""
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}  # 标签元组 -> 数值
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def state(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self.values.items()]
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+
+class Histogram:
+    """分桶直方图：各桶计数（非累计存储，输出时累加）、总和与次数"""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.values = {}  # 标签元组 -> [各桶计数..., +Inf桶计数, 总和, 次数]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        slot = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [0] * (len(self.buckets) + 3)
+            entry[slot] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def time(self, **labels):
+        """计时上下文：with histogram.time(op='x'): ..."""
+        return _Timer(self, labels)
+
+    def state(self):
+        with self._lock:
+            return [[list(key), list(entry)] for key, entry in self.values.items()]
+
+    @staticmethod
+    def merge(total, value):
+        return value if total is None else [a + b for a, b in zip(total, value)]
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+# ========== 注册表 ==========
+_registry = {}
+
+
+def counter(name, help_text):
+    """注册（或取回同名）计数器"""
+    return _registry.setdefault(name, Counter(name, help_text))
+
+
+def histogram(name, help_text, buckets=LATENCY_BUCKETS):
+    """注册（或取回同名）直方图"""
+    return _registry.setdefault(name, Histogram(name, help_text, buckets))
+
+
+# 请求
+REQUEST_DURATION = histogram('http_request_duration_seconds', '按Flask端点统计的请求处理耗时')
+REQUESTS = counter('http_requests_total', '按端点、方法与状态码统计的请求数')
+
+# 存储
+DATA_LOAD_DURATION = histogram('data_load_duration_seconds', 'load_data耗时（含等锁）')
+DATA_LOAD_BYTES = counter('data_load_bytes_total', 'load_data读取的字节数')
+DATA_SAVE_DURATION = histogram('data_save_duration_seconds', 'save_data耗时（含等锁）')
+DATA_SAVE_BYTES = counter('data_save_bytes_total', 'save_data写入的字节数')
+LOCK_WAIT = histogram('data_lock_wait_seconds', '数据文件portalocker加锁等待时间')
+LOCK_RETRIES = counter('data_lock_retries_total', '加锁失败（LockException）后的重试次数')
+
+# 导入导出与缓存
+IMPORT_RECORDS = counter('import_records_total', '导入处理的记录数，按结果分类')
+IMPORT_DURATION = histogram('import_duration_seconds', '单次导入耗时')
+EXPORT_BYTES = counter('export_bytes_total', '导出响应字节数，按格式分类')
+CACHE_REQUESTS = counter('cache_requests_total', '缓存查询次数，按缓存与命中结果分类')
+
+
+def cache_result(cache, hit):
+    """记录一次缓存查询"""
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+# ========== 跨进程汇总 ==========
+_last_flush = 0.0
+_flush_lock = threading.Lock()
+
+
+def snapshot_state():
+    """本进程所有指标的可序列化状态"""
+    return {name: {'kind': metric.kind, 'help': metric.help, 'buckets': getattr(metric, 'buckets', None),
+                   'samples': metric.state()}
+            for name, metric in _registry.items()}
+
+
+def _process_file(pid):
+    return os.path.join(METRICS_FOLDER, f'{pid}.json')
+
+
+def _write_state(path, state):
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(codec.dumps(state))
+    os.replace(tmp_path, path)
+
+
+def flush(force=False):
+    """将本进程指标写入 data/metrics/<pid>.json（非强制时受FLUSH_INTERVAL节流）"""
+    global _last_flush
+    now = time.monotonic()
+    if not force and now - _last_flush < FLUSH_INTERVAL:
+        return
+    with _flush_lock:
+        _last_flush = now
+        _write_state(_process_file(os.getpid()), snapshot_state())
+
+
+def _read_state(path):
+    try:
+        with open(path, 'rb') as f:
+            return codec.loads(f.read())
+    except (OSError, *codec.DecodeError):
+        return {}
+
+
+def _merge_into(total, state):
+    """按指标名与标签累加另一份状态"""
+    for name, metric in state.items():
+        target = total.setdefault(name, {'kind': metric['kind'], 'help': metric['help'],
+                                         'buckets': metric['buckets'], 'samples': {}})
+        merge = Histogram.merge if metric['kind'] == 'histogram' else Counter.merge
+        for labels, value in metric['samples']:
+            key = tuple(tuple(pair) for pair in labels)
+            target['samples'][key] = merge(target['samples'].get(key), value)
+    return total
+
+
+def _pid_alive(pid):
+    if os.name != 'posix':
+        return True  # Windows下os.kill(pid, 0)会结束进程，不做探测
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _archive_dead_processes(files):
+    """将已退出进程的指标并入归档文件（计数器保持单调），返回仍存活进程的文件列表"""
+    alive, dead = [], []
+    for name in files:
+        (alive if _pid_alive(int(name[:-5])) else dead).append(name)
+    if dead:
+        archive_path = os.path.join(METRICS_FOLDER, ARCHIVE_FILE)
+        merged = _merge_into({}, _read_state(archive_path))
+        for name in dead:
+            _merge_into(merged, _read_state(os.path.join(METRICS_FOLDER, name)))
+        _write_state(archive_path, {name: {**metric, 'samples': [[list(k), v] for k, v in metric['samples'].items()]}
+                                    for name, metric in merged.items()})
+        for name in dead:
+            try:
+                os.remove(os.path.join(METRICS_FOLDER, name))
+            except FileNotFoundError:
+                pass
+    return alive
+
+
+def collect():
+    """汇总所有进程（含已退出进程的归档）的指标"""
+    flush(force=True)
+    files = [name for name in os.listdir(METRICS_FOLDER) if name.endswith('.json') and name[:-5].isdigit()]
+    total = _merge_into({}, _read_state(os.path.join(METRICS_FOLDER, ARCHIVE_FILE)))
+    for name in _archive_dead_processes(files):
+        _merge_into(total, _read_state(os.path.join(METRICS_FOLDER, name)))
+    return total
+
+
+# ========== 文本格式 ==========
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs, extra=()):
+    pairs = list(pairs) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(total):
+    """按Prometheus文本格式（0.0.4）输出"""
+    lines = []
+    for name in sorted(total):
+        metric = total[name]
+        lines.append(f'# HELP {name} {metric["help"]}')
+        lines.append(f'# TYPE {name} {metric["kind"]}')
+        for key in sorted(metric['samples']):
+            value = metric['samples'][key]
+            if metric['kind'] == 'counter':
+                lines.append(f'{name}{_labels(key)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(list(metric['buckets']) + [math.inf], value[:-2]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(key, [("le", _number(bound))])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(key)} {_number(value[-2])}')
+            lines.append(f'{name}_count{_labels(key)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+分页响应缓存模块
+功能：按(页码, 每页数, 筛选条件, 排序, 字段投影)缓存已序列化的组列表，LRU淘汰并限制内存占用；
+提交修改时按变更精确失效：只丢弃包含被修改组的页，以及插入/删除使页边界移动的页
+"""
+
+import collections
+import math
+import threading
+
+from indexes import group_categories
+from priority import priority_key
+
+# ========== 配置 ==========
+PAGE_CACHE_MAX_BYTES = 32 * 1024 * 1024  # 每个进程缓存的序列化数据上限
+
+# 参与缓存键的筛选字段（与/api/groups的筛选参数一致）
+SELECTOR_FIELDS = ('tag', 'category', 'reviewed', 'modified')
+
+
+def selector_key(selector):
+    return tuple(selector.get(field) for field in SELECTOR_FIELDS)
+
+
+def group_matches(selector, group):
+    """组是否满足筛选条件（与GroupIndex.select对这些字段的语义一致）"""
+    if group is None:
+        return False
+    if selector.get('tag') is not None and selector['tag'] not in group.get('tags', []):
+        return False
+    if selector.get('category') is not None and selector['category'] not in group_categories(group):
+        return False
+    for flag in ('reviewed', 'modified'):
+        if selector.get(flag) is not None and bool(group.get(flag)) != selector[flag]:
+            return False
+    return True
+
+
+class PageEntry:
+    """一页缓存：序列化后的组数组及其覆盖的组ID与存储位置"""
+    __slots__ = ('payload', 'ids', 'last_pos', 'full', 'selector', 'sort')
+
+    def __init__(self, payload, ids, last_pos, full, selector, sort):
+        self.payload = payload
+        self.ids = ids
+        self.last_pos = last_pos  # 默认顺序下本页最后一个组的存储下标（优先级排序为None）
+        self.full = full          # 本页是否满页；不满的页延伸到列表末尾，任何增删都会影响它
+        self.selector = selector
+        self.sort = sort
+
+
+class PageCache:
+    """分页响应的LRU缓存
+
+    缓存只对应某一数据代次：本进程提交的修改通过apply精确失效并推进代次；
+    其他进程修改数据后代次对不上，整体清空
+    """
+
+    def __init__(self, max_bytes=PAGE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.generation = None
+        self.entries = collections.OrderedDict()  # 缓存键 -> PageEntry，按最近使用排列
+        self.by_group = {}                        # 组ID -> 包含该组的缓存键集合
+        self.totals = {}                          # 筛选条件键 -> 满足条件的组数
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    # ---------- 查询与写入 ----------
+    def get(self, key, generation):
+        """命中时返回 (序列化的组数组, 总组数)，否则返回None"""
+        with self._lock:
+            if generation is None or generation != self.generation:
+                return None
+            entry = self.entries.get(key)
+            total = self.totals.get(selector_key(entry.selector)) if entry is not None else None
+            if total is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry.payload, total
+
+    def put(self, key, generation, entry, total):
+        """缓存一页；generation为生成该页时读到的数据代次"""
+        if generation is None or len(entry.payload) > self.max_bytes:
+            return
+        with self._lock:
+            if self.generation is not None and generation < self.generation:
+                return  # 生成期间已有新的提交，结果已过期
+            if generation != self.generation:
+                self._clear()
+                self.generation = generation
+            self._drop(key)
+            self.entries[key] = entry
+            self.bytes += len(entry.payload)
+            for gid in entry.ids:
+                self.by_group.setdefault(gid, set()).add(key)
+            self.totals[selector_key(entry.selector)] = total
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+
+    # ---------- 失效 ----------
+    def apply(self, changes, old_generation, new_generation, positions, inserted=None):
+        """提交修改后精确失效
+
+        changes: [(before, after), ...]；positions: 修改前的 组ID -> 存储下标（不可用时传None，整体清空）
+        inserted: 新增组ID -> 修改后的存储下标（缺少时视为插在开头，该筛选条件下的页全部失效）
+        """
+        with self._lock:
+            if self.generation != old_generation or positions is None:
+                self._clear()
+                self.generation = new_generation
+                return
+            selectors = {selector_key(entry.selector): entry.selector for entry in self.entries.values()}
+            for skey, selector in selectors.items():
+                self._invalidate_selector(skey, selector, changes, positions, inserted or {})
+            self.generation = new_generation
+
+    def _invalidate_selector(self, skey, selector, changes, positions, inserted):
+        touched = set()            # 内容变化且仍在列表中的组
+        boundary = math.inf        # 默认顺序下成员变化的最小存储下标，此后的页整体移动
+        membership_changed = False
+        reordered = False          # 优先级排序下成员或排序键变化
+        for before, after in changes:
+            matched_before, matched_after = group_matches(selector, before), group_matches(selector, after)
+            if not matched_before and not matched_after:
+                continue
+            if matched_before and matched_after:
+                touched.add(after['id'])
+                reordered = reordered or priority_key(before) != priority_key(after)
+                continue
+            membership_changed = reordered = True
+            if skey in self.totals:
+                self.totals[skey] += 1 if matched_after else -1
+            if before is not None:
+                # 删除或不再满足条件：其原位置之后的组前移
+                boundary = min(boundary, positions.get(before['id'], -1))
+            else:
+                # 新增：其位置之后的组后移（撤销删除、回滚批次会把组插回列表中间；追加在末尾时只影响不满的页）
+                boundary = min(boundary, inserted.get(after['id'], -1))
+
+        stale = {key for gid in touched for key in self.by_group.get(gid, ())
+                 if selector_key(self.entries[key].selector) == skey}
+        if membership_changed or reordered:
+            for key, entry in self.entries.items():
+                if selector_key(entry.selector) != skey:
+                    continue
+                if entry.sort == 'priority':
+                    if reordered:
+                        stale.add(key)
+                elif membership_changed and (not entry.full or entry.last_pos >= boundary):
+                    stale.add(key)
+        for key in stale:
+            self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self.entries.clear()
+        self.by_group.clear()
+        self.totals.clear()
+        self.bytes = 0
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= len(entry.payload)
+        for gid in entry.ids:
+            keys = self.by_group.get(gid)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.by_group[gid]
+
+    def stats(self):
+        return {'entries': len(self.entries), 'bytes': self.bytes, 'max_bytes': self.max_bytes,
+                'generation': self.generation}
+
+
+page_cache = PageCache()
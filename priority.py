@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+审核优先级模块
+功能：为每个组预先计算主动学习优先级（模型不确定、与人工标注不一致、标签/属性自相矛盾的组优先），
+作为索引组件维护有序列表，导入和编辑时增量更新
+"""
+
+import bisect
+import threading
+
+from indexes import register_component, group_categories, confidence_pairs, label_disagrees
+
+# ========== 配置 ==========
+# 各项信号的权重，分数越高越优先审核
+PRIORITY_WEIGHTS = {
+    'uncertainty': 1.0,     # 1 - (最高置信度 - 次高置信度)，无置信度时视为1
+    'disagreement': 1.5,    # 人工标注与主类别不一致
+    'inconsistency': 0.25   # 每处标签/属性不一致
+}
+# 不一致项计数上限，避免字段很多的组压过其他信号
+MAX_INCONSISTENCIES = 4
+
+# 属性中表示模型无法判断的取值
+UNDECIDED_VALUES = ('无法判断',)
+
+
+def inconsistencies(group):
+    """统计组内标签/属性不一致的项数
+
+    包括：主类别为空、最高置信度类别不在主类别中、专属特征.常见Tag未出现在标签里、属性取值为“无法判断”
+    """
+    categories = [c for c in group_categories(group) if c]
+    count = 0 if categories else 1
+    pairs = confidence_pairs(group)
+    if pairs and categories and pairs[0][0] not in categories:
+        count += 1
+    attributes = group.get('attributes') or {}
+    tags = set(group.get('tags', []))
+    count += sum(1 for tag in (attributes.get('专属特征') or {}).get('常见Tag') or [] if tag not in tags)
+    count += sum(1 for attrs in attributes.values() for values in (attrs or {}).values()
+                 for value in values or [] if value in UNDECIDED_VALUES)
+    return count
+
+
+def priority_score(group):
+    """计算组的审核优先级分数（越高越值得优先审核）"""
+    scores = [score for _, score in confidence_pairs(group)]
+    if scores:
+        margin = scores[0] - (scores[1] if len(scores) > 1 else 0.0)
+        uncertainty = 1.0 - min(max(margin, 0.0), 1.0)
+    else:
+        uncertainty = 1.0
+    score = (PRIORITY_WEIGHTS['uncertainty'] * uncertainty
+             + PRIORITY_WEIGHTS['disagreement'] * (1 if label_disagrees(group) else 0)
+             + PRIORITY_WEIGHTS['inconsistency'] * min(inconsistencies(group), MAX_INCONSISTENCIES))
+    return round(score, 4)
+
+
+def priority_key(group):
+    """排序键：分数高者在前，同分按ID先进先出"""
+    return (-priority_score(group), group['id'])
+
+
+class PriorityIndex:
+    """按优先级排序的组ID列表（索引组件），全量建立时整体排序，增删为二分查找 + 列表插入，分页时直接切片"""
+
+    def __init__(self):
+        self.keys = {}      # 组ID -> 排序键
+        self.order = []     # 有序的 (排序键, 组ID)
+        self._lock = threading.Lock()
+
+    def build(self, groups):
+        keys = {group['id']: priority_key(group) for group in groups}
+        order = sorted((key, gid) for gid, key in keys.items())
+        with self._lock:
+            self.keys = keys
+            self.order = order
+
+    def add(self, group):
+        key = priority_key(group)
+        with self._lock:
+            self.keys[group['id']] = key
+            bisect.insort(self.order, (key, group['id']))
+
+    def remove(self, group):
+        with self._lock:
+            key = self.keys.pop(group['id'], None)
+            if key is None:
+                return
+            pos = bisect.bisect_left(self.order, (key, group['id']))
+            if pos < len(self.order) and self.order[pos] == (key, group['id']):
+                del self.order[pos]
+
+    def score(self, group_id):
+        key = self.keys.get(group_id)
+        return -key[0] if key else None
+
+    def ranked(self, start=0, stop=None):
+        """按优先级返回组ID切片"""
+        with self._lock:
+            return [gid for _, gid in self.order[start:stop]]
+
+    def sort(self, group_ids):
+        """将一组ID按优先级排序（用于筛选后的结果）"""
+        return sorted(group_ids, key=lambda gid: self.keys.get(gid, (0, gid)))
+
+    def __len__(self):
+        return len(self.order)
+
+
+register_component('priority', PriorityIndex)
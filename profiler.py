@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+请求剖析模块
+功能：按请求开启cProfile（请求头/查询参数），或对所有请求做低开销的栈采样、只保存超过耗时阈值的慢请求；
+结果写入 logs/profiles/（pstats或折叠栈格式），按数量上限滚动清理
+"""
+
+import collections
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+
+import codec
+
+# ========== 配置 ==========
+PROFILE_FOLDER = 'logs/profiles'
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY_ARG = '_profile'
+# 设置后，请求头/查询参数的值必须与之相同才会开启剖析（生产环境防止任意客户端触发）
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN') or None
+# 慢请求阈值（秒），设置后所有请求都做栈采样，超过阈值的保存为折叠栈；未设置时关闭
+SLOW_REQUEST_SECONDS = float(os.environ.get('PROFILE_SLOW_SECONDS') or 0) or None
+SAMPLE_INTERVAL = 0.005  # 采样间隔（秒）
+MAX_PROFILES = 200       # 保留的剖析文件数上限，超出时删除最旧的
+
+# 剖析类型 -> 文件扩展名
+PROFILE_KINDS = {'cprofile': 'pstats', 'sample': 'collapsed'}
+
+os.makedirs(PROFILE_FOLDER, exist_ok=True)
+
+
+# ========== 栈采样 ==========
+class StackSampler:
+    """单个后台线程定期采样已登记线程的调用栈，按折叠栈累计次数"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self._active = {}  # 线程ID -> Counter(折叠栈 -> 次数)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def register(self, thread_id):
+        with self._lock:
+            self._active[thread_id] = collections.Counter()
+            # 按需启动（gunicorn预加载后fork出的worker中原线程不存在）
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def unregister(self, thread_id):
+        """停止采样该线程，返回累计的折叠栈计数"""
+        with self._lock:
+            return self._active.pop(thread_id, collections.Counter())
+
+    def _run(self):
+        while True:
+            if not self._active:
+                self._wakeup.clear()
+                if not self._active:  # 清除事件后再确认一次，避免错过刚登记的线程
+                    self._wakeup.wait()
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, stacks in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[collapse_stack(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+def collapse_stack(frame):
+    """调用栈 -> 折叠栈字符串（根在前，分号分隔，如 app.py:get_groups;app.py:load_data）"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+sampler = StackSampler()
+
+
+# ========== 单次请求 ==========
+class RequestProfile:
+    """一次请求的剖析：cprofile为确定性剖析，sample为栈采样"""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.thread_id = threading.get_ident()
+        self.profiler = None
+        if kind == 'cprofile':
+            try:
+                profiler = cProfile.Profile()
+                profiler.enable()
+                self.profiler = profiler
+            except ValueError:
+                # Python 3.12+ 同一时刻只能有一个cProfile生效，并发时退化为栈采样
+                self.kind = 'sample'
+        if self.profiler is None:
+            sampler.register(self.thread_id)
+
+    def stop(self):
+        """停止剖析，返回结果（pstats.Stats或折叠栈计数）"""
+        if self.profiler is not None:
+            self.profiler.disable()
+            return pstats.Stats(self.profiler)
+        return sampler.unregister(self.thread_id)
+
+
+def start(flag):
+    """请求开始时调用：flag为请求头/查询参数的值；返回RequestProfile或None"""
+    if flag and (PROFILE_TOKEN is None or flag == PROFILE_TOKEN):
+        return RequestProfile('cprofile')
+    if SLOW_REQUEST_SECONDS is not None:
+        return RequestProfile('sample')
+    return None
+
+
+def finish(profile, elapsed, meta):
+    """请求结束时调用：保存显式开启的剖析与超过阈值的采样，返回剖析ID（未保存时返回None）
+
+    meta: 请求信息（endpoint/method/path/status），与结果一起写入同名的.json元数据
+    """
+    result = profile.stop()
+    if profile.kind == 'sample' and (elapsed < SLOW_REQUEST_SECONDS or not result):
+        return None
+
+    profile_id = f'{time.strftime("%Y%m%d%H%M%S")}-{uuid.uuid4().hex[:8]}'
+    path = profile_path(profile_id, profile.kind)
+    if profile.kind == 'cprofile':
+        result.dump_stats(path)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in result.most_common():
+                f.write(f'{stack} {count}\n')
+    info = {'id': profile_id, 'kind': profile.kind, 'format': PROFILE_KINDS[profile.kind],
+            'elapsed_ms': round(elapsed * 1000, 1), 'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'pid': os.getpid(), **meta}
+    with open(os.path.join(PROFILE_FOLDER, f'{profile_id}.json'), 'wb') as f:
+        f.write(codec.dumps(info))
+    prune_profiles()
+    return profile_id
+
+
+# ========== 存储 ==========
+def profile_path(profile_id, kind):
+    return os.path.join(PROFILE_FOLDER, f'{profile_id}.{PROFILE_KINDS[kind]}')
+
+
+def is_profile_id(value):
+    """剖析ID形如 20260101120000-1a2b3c4d（防止路径遍历）"""
+    stamp, _, suffix = value.partition('-')
+    return (len(stamp) == 14 and stamp.isdigit() and len(suffix) == 8
+            and all(c in '0123456789abcdef' for c in suffix))
+
+
+def load_profile_info(profile_id):
+    """读取剖析元数据，不存在返回None"""
+    try:
+        with open(os.path.join(PROFILE_FOLDER, f'{profile_id}.json'), 'rb') as f:
+            return codec.loads(f.read())
+    except (OSError, *codec.DecodeError):
+        return None
+
+
+def list_profiles():
+    """全部剖析的元数据，最新的在前（ID以时间戳开头，按名称倒序即按时间倒序）"""
+    ids = sorted((name[:-5] for name in os.listdir(PROFILE_FOLDER) if name.endswith('.json')), reverse=True)
+    return [info for info in map(load_profile_info, ids) if info is not None]
+
+
+def prune_profiles(limit=MAX_PROFILES):
+    """超过数量上限时删除最旧的剖析及其元数据"""
+    ids = sorted(name[:-5] for name in os.listdir(PROFILE_FOLDER) if name.endswith('.json'))
+    for profile_id in ids[:max(len(ids) - limit, 0)]:
+        for ext in ['json', *PROFILE_KINDS.values()]:
+            try:
+                os.remove(os.path.join(PROFILE_FOLDER, f'{profile_id}.{ext}'))
+            except FileNotFoundError:
+                pass
+
+
+def render_text(info, limit=50, sort='cumulative'):
+    """将剖析结果转为可读文本：pstats按sort排序取前limit行，折叠栈取最常见的limit条"""
+    path = profile_path(info['id'], info['kind'])
+    if info['kind'] == 'sample':
+        with open(path, encoding='utf-8') as f:
+            return ''.join(f.readlines()[:limit])
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).sort_stats(sort).print_stats(limit)
+    return out.getvalue()
@@ -0,0 +1,455 @@
+# -*- coding: utf-8 -*-
+"""
+重新标注模块
+功能：将选中组的封面图/直播截图连同提示词提交给OpenAI兼容接口（/chat/completions）重新生成标注：
+asyncio调度、并发上限、可重试错误指数退避、按响应usage累计token并在超出预算时停止派发，
+结果按(uid, 模型, 提示词哈希)缓存；输出累积成批后由调用方追加为组的新版本
+"""
+
+import asyncio
+import functools
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+import codec
+import metrics
+from importer import validate_record
+from indexes import confidence_scores
+from liveness import make_session
+from versions import run_from_item
+
+# ========== 配置 ==========
+RELABEL_API_BASE = os.environ.get('RELABEL_API_BASE', 'http://127.0.0.1:8001/v1')
+RELABEL_API_KEY = os.environ.get('RELABEL_API_KEY', '')
+RELABEL_MODEL = os.environ.get('RELABEL_MODEL', 'gpt-4o-mini')
+RELABEL_PROVIDER = os.environ.get('RELABEL_PROVIDER', 'openai-compatible')
+RELABEL_CONCURRENCY = int(os.environ.get('RELABEL_CONCURRENCY', 8))
+MAX_CONCURRENCY = 64
+BATCH_SIZE = 50            # 每累计该数量的结果保存一次版本
+MIN_FLUSH_SECONDS = 5      # 两次保存的最小间隔：每次保存都要读写整份数据，接口很快时避免连续保存占满CPU
+MAX_RETRIES = 3
+RETRY_BASE_SECONDS = 1.0   # 第n次重试前等待 base * 2^n（加随机抖动），服务端给出Retry-After时以其为准
+RETRY_MAX_SECONDS = 30
+REQUEST_TIMEOUT = (5, 120)  # (连接, 读取) 超时秒数
+MAX_OUTPUT_TOKENS = 2048
+MAX_JOB_ERRORS = 50        # 任务状态中保留的失败明细条数
+
+# 超时、限流与服务端暂时性错误可重试；其余4xx（鉴权、参数错误）直接失败
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+RELABEL_CACHE_FOLDER = 'data/relabel_cache'
+RELABEL_JOB_FOLDER = 'data/relabel_jobs'
+
+DEFAULT_PROMPT = """你是直播间画面标注员。根据给出的封面图与直播截图，只输出一个JSON对象，字段如下：
+primary_category（主类别，字符串）、confidence（字符串数组，如 "聊天陪伴类@0.7"，按置信度从高到低）、
+attributes（{"通用特征": {属性名: [取值]}, "专属特征": {属性名: [取值]}}）、tags（字符串数组）、
+video_description、reasoning、push_title、封面图包含文字、直播图包含文字（均为字符串）。
+无法判断的属性取值填"无法判断"，不要输出JSON以外的内容。"""
+
+REQUESTS = metrics.counter('relabel_requests_total', '重新标注接口请求数，按结果分类')
+TOKENS = metrics.counter('relabel_tokens_total', '重新标注消耗的token数，按类型分类')
+
+os.makedirs(RELABEL_CACHE_FOLDER, exist_ok=True)
+os.makedirs(RELABEL_JOB_FOLDER, exist_ok=True)
+
+_JOB_ID = re.compile(r'^[0-9a-f]{12}$')
+_JSON_FENCE = re.compile(r'^```(?:json)?\s*(.*?)\s*```$', re.S)
+
+
+class RelabelError(Exception):
+    """单个组重新标注失败（重试耗尽、不可重试的HTTP错误或输出无法解析）"""
+
+
+# ========== 选择 ==========
+def top_confidence(group):
+    """最高置信度分值，没有可解析的置信度时返回None"""
+    scores = confidence_scores(group)
+    return scores[0] if scores else None
+
+
+def relabel_item(group):
+    """组 -> 待标注项；没有远程图片地址（本地上传的图片）时返回None"""
+    images = [(img.get('type') or f'image{i}', img['url']) for i, img in enumerate(group.get('images', []))
+              if img.get('url') and not img.get('filename')]
+    if not images:
+        return None
+    task = group.get('task') or {}
+    return {'group_id': group['id'], 'uid': str(task.get('uid') or f"group-{group['id']}"),
+            'task': task, 'images': images}
+
+
+def select_items(groups, max_confidence=None):
+    """筛选待标注项，返回(待标注项, 没有远程图片而跳过的组数)
+
+    max_confidence: 只保留最高置信度低于该值（或没有置信度）的组
+    """
+    items, skipped = [], 0
+    for group in groups:
+        if max_confidence is not None:
+            top = top_confidence(group)
+            if top is not None and top >= max_confidence:
+                continue
+        item = relabel_item(group)
+        if item is None:
+            skipped += 1
+        else:
+            items.append(item)
+    return items, skipped
+
+
+# ========== 请求与解析 ==========
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]
+
+
+def build_request(item, prompt, model):
+    """OpenAI兼容的chat/completions请求体：系统提示词 + 按类型标注的图片"""
+    content = [{'type': 'text', 'text': '请标注以下图片：'}]
+    for image_type, url in item['images']:
+        content.append({'type': 'text', 'text': f'{image_type}:'})
+        content.append({'type': 'image_url', 'image_url': {'url': url}})
+    return {
+        'model': model,
+        'messages': [{'role': 'system', 'content': prompt}, {'role': 'user', 'content': content}],
+        'response_format': {'type': 'json_object'},
+        'max_tokens': MAX_OUTPUT_TOKENS
+    }
+
+
+def parse_output(response):
+    """从接口响应中取出模型输出的JSON对象（容忍```json代码块包裹），格式不符时抛出RelabelError"""
+    try:
+        content = response['choices'][0]['message']['content']
+    except (KeyError, IndexError, TypeError):
+        raise RelabelError('response has no message content')
+    if not isinstance(content, str):
+        raise RelabelError('message content is not text')
+    content = content.strip()
+    fenced = _JSON_FENCE.match(content)
+    if fenced:
+        content = fenced.group(1)
+    try:
+        output = codec.loads(content)
+    except codec.DecodeError:
+        raise RelabelError('model output is not valid JSON')
+    if isinstance(output, dict) and isinstance(output.get('output'), dict):
+        output = output['output']
+    if not isinstance(output, dict):
+        raise RelabelError('model output is not a JSON object')
+    return output
+
+
+def retry_delay(attempt, retry_after=None):
+    """第attempt次重试前的等待秒数"""
+    if retry_after:
+        try:
+            return min(max(float(retry_after), 0.0), RETRY_MAX_SECONDS)
+        except ValueError:
+            pass  # HTTP日期格式的Retry-After按指数退避处理
+    delay = min(RETRY_BASE_SECONDS * 2 ** attempt, RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class RelabelClient:
+    """接口客户端：requests会话在有界线程池中执行，由事件循环并发调度"""
+
+    def __init__(self, api_base=RELABEL_API_BASE, api_key=RELABEL_API_KEY, concurrency=RELABEL_CONCURRENCY,
+                 max_retries=MAX_RETRIES):
+        self.url = f"{api_base.rstrip('/')}/chat/completions"
+        self.headers = {'Authorization': f'Bearer {api_key}'} if api_key else {}
+        self.max_retries = max_retries
+        self.session = make_session(concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='relabel')
+
+    async def complete(self, body):
+        """发送请求（可重试的错误按退避重试），返回(响应JSON, 最后一次请求的耗时)"""
+        loop = asyncio.get_running_loop()
+        post = functools.partial(self.session.post, self.url, json=body, headers=self.headers,
+                                 timeout=REQUEST_TIMEOUT)
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            retry_after = None
+            try:
+                resp = await loop.run_in_executor(self.executor, post)
+            except requests.RequestException as e:
+                error = f'request failed: {e}'
+            else:
+                if resp.status_code == 200:
+                    try:
+                        payload = resp.json()
+                    except ValueError:
+                        error = 'response is not JSON'
+                    else:
+                        if isinstance(payload, dict):
+                            return payload, time.perf_counter() - start
+                        REQUESTS.inc(result='rejected')
+                        raise RelabelError('response is not a JSON object')
+                elif resp.status_code in RETRYABLE_STATUSES:
+                    error = f'HTTP {resp.status_code}'
+                    retry_after = resp.headers.get('Retry-After')
+                else:
+                    REQUESTS.inc(result='rejected')
+                    raise RelabelError(f'HTTP {resp.status_code}: {resp.text[:200]}')
+            if attempt == self.max_retries:
+                REQUESTS.inc(result='failed')
+                raise RelabelError(f'{error} (after {attempt + 1} attempts)')
+            REQUESTS.inc(result='retry')
+            await asyncio.sleep(retry_delay(attempt, retry_after))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+
+# ========== 结果缓存 ==========
+class ResultCache:
+    """按(uid, 模型, 提示词哈希)缓存解析后的运行结果，每项一个文件（多进程共享，原子替换写入）"""
+
+    def __init__(self, folder=RELABEL_CACHE_FOLDER):
+        self.folder = folder
+
+    def path(self, uid, model, digest):
+        key = hashlib.sha1(f'{uid}\0{model}\0{digest}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.folder, key[:2], f'{key}.json')
+
+    def get(self, uid, model, digest):
+        try:
+            with open(self.path(uid, model, digest), 'rb') as f:
+                return codec.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, uid, model, digest, run):
+        path = self.path(uid, model, digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(codec.dumps(run))
+        os.replace(tmp_path, path)
+
+
+cache = ResultCache()
+
+
+# ========== 任务 ==========
+class RelabelJob:
+    """一次重新标注：固定数量的协程从共享迭代器取项，并发数即协程数
+
+    store(runs) 在线程池中调用（同一时刻至多一次），将 [(组ID, 运行结果)] 追加为新版本并返回保存的组数；
+    token预算在派发前检查，已发出的请求仍会完成，实际用量可能略超预算
+    """
+
+    def __init__(self, job_id, items, store, prompt=DEFAULT_PROMPT, model=RELABEL_MODEL,
+                 provider=RELABEL_PROVIDER, token_budget=None, concurrency=RELABEL_CONCURRENCY,
+                 batch_size=BATCH_SIZE, client=None, result_cache=cache, on_progress=None):
+        self.job_id = job_id
+        self.items = items
+        self.store = store
+        self.prompt = prompt
+        self.model = model
+        self.provider = provider
+        self.token_budget = token_budget
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.client = client
+        self.cache = result_cache
+        self.on_progress = on_progress
+        self.digest = prompt_hash(prompt)
+        self.cancelled = False
+        self.status = {
+            'job_id': job_id, 'state': 'running', 'model': model, 'provider': provider, 'prompt_hash': self.digest,
+            'concurrency': concurrency, 'token_budget': token_budget,
+            'total': len(items), 'done': 0, 'succeeded': 0, 'cached': 0, 'failed': 0, 'stored': 0,
+            'tokens': {'prompt': 0, 'completion': 0, 'total': 0},
+            'errors': [], 'started_at': datetime.now().isoformat(timespec='seconds')
+        }
+
+    def over_budget(self):
+        return self.token_budget is not None and self.status['tokens']['total'] >= self.token_budget
+
+    def add_usage(self, usage):
+        prompt_tokens = int(usage.get('prompt_tokens') or 0)
+        completion_tokens = int(usage.get('completion_tokens') or 0)
+        total = int(usage.get('total_tokens') or prompt_tokens + completion_tokens)
+        tokens = self.status['tokens']
+        tokens['prompt'] += prompt_tokens
+        tokens['completion'] += completion_tokens
+        tokens['total'] += total
+        TOKENS.inc(prompt_tokens, kind='prompt')
+        TOKENS.inc(completion_tokens, kind='completion')
+
+    def fail(self, item, error):
+        self.status['failed'] += 1
+        if len(self.status['errors']) < MAX_JOB_ERRORS:
+            self.status['errors'].append({'group_id': item['group_id'], 'uid': item['uid'], 'error': str(error)})
+
+    async def label(self, item):
+        """标注单个组，返回(组ID, 运行结果)，失败返回None"""
+        run = self.cache.get(item['uid'], self.model, self.digest)
+        if run is not None:
+            self.status['cached'] += 1
+            REQUESTS.inc(result='cached')
+            return item['group_id'], run
+        try:
+            response, elapsed = await self.client.complete(build_request(item, self.prompt, self.model))
+            usage = response.get('usage') if isinstance(response.get('usage'), dict) else {}
+            self.add_usage(usage)
+            record = {
+                'task': item['task'],
+                'output': parse_output(response),
+                'provider': self.provider,
+                'model': response.get('model') or self.model,
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'elapsed_seconds': round(elapsed, 3),
+                'usage': usage
+            }
+            error = validate_record(record)
+            if error:
+                raise RelabelError(f'invalid output: {error}')
+        except RelabelError as e:
+            self.fail(item, e)
+            return None
+        REQUESTS.inc(result='ok')
+        run = run_from_item(record)
+        self.cache.put(item['uid'], self.model, self.digest, run)
+        return item['group_id'], run
+
+    async def _main(self):
+        loop = asyncio.get_running_loop()
+        items = iter(self.items)  # 各协程共享；取项在事件循环线程中进行，无需加锁
+        pending = []
+        flushing = None
+        last_flush = time.monotonic()
+
+        async def flush():
+            nonlocal last_flush
+            last_flush = time.monotonic()
+            batch = pending[:]
+            pending.clear()
+            if batch:
+                self.status['stored'] += await loop.run_in_executor(None, self.store, batch)
+            if self.on_progress is not None:
+                self.on_progress(self.status)
+
+        async def worker():
+            nonlocal flushing
+            for item in items:
+                if self.cancelled or self.over_budget():
+                    return
+                result = await self.label(item)
+                self.status['done'] += 1
+                if result is None:
+                    continue
+                self.status['succeeded'] += 1
+                pending.append(result)
+                # 保存在后台进行，协程不等待；保存较慢时期间的结果累积成更大的一批
+                if (len(pending) >= self.batch_size and (flushing is None or flushing.done())
+                        and time.monotonic() - last_flush >= MIN_FLUSH_SECONDS):
+                    flushing = asyncio.ensure_future(flush())
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            # 任一协程异常结束时停止其余协程，已标注（token已消耗）的结果仍然保存
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            try:
+                if flushing is not None:
+                    await flushing
+            finally:
+                await flush()
+
+    def run(self):
+        """在当前线程中执行任务（阻塞直到完成），返回最终状态"""
+        own_client = self.client is None
+        if own_client:
+            self.client = RelabelClient(concurrency=self.concurrency)
+        try:
+            asyncio.run(self._main())
+            if self.cancelled:
+                self.status['state'] = 'cancelled'
+            elif self.over_budget() and self.status['done'] < self.status['total']:
+                self.status['state'] = 'budget_exhausted'
+            else:
+                self.status['state'] = 'done'
+        except Exception as e:
+            print(f"[ERROR] Relabel job {self.job_id} failed: {e}")
+            self.status.update(state='failed', error=str(e))
+        finally:
+            if own_client:
+                self.client.close()
+            self.status['finished_at'] = datetime.now().isoformat(timespec='seconds')
+        return self.status
+
+
+class RelabelJobs:
+    """后台重新标注任务：状态写入 data/relabel_jobs/<任务ID>.json（任一worker进程都可查询）"""
+
+    def __init__(self, folder=RELABEL_JOB_FOLDER):
+        self.folder = folder
+        self._running = {}  # 任务ID -> RelabelJob（仅本进程）
+        self._lock = threading.Lock()
+
+    def is_job_id(self, value):
+        """任务ID为12位十六进制（防止路径遍历）"""
+        return isinstance(value, str) and bool(_JOB_ID.match(value))
+
+    def start(self, items, store, **options):
+        """启动后台任务，返回RelabelJob；本进程已有任务在运行时返回None"""
+        with self._lock:
+            if self._running:
+                return None
+            job = RelabelJob(uuid.uuid4().hex[:12], items, store, on_progress=self._write_status, **options)
+            self._running[job.job_id] = job
+        self._write_status(job.status)
+        threading.Thread(target=self._run, args=(job,), name=f'relabel-{job.job_id}', daemon=True).start()
+        return job
+
+    def _run(self, job):
+        try:
+            status = job.run()
+            print(f"[OK] Relabel job {job.job_id} {status['state']}: {status['succeeded']} labeled "
+                  f"({status['cached']} cached), {status['failed']} failed, {status['tokens']['total']} tokens")
+        finally:
+            self._write_status(job.status)
+            with self._lock:
+                self._running.pop(job.job_id, None)
+
+    def _write_status(self, status):
+        path = os.path.join(self.folder, f"{status['job_id']}.json")
+        with open(f'{path}.tmp', 'wb') as f:
+            f.write(codec.dumps(status))
+        os.replace(f'{path}.tmp', path)
+
+    def status(self, job_id):
+        """任务状态（本进程运行中的任务返回实时状态），不存在返回None"""
+        job = self._running.get(job_id)
+        if job is not None:
+            return dict(job.status)
+        try:
+            with open(os.path.join(self.folder, f'{job_id}.json'), 'rb') as f:
+                return codec.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    def cancel(self, job_id):
+        """取消本进程中运行的任务（进行中的请求完成后停止），任务不在本进程运行时返回False"""
+        job = self._running.get(job_id)
+        if job is None:
+            return False
+        job.cancelled = True
+        return True
+
+
+jobs = RelabelJobs()
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+审核队列模块
+功能：以堆维护未审核组的待领取顺序，按审核人租约分发，租约超时后组自动回到队列
+"""
+
+import heapq
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import portalocker
+
+import codec
+from indexes import register_component, group_categories, confidence_scores, label_disagrees
+from priority import priority_key
+
+# ========== 配置 ==========
+LEASE_FILE = 'data/leases.json'
+DEFAULT_LEASE_SECONDS = 15 * 60
+MAX_LEASE_BATCH = 100
+
+
+def queue_key(group):
+    """组在队列中的排序键（越小越先分发）：按审核优先级，同分按ID先进先出"""
+    return priority_key(group)
+
+
+class ReviewQueue:
+    """未审核组的优先队列（索引组件）
+
+    all/category/disagree 堆按queue_key排序，confidence堆按最高置信度升序；
+    条目惰性删除：弹出时校验组仍未审核且排序键未变
+    """
+
+    def __init__(self):
+        self.entries = {}   # 组ID -> 当前排序键
+        self.meta = {}      # 组ID -> (类别列表, 最高置信度, 是否与人工标注不一致)
+        self.heaps = {}     # 堆名 -> [(排序键, 组ID)]
+        self._lock = threading.Lock()
+
+    def _heap(self, name):
+        return self.heaps.setdefault(name, [])
+
+    @staticmethod
+    def _describe(group):
+        scores = confidence_scores(group)
+        return queue_key(group), (group_categories(group), scores[0] if scores else None, label_disagrees(group))
+
+    def build(self, groups):
+        """全量建立：收集全部条目后各堆一次heapify"""
+        entries, meta = {}, {}
+        for group in groups:
+            if not group.get('reviewed'):
+                entries[group['id']], meta[group['id']] = self._describe(group)
+        with self._lock:
+            self.entries, self.meta, self.heaps = entries, meta, {}
+            for gid in entries:
+                for name, item in self._items(gid):
+                    self._heap(name).append(item)
+            for heap in self.heaps.values():
+                heapq.heapify(heap)
+
+    def add(self, group):
+        if group.get('reviewed'):
+            return
+        gid = group['id']
+        key, meta = self._describe(group)
+        with self._lock:
+            self.entries[gid] = key
+            self.meta[gid] = meta
+            self._push(gid)
+
+    def remove(self, group):
+        with self._lock:
+            self.entries.pop(group['id'], None)
+            self.meta.pop(group['id'], None)
+
+    def _items(self, gid):
+        """组在其所属各个堆中的条目 (堆名, (排序键, 组ID))"""
+        key = self.entries[gid]
+        categories, top_confidence, disagrees = self.meta[gid]
+        yield 'all', (key, gid)
+        for category in categories:
+            yield f'category:{category}', (key, gid)
+        if disagrees:
+            yield 'disagree', (key, gid)
+        if top_confidence is not None:
+            yield 'confidence', ((top_confidence,) + key, gid)
+
+    def _push(self, gid):
+        """将组放入其所属的各个堆"""
+        for name, item in self._items(gid):
+            heapq.heappush(self._heap(name), item)
+
+    def pending_count(self, leased=()):
+        """待审核组数，不含leased中（租约未到期）的组"""
+        with self._lock:
+            return len(self.entries) - sum(1 for gid in leased if gid in self.entries)
+
+    def _heap_key(self, heap_name, gid):
+        """条目在指定堆中的当前有效排序键"""
+        key = self.entries.get(gid)
+        if key is None or heap_name != 'confidence':
+            return key
+        return (self.meta[gid][1],) + key
+
+    def take(self, n, leased, category=None, max_confidence=None, disagreement=False):
+        """按顺序取出n个满足筛选条件且未被租用的组ID
+
+        选择最具选择性的堆遍历，其余条件逐条校验；仍有效的条目遍历后全部放回，
+        以便租约到期后无需额外登记即可重新分发。已审核/已删除或排序键已变化的旧条目在此惰性丢弃
+        """
+        if max_confidence is not None:
+            heap_name = 'confidence'
+        elif category is not None:
+            heap_name = f'category:{category}'
+        elif disagreement:
+            heap_name = 'disagree'
+        else:
+            heap_name = 'all'
+        with self._lock:
+            return self._take(heap_name, n, leased, category, max_confidence, disagreement)
+
+    def _take(self, heap_name, n, leased, category, max_confidence, disagreement):
+        heap = self.heaps.get(heap_name, [])
+        taken, kept, seen = [], [], set()
+        while heap and len(taken) < n:
+            key, gid = heapq.heappop(heap)
+            if gid in seen or key != self._heap_key(heap_name, gid):
+                continue
+            seen.add(gid)
+            kept.append((key, gid))
+            if heap_name == 'confidence' and key[0] >= max_confidence:
+                break  # 按置信度升序，后面的都不满足
+            if gid in leased:
+                continue
+            categories, top_confidence, disagrees = self.meta[gid]
+            if category is not None and category not in categories:
+                continue
+            if disagreement and not disagrees:
+                continue
+            if max_confidence is not None and (top_confidence is None or top_confidence >= max_confidence):
+                continue
+            taken.append(gid)
+
+        for item in kept:
+            heapq.heappush(heap, item)
+        if len(heap) > 2 * len(self.entries) + 64:
+            self._compact(heap_name)
+        return taken
+
+    def _compact(self, heap_name):
+        """丢弃堆中累积的失效条目"""
+        valid = {}
+        for key, gid in self.heaps[heap_name]:
+            if key == self._heap_key(heap_name, gid):
+                valid[gid] = key
+        self.heaps[heap_name] = [(key, gid) for gid, key in valid.items()]
+        heapq.heapify(self.heaps[heap_name])
+
+
+register_component('review_queue', ReviewQueue)
+
+
+# ========== 租约 ==========
+class LeaseTable:
+    """审核租约表：组ID -> (审核人, 到期时间)
+
+    持久化到文件以便多进程/重启后共享；修改在文件锁事务内进行，保证同一组不会同时租给两人
+    """
+
+    def __init__(self, path=LEASE_FILE):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.leases = {}
+        self._mtime = None
+        self._lock = threading.RLock()
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        with open(self.path, 'rb') as f:
+            content = f.read()
+        try:
+            raw = codec.loads(content) if content else {}
+        except codec.DecodeError as e:
+            print(f"[WARN] Lease file {self.path} is unreadable, dropping leases: {e}")
+            raw = {}
+        self.leases = {int(gid): (reviewer, expires) for gid, (reviewer, expires) in raw.items()}
+        self._mtime = mtime
+
+    def _save(self):
+        # 写临时文件后原子替换，读取方无需加锁
+        now = time.time()
+        self.leases = {gid: lease for gid, lease in self.leases.items() if lease[1] > now}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(codec.dumps({str(gid): list(lease) for gid, lease in self.leases.items()}))
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    @contextmanager
+    def transaction(self):
+        """在文件锁内读取最新租约，退出时保存（过期租约随之清理）"""
+        with self._lock, open(self.lock_path, 'a') as lock_f:
+            portalocker.lock(lock_f, portalocker.LOCK_EX)
+            try:
+                self._reload()
+                yield self
+                self._save()
+            finally:
+                portalocker.unlock(lock_f)
+
+    def active(self):
+        """当前有效的租约 {组ID: (审核人, 到期时间)}"""
+        with self._lock:
+            self._reload()
+            now = time.time()
+            return {gid: lease for gid, lease in self.leases.items() if lease[1] > now}
+
+    def acquire(self, gids, reviewer, seconds):
+        """为审核人登记租约（需在transaction内调用），返回到期时间"""
+        expires = time.time() + seconds
+        for gid in gids:
+            self.leases[gid] = (reviewer, expires)
+        return expires
+
+    def release(self, gids, reviewer=None):
+        """释放租约（需在transaction内调用；指定reviewer时只释放其本人持有的），返回被释放的组ID"""
+        released = [gid for gid in gids
+                    if gid in self.leases and (reviewer is None or self.leases[gid][0] == reviewer)]
+        for gid in released:
+            del self.leases[gid]
+        return released
+
+
+leases = LeaseTable()
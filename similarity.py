@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+近似重复检测模块
+功能：基于标签、属性取值和视频描述的片段(shingle)计算MinHash签名，以LSH分桶实现亚线性的相似组查找与聚类
+"""
+
+import threading
+
+from indexes import register_component
+
+# ========== 配置 ==========
+NUM_HASHES = 64            # 签名长度（2的幂，按位取槽号）
+LSH_BANDS = 16             # 分段数，每段 NUM_HASHES // LSH_BANDS 行；相似度约0.5以上的组大概率落入同一桶
+DESCRIPTION_SHINGLE = 3    # 视频描述按字符n-gram切片
+DEFAULT_SIMILARITY = 0.5
+# 超大桶（如描述为空、只有通用标签的组）中每个成员最多比较的邻居数，避免聚类时两两比较爆炸
+MAX_BUCKET_COMPARISONS = 50
+
+_ROWS = NUM_HASHES // LSH_BANDS
+_EMPTY = (1 << 64) - 1
+_SLOT_MASK = NUM_HASHES - 1
+_SLOT_BITS = NUM_HASHES.bit_length() - 1
+
+
+def shingles(group):
+    """组的特征片段集合：标签、属性取值、描述字符n-gram
+
+    片段用元组表示（首项区分来源），不拼接字符串：属性类别与属性名在同一次解码中是共享的字符串，哈希值已缓存
+    """
+    items = {('t', tag) for tag in group.get('tags', [])}
+    for category, attrs in (group.get('attributes') or {}).items():
+        for key, values in (attrs or {}).items():
+            if values:
+                items.update([(category, key, value) for value in values])
+    text = ''.join((group.get('video_description') or '').split())
+    items.update([('d', text[i:i + DESCRIPTION_SHINGLE]) for i in range(len(text) - DESCRIPTION_SHINGLE + 1)])
+    return items
+
+
+def minhash(items):
+    """单次哈希的MinHash签名（one permutation hashing）
+
+    每个片段只哈希一次，按哈希值分到NUM_HASHES个槽中取最小值，空槽向后借用相邻槽的值（densification），
+    代价与片段数成正比而不是 片段数×签名长度。签名只保存在本进程内存中，可直接使用内置hash
+    """
+    if not items:
+        return None
+    signature = [_EMPTY] * NUM_HASHES
+    for item in items:
+        value = hash(item) & _EMPTY
+        slot = value & _SLOT_MASK
+        value >>= _SLOT_BITS
+        if value < signature[slot]:
+            signature[slot] = value
+    if _EMPTY not in signature:
+        return tuple(signature)
+    for slot in range(NUM_HASHES):
+        if signature[slot] == _EMPTY:
+            for step in range(1, NUM_HASHES):
+                borrowed = signature[(slot + step) % NUM_HASHES]
+                if borrowed != _EMPTY:
+                    # 借用的值加上偏移，避免不同组在同一空槽上偶然一致
+                    signature[slot] = borrowed + step * NUM_HASHES
+                    break
+    return tuple(signature)
+
+
+def estimate_similarity(sig_a, sig_b):
+    """两个签名估计的Jaccard相似度"""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_HASHES
+
+
+class SimilarityIndex:
+    """MinHash + LSH 索引（索引组件）"""
+
+    def __init__(self):
+        self.signatures = {}  # 组ID -> 签名
+        self.buckets = {}     # (段号, 段内签名) -> 组ID集合
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bands(signature):
+        for band in range(LSH_BANDS):
+            yield band, signature[band * _ROWS:(band + 1) * _ROWS]
+
+    def build(self, groups):
+        signatures, buckets = {}, {}
+        for group in groups:
+            signature = minhash(shingles(group))
+            if signature is None:
+                continue
+            signatures[group['id']] = signature
+            for key in self._bands(signature):
+                buckets.setdefault(key, set()).add(group['id'])
+        with self._lock:
+            self.signatures, self.buckets = signatures, buckets
+
+    def add(self, group):
+        signature = minhash(shingles(group))
+        if signature is None:
+            return
+        with self._lock:
+            self.signatures[group['id']] = signature
+            for key in self._bands(signature):
+                self.buckets.setdefault(key, set()).add(group['id'])
+
+    def remove(self, group):
+        with self._lock:
+            signature = self.signatures.pop(group['id'], None)
+            if signature is None:
+                return
+            for key in self._bands(signature):
+                members = self.buckets.get(key)
+                if members is not None:
+                    members.discard(group['id'])
+                    if not members:
+                        del self.buckets[key]
+
+    def similar(self, group_id, threshold=DEFAULT_SIMILARITY, limit=20):
+        """与指定组相似的组 [(组ID, 相似度)]，只比较同桶的候选；组不存在签名时返回None"""
+        with self._lock:
+            signature = self.signatures.get(group_id)
+            if signature is None:
+                return None
+            candidates = set()
+            for key in self._bands(signature):
+                candidates.update(self.buckets.get(key, ()))
+            candidates.discard(group_id)
+            scored = [(gid, estimate_similarity(signature, self.signatures[gid])) for gid in candidates]
+        scored = [(gid, score) for gid, score in scored if score >= threshold]
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[:limit]
+
+    def clusters(self, threshold=DEFAULT_SIMILARITY):
+        """按同桶候选对聚类（并查集），返回 [(组ID列表, 簇内最高相似度)]，只含两个以上成员的簇"""
+        parent = {}
+
+        def find(gid):
+            while parent.get(gid, gid) != gid:
+                parent[gid] = parent.get(parent[gid], parent[gid])
+                gid = parent[gid]
+            return gid
+
+        best = {}
+        checked = set()
+        with self._lock:
+            for members in self.buckets.values():
+                if len(members) < 2:
+                    continue
+                ordered = sorted(members)
+                for i, a in enumerate(ordered):
+                    for b in ordered[i + 1:i + 1 + MAX_BUCKET_COMPARISONS]:
+                        if (a, b) in checked:
+                            continue
+                        checked.add((a, b))
+                        score = estimate_similarity(self.signatures[a], self.signatures[b])
+                        if score < threshold:
+                            continue
+                        parent.setdefault(a, a)
+                        parent.setdefault(b, b)
+                        root_a, root_b = find(a), find(b)
+                        if root_a != root_b:
+                            parent[root_b] = root_a
+                            best[root_a] = max(best.get(root_a, 0), best.pop(root_b, 0))
+                        best[root_a] = max(best.get(root_a, 0), score)
+
+        clusters = {}
+        for gid in parent:
+            clusters.setdefault(find(gid), []).append(gid)
+        return sorted(((sorted(ids), best.get(root, 0)) for root, ids in clusters.items()),
+                      key=lambda item: (-len(item[0]), item[0][0]))
+
+
+register_component('similarity', SimilarityIndex)
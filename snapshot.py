@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+二进制列式快照模块
+功能：将标注数据写成定长列（组ID、状态位）+ 偏移索引的字符串块 + 驻留词表的二进制快照，
+通过mmap只读映射加载，启动时无需解析整份JSON，多个worker共享同一份页缓存；文本字段在访问时才解码
+"""
+
+import bisect
+import itertools
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+
+import codec
+from indexes import GENERATION_KEY, group_categories
+
+# ========== 格式 ==========
+# 文件头：魔数, 数据代次, 源数据文件mtime(纳秒), 组数, 段数；随后是段表，各段按8字节对齐
+MAGIC = b'LTSNAP01'
+HEADER = struct.Struct('<8sqqII')
+SECTION = struct.Struct('<32sQQ')  # 段名, 偏移, 长度
+ALIGNMENT = 8
+
+FLAG_REVIEWED = 1
+FLAG_MODIFIED = 2
+
+# 偏移索引的文本列：列名 -> 取值函数；record为整组的JSON编码，用于按需还原完整组
+STRING_FIELDS = {
+    'uid': lambda g: str((g.get('task') or {}).get('uid') or ''),
+    'human_label': lambda g: (g.get('task') or {}).get('human_label') or '',
+    'video_description': lambda g: g.get('video_description') or '',
+    'reasoning': lambda g: g.get('reasoning') or '',
+    'push_title': lambda g: g.get('push_title') or '',
+    'record': None
+}
+
+# 驻留词表的列表列：每组保存词表下标，相同字符串只存一份
+LIST_FIELDS = {
+    'tags': lambda g: g.get('tags') or [],
+    'categories': lambda g: [c for c in group_categories(g) if c],
+    'filenames': lambda g: [img['filename'] for img in g.get('images', []) if img.get('filename')]
+}
+
+
+# ========== 写入 ==========
+def _string_table(values, encoded=False):
+    """字符串（encoded=True时为字节串）列表 -> (偏移数组, 数据块)"""
+    chunks = values if encoded else [value.encode('utf-8') for value in values]
+    offsets = array('Q', [0])
+    offsets.extend(itertools.accumulate(map(len, chunks)))
+    return offsets, b''.join(chunks)
+
+
+def build_sections(groups):
+    """按列组织数据，返回 [(段名, 字节串)]"""
+    ids = array('q', [g['id'] for g in groups])
+    flags = array('B', [(FLAG_REVIEWED if g.get('reviewed') else 0) | (FLAG_MODIFIED if g.get('modified') else 0)
+                        for g in groups])
+    order = sorted(range(len(groups)), key=ids.__getitem__)
+    sections = [
+        ('id', ids.tobytes()),
+        ('flags', flags.tobytes()),
+        ('id_sorted', array('q', [ids[pos] for pos in order]).tobytes()),
+        ('pos_sorted', array('q', order).tobytes())
+    ]
+
+    for field, getter in STRING_FIELDS.items():
+        if getter is None:
+            offsets, blob = _string_table([codec.dumps(g) for g in groups], encoded=True)
+        else:
+            offsets, blob = _string_table([getter(g) for g in groups])
+        sections += [(f'{field}.offsets', offsets.tobytes()), (f'{field}.data', blob)]
+
+    for field, getter in LIST_FIELDS.items():
+        vocab = {}
+        lists = [[vocab.setdefault(term, len(vocab)) for term in getter(group)] for group in groups]
+        offsets = array('Q', [0])
+        offsets.extend(itertools.accumulate(map(len, lists)))
+        items = array('I', itertools.chain.from_iterable(lists))
+        vocab_offsets, vocab_blob = _string_table(vocab)
+        sections += [(f'{field}.offsets', offsets.tobytes()), (f'{field}.items', items.tobytes()),
+                     (f'{field}.vocab.offsets', vocab_offsets.tobytes()), (f'{field}.vocab.data', vocab_blob)]
+    return sections
+
+
+def write_snapshot(data, path, source_mtime):
+    """将数据写为快照（先写临时文件再替换，已映射旧快照的读者不受影响）
+
+    source_mtime: 与快照内容对应的数据文件mtime，读取时据此判断快照是否过期
+    """
+    groups = data.get('groups', [])
+    sections = build_sections(groups)
+    offset = HEADER.size + SECTION.size * len(sections)
+    table = []
+    for name, payload in sections:
+        offset += -offset % ALIGNMENT
+        table.append((name, offset, len(payload)))
+        offset += len(payload)
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, data.get(GENERATION_KEY, 0), source_mtime or 0, len(groups), len(sections)))
+        for name, section_offset, length in table:
+            f.write(SECTION.pack(name.encode('ascii'), section_offset, length))
+        for (name, section_offset, _), (_, payload) in zip(table, sections):
+            f.write(b'\0' * (section_offset - f.tell()))
+            f.write(payload)
+    try:
+        os.replace(tmp_path, path)
+    except OSError as e:
+        # Windows下目标文件被其他进程映射时无法替换，保留旧快照（过期后读者自动回退到JSON）
+        print(f"[WARN] Failed to replace snapshot {path}: {e}")
+        os.remove(tmp_path)
+        return False
+    return True
+
+
+class SnapshotWriter:
+    """后台写快照：只保留最新一次待写的数据，连续提交时合并为一次写入，不占用请求耗时
+
+    loader: 可选，返回(完整数据, 数据版本)；提交的data为None（调用方只持有部分数据）时在后台调用它重新加载，
+    重新加载前等待reload_delay秒，合并连续的单组修改（期间快照过期，读取方回退到按分片读取）
+    """
+
+    def __init__(self, path, loader=None, reload_delay=1.0):
+        self.path = path
+        self.loader = loader
+        self.reload_delay = reload_delay
+        self._pending = None  # (data, source_mtime)
+        self._busy = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, data, source_mtime):
+        """登记待写数据；调用方此后不应再修改data，data为None时写入前由loader重新加载"""
+        with self._cond:
+            self._pending = (data, source_mtime)
+            # 线程按需启动（gunicorn预加载后fork出的worker中原线程不存在）
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='snapshot-writer', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """等待已登记的数据写完，返回是否在超时前完成"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending is None and not self._busy, timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending is not None)
+                data, source_mtime = self._pending
+                self._pending = None
+                self._busy = True
+            try:
+                if data is None:
+                    data, source_mtime = self._await_reload()
+                write_snapshot(data, self.path, source_mtime)
+            except Exception as e:
+                print(f"[ERROR] Failed to write snapshot: {e}")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _await_reload(self):
+        """等待reload_delay秒，期间登记的完整数据直接使用，否则重新加载"""
+        deadline = time.monotonic() + self.reload_delay
+        with self._cond:
+            while True:
+                if self._pending is not None:
+                    data, source_mtime = self._pending
+                    self._pending = None
+                    if data is not None:
+                        return data, source_mtime
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        return self.loader()
+
+
+# ========== 读取 ==========
+class Snapshot:
+    """只读映射的快照：定长列直接以memoryview访问，文本与整组记录按需解码"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, self.generation, self.source_mtime, self._count, section_count = \
+                HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC:
+                raise ValueError(f'{path} is not a snapshot file')
+            self._sections = {}
+            for i in range(section_count):
+                name, offset, length = SECTION.unpack_from(self._mmap, HEADER.size + i * SECTION.size)
+                self._sections[name.rstrip(b'\0').decode('ascii')] = (offset, length)
+        except (struct.error, ValueError):
+            self._mmap.close()
+            raise
+        self._views = []
+        self._columns = {}
+        self._vocab = {}
+        self.ids = self._column('id', 'q')
+        self._flags = self._column('flags', 'B')
+
+    def __len__(self):
+        return self._count
+
+    def _column(self, name, fmt):
+        """定长列：直接映射为类型化的memoryview，不复制数据"""
+        column = self._columns.get(name)
+        if column is None:
+            offset, length = self._sections[name]
+            column = memoryview(self._mmap)[offset:offset + length].cast(fmt)
+            self._views.append(column)
+            self._columns[name] = column
+        return column
+
+    def _bytes(self, name, index):
+        offsets = self._column(f'{name}.offsets', 'Q')
+        base = self._sections[f'{name}.data'][0]
+        return self._mmap[base + offsets[index]:base + offsets[index + 1]]
+
+    # ---------- 定长列 ----------
+    def position(self, group_id):
+        """按组ID二分查找存储下标，不存在返回None"""
+        sorted_ids = self._column('id_sorted', 'q')
+        i = bisect.bisect_left(sorted_ids, group_id)
+        if i < len(sorted_ids) and sorted_ids[i] == group_id:
+            return self._column('pos_sorted', 'q')[i]
+        return None
+
+    def reviewed(self, pos):
+        return bool(self._flags[pos] & FLAG_REVIEWED)
+
+    def modified(self, pos):
+        return bool(self._flags[pos] & FLAG_MODIFIED)
+
+    # ---------- 文本列 ----------
+    def text(self, field, pos):
+        """第pos个组的文本字段（访问时解码）"""
+        return self._bytes(field, pos).decode('utf-8')
+
+    def record(self, pos):
+        """还原第pos个组的完整内容"""
+        return codec.loads(self._bytes('record', pos))
+
+    def records(self, start, stop):
+        return [self.record(pos) for pos in range(max(start, 0), min(stop, self._count))]
+
+    def find(self, group_id):
+        """按组ID还原完整组，不存在返回None"""
+        pos = self.position(group_id)
+        return None if pos is None else self.record(pos)
+
+    # ---------- 词表列 ----------
+    def term(self, field, term_id):
+        """词表中的字符串（解码后缓存，同一字符串只解码一次）"""
+        cache = self._vocab.setdefault(field, {})
+        value = cache.get(term_id)
+        if value is None:
+            value = cache[term_id] = self._bytes(f'{field}.vocab', term_id).decode('utf-8')
+        return value
+
+    def terms(self, field, pos):
+        """第pos个组的列表字段，如 terms('tags', 0)"""
+        offsets = self._column(f'{field}.offsets', 'Q')
+        items = self._column(f'{field}.items', 'I')
+        return [self.term(field, term_id) for term_id in items[offsets[pos]:offsets[pos + 1]]]
+
+    def vocab(self, field):
+        """列表字段出现过的全部字符串"""
+        size = len(self._column(f'{field}.vocab.offsets', 'Q')) - 1
+        return [self.term(field, term_id) for term_id in range(size)]
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._columns = {}
+        self._mmap.close()
+
+
+def open_snapshot(path, source_mtime=None):
+    """打开快照；文件不存在、格式不符或与source_mtime不一致时返回None"""
+    try:
+        snapshot = Snapshot(path)
+    except (FileNotFoundError, ValueError, struct.error):
+        return None
+    if source_mtime is not None and snapshot.source_mtime != source_mtime:
+        snapshot.close()
+        return None
+    return snapshot
+
+
+# ========== 缓存 ==========
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot(path, source_mtime):
+    """获取与数据文件mtime一致的快照，过期时重新映射（旧映射随引用释放自动关闭）"""
+    global _snapshot
+    if source_mtime is None:
+        return None
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.source_mtime != source_mtime:
+            _snapshot = open_snapshot(path, source_mtime)
+        return _snapshot
@@ -6,9 +6,8 @@
 class ImageTagSystem {
     constructor() {
         this.groups = [];
-        this.allGroups = []; // 存储所有组，用于筛选
-        this.currentFilter = 'all';
         this.pendingImportData = null;
+        this.changeSource = null; // 服务端变更推送（SSE）
 
         // 分页相关属性
         this.currentPage = 1;
@@ -25,6 +24,7 @@ class ImageTagSystem {
         this.bindEvents();
         this.bindButtonEvents();
         this.updateStatistics();
+        this.subscribeChanges();
     }
 
     // ========== 数据加载 ==========
@@ -39,11 +39,6 @@ class ImageTagSystem {
             this.totalPages = data.pagination.total_pages;
             this.totalGroups = data.pagination.total_groups;
 
-            // 加载所有数据用于筛选（如果还没有加载）
-            if (this.allGroups.length === 0 && this.totalGroups <= 1000) {
-                await this.loadAllGroupsForFiltering();
-            }
-
             this.renderAllGroups();
             this.updatePaginationControls();
             this.updateStatistics();
@@ -53,16 +48,72 @@ class ImageTagSystem {
         }
     }
 
-    // 加载所有数据用于筛选
-    async loadAllGroupsForFiltering() {
-        try {
-            const response = await fetch('/api/groups?per_page=1000');
-            const data = await response.json();
-            this.allGroups = data.groups || [];
-        } catch (error) {
-            console.warn('加载全部数据用于筛选失败:', error);
-            this.allGroups = this.groups; // 降级使用当前页数据
+    // ========== 服务端变更推送 ==========
+    subscribeChanges() {
+        if (!window.EventSource) return;
+        // 同步单线程worker下长连接会占满服务器，不订阅
+        if (document.body.dataset.changeStream !== 'on') return;
+
+        // EventSource断线后会自动重连，并通过Last-Event-ID从断点续传
+        this.changeSource = new EventSource('/api/changes');
+
+        this.changeSource.addEventListener('change', (e) => {
+            this.applyChangeEvent(JSON.parse(e.data));
+        });
+
+        this.changeSource.addEventListener('reset', () => {
+            // 错过的变更太多或数据被外部修改，重新加载当前页
+            this.loadGroups(this.currentPage);
+        });
+    }
+
+    applyChangeEvent(event) {
+        let needRender = false;
+        let needReload = false;
+
+        (event.updated || []).forEach(item => {
+            const group = this.groups.find(g => g.id === item.id);
+            if (!group) return;
+            if (!item.fields) {
+                needReload = true;
+                return;
+            }
+            Object.entries(item.fields).forEach(([key, value]) => {
+                if (value === null) {
+                    delete group[key];
+                } else {
+                    group[key] = value;
+                }
+            });
+            needRender = true;
+        });
+
+        (event.deleted || []).forEach(id => {
+            if (this.groups.some(g => g.id === id)) {
+                // 当前页有组被删除，后续组会前移，重新加载本页
+                needReload = true;
+            }
+        });
+
+        const stats = event.stats || {};
+        if (stats.total_groups) {
+            this.totalGroups += stats.total_groups;
+            this.totalPages = Math.max(1, Math.ceil(this.totalGroups / this.perPage));
+            // 新组追加在末尾，只有当前页未满时才会出现在本页
+            if ((event.created || []).length > 0 && this.groups.length < this.perPage) {
+                needReload = true;
+            }
         }
+
+        if (needReload) {
+            this.loadGroups(this.currentPage);
+            return;
+        }
+        if (needRender) {
+            this.renderAllGroups();
+        }
+        this.updatePaginationControls();
+        this.updateStatistics();
     }
 
     // ========== 渲染所有组 ==========
@@ -104,13 +155,23 @@ class ImageTagSystem {
                 // 添加图片类型的标识
                 const imageTypeBadge = img.type ? `<div class="image-type-badge image-type-${img.type}">${img.type.toUpperCase()}</div>` : '';
 
+                // 列表中显示缩略图，点击查看原图
+                const thumbSrc = img.thumb_url || imageSrc;
+                const webpSource = img.thumb_srcset ? `<source type="image/webp" srcset="${img.thumb_srcset}">` : '';
+                const jpegSrcset = img.thumb_srcset_jpeg ? `srcset="${img.thumb_srcset_jpeg}"` : '';
+
                 imagesHtml += `
                     <div class="group-image-item">
                         ${imageTypeBadge}
-                        <img src="${imageSrc}"
-                             alt="${imageAlt}"
-                             onerror="this.onerror=null; this.src='data:image/svg+xml,%3Csvg xmlns=%22http://www.w3.org/2000/svg%22 width=%22400%22 height=%22300%22%3E%3Crect fill=%22%23ddd%22 width=%22400%22 height=%22300%22/%3E%3Ctext fill=%22%23999%22 x=%2250%25%22 y=%2250%25%22 text-anchor=%22middle%22 dy=%22.3em%22 font-size=%2220%22%3E图片加载失败%3C/text%3E%3C/svg%3E'"
-                             loading="lazy">
+                        <a href="${img.original_url || imageSrc}" target="_blank">
+                            <picture>
+                                ${webpSource}
+                                <img src="${thumbSrc}" ${jpegSrcset}
+                                     alt="${imageAlt}"
+                                     onerror="this.onerror=null; this.closest('picture').querySelectorAll('source').forEach(s => s.remove()); this.removeAttribute('srcset'); this.src='data:image/svg+xml,%3Csvg xmlns=%22http://www.w3.org/2000/svg%22 width=%22400%22 height=%22300%22%3E%3Crect fill=%22%23ddd%22 width=%22400%22 height=%22300%22/%3E%3Ctext fill=%22%23999%22 x=%2250%25%22 y=%2250%25%22 text-anchor=%22middle%22 dy=%22.3em%22 font-size=%2220%22%3E图片加载失败%3C/text%3E%3C/svg%3E'"
+                                     loading="lazy" decoding="async">
+                            </picture>
+                        </a>
                     </div>
                 `;
             });
@@ -850,6 +911,7 @@ class ImageTagSystem {
 
         const formData = new FormData();
         formData.append('file', file);
+        formData.append('continue_on_error', 'true');
 
         try {
             const response = await fetch('/api/import/file', {
@@ -864,6 +926,7 @@ class ImageTagSystem {
                     // 成功导入
                     const message = result.message || `成功导入 ${result.groups_created} 个图片组`;
                     this.showToast(`✓ ${message}`, 'success');
+                    this.offerImportReport(result);
                     await this.loadGroups();
                     // 滚动到页面顶部
                     window.scrollTo({ top: 0, behavior: 'smooth' });
@@ -886,6 +949,14 @@ class ImageTagSystem {
         }
     }
 
+    // 导入有出错行时提示并下载错误报告
+    offerImportReport(result) {
+        if (result.report_url && result.summary && result.summary.errors > 0) {
+            this.showToast(`⚠️ ${result.summary.errors} 行导入失败，已下载错误报告`, 'warning');
+            window.open(result.report_url, '_blank');
+        }
+    }
+
     // ========== 从文件路径导入 ==========
     async importFromPath() {
         const filePathInput = document.getElementById('filePathInput');
@@ -906,7 +977,7 @@ class ImageTagSystem {
             const response = await fetch('/api/import/path', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ file_path: filePath })
+                body: JSON.stringify({ file_path: filePath, continue_on_error: true })
             });
 
             const result = await response.json();
@@ -916,6 +987,7 @@ class ImageTagSystem {
                     // 成功导入
                     const message = result.message || `成功从路径导入 ${result.groups_created} 个图片组`;
                     this.showToast(`✓ ${message}`, 'success');
+                    this.offerImportReport(result);
                     await this.loadGroups();
                     // 滚动到页面顶部
                     window.scrollTo({ top: 0, behavior: 'smooth' });
@@ -938,13 +1010,13 @@ class ImageTagSystem {
     // ========== 导出数据 ==========
     async exportData() {
         try {
-            const response = await fetch('/api/export');
+            // 由服务端直接输出格式化的JSON，浏览器无需再解析和序列化一遍
+            const response = await fetch('/api/export?pretty=1');
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
-            const data = await response.json();
-            const blob = new Blob([JSON.stringify(data, null, 2)], { type: 'application/json' });
+            const blob = await response.blob();
             const url = URL.createObjectURL(blob);
 
             const a = document.createElement('a');
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+分片存储模块
+功能：按组ID区间将标注数据拆分为多个分片文件，每个分片有独立的文件锁；清单（manifest.json）记录数据代次与各分片的
+ID区间、组数、代次，顶层的其他字段（属性块等）单独存放。保存时只重写变更涉及的分片，单组读取与分页只打开所需分片
+"""
+
+import bisect
+import contextlib
+import itertools
+import os
+import threading
+import time
+
+import portalocker
+
+import codec
+import metrics
+from indexes import GENERATION_KEY
+
+# ========== 配置 ==========
+DATA_DIR = 'data/shards'
+LEGACY_DATA_FILE = 'data/annotations.json'  # 分片存储之前的单文件数据，首次加载时自动拆分
+SHARD_SIZE = int(os.environ.get('DATA_SHARD_SIZE', 2000))  # 每个分片覆盖的组ID区间长度（仅在创建存储时生效）
+LOAD_RETRIES = 3  # 读取期间分片被改写（与清单代次不一致）时的乐观重试次数，之后持清单锁读取
+
+MANIFEST_FILE = 'manifest.json'
+META_FILE = 'meta.json'
+FORMAT_VERSION = 1
+
+
+class PartialData(dict):
+    """只包含部分分片的数据（结构与完整数据相同）：保存时只写回这些分片，不写顶层字段"""
+
+    def __init__(self, data, shard_keys):
+        super().__init__(data)
+        self.shard_keys = frozenset(shard_keys)
+        self._by_id = None
+
+    def find(self, group_id):
+        if self._by_id is None:
+            self._by_id = {group['id']: group for group in self['groups']}
+        return self._by_id.get(group_id)
+
+
+# ========== 文件读写 ==========
+def _read_locked(path):
+    """在共享锁下读取整个文件，文件不存在时返回None"""
+    try:
+        with open(path, 'rb') as f:
+            start = time.perf_counter()
+            portalocker.lock(f, portalocker.LOCK_SH)
+            metrics.LOCK_WAIT.observe(time.perf_counter() - start, mode='shared')
+            raw = f.read()
+            portalocker.unlock(f)
+    except FileNotFoundError:
+        return None
+    metrics.DATA_LOAD_BYTES.inc(len(raw))
+    return raw
+
+
+def _open_for_write(path):
+    """以读写方式打开（不截断），加独占锁后由调用方截断写入，读者不会读到空文件"""
+    f = open(os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o666), 'r+b')
+    start = time.perf_counter()
+    portalocker.lock(f, portalocker.LOCK_EX)
+    metrics.LOCK_WAIT.observe(time.perf_counter() - start, mode='exclusive')
+    return f
+
+
+def _rewrite(f, payload):
+    f.seek(0)
+    f.truncate()
+    f.write(payload)
+    f.flush()
+    metrics.DATA_SAVE_BYTES.inc(len(payload))
+
+
+class ShardedStore:
+    """按组ID区间分片的数据存储
+
+    分片键 = 组ID // shard_size；加载时按分片键顺序拼接，分片内保持存储顺序（组按ID递增追加，与单文件时一致）
+    写入：分片在加锁前编码，持清单独占锁依次改写变更的分片（各自加独占锁）与清单，分片文件中记录写入时的代次；
+    读取：先读清单，再逐个在共享锁下读取分片，分片代次与清单不一致（读取期间被改写）时重试，不阻塞写入
+    """
+
+    def __init__(self, path=DATA_DIR, legacy_file=LEGACY_DATA_FILE):
+        self.path = path
+        self.legacy_file = legacy_file
+        self.shard_size = None  # 由清单决定
+        self._migrate_lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @staticmethod
+    def shard_name(key):
+        return f'shard-{key:06d}.json'
+
+    def shard_key(self, group_id):
+        return group_id // (self.shard_size or self._manifest_shard_size())
+
+    def _manifest_shard_size(self):
+        manifest = self.read_manifest()
+        return manifest['shard_size'] if manifest else SHARD_SIZE
+
+    # ---------- 清单 ----------
+    def read_manifest(self):
+        """读取清单，存储不存在时返回None"""
+        raw = _read_locked(self._file(MANIFEST_FILE))
+        if not raw:
+            return None
+        manifest = codec.loads(raw)
+        self.shard_size = manifest['shard_size']
+        return manifest
+
+    def exists(self):
+        return os.path.exists(self._file(MANIFEST_FILE))
+
+    def mtime(self):
+        """数据版本：清单文件的修改时间（纳秒，每次保存都会改写清单），存储不存在时返回None"""
+        try:
+            return os.stat(self._file(MANIFEST_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def migrate(self):
+        """将旧的单文件数据拆分为分片（清单已存在或没有旧文件时不做任何事），返回是否进行了拆分"""
+        if self.exists() or not os.path.exists(self.legacy_file):
+            return False
+        with self._migrate_lock:
+            if self.exists():
+                return False
+            self._migrate()
+        return True
+
+    def _migrate(self):
+        raw = _read_locked(self.legacy_file)
+        with codec.gc_paused():
+            data = codec.loads(raw)
+        data.setdefault('groups', [])
+        generation = data.get(GENERATION_KEY, 0)
+        data[GENERATION_KEY] = generation - 1  # 保存时递增，拆分后代次保持不变
+        self.save(data)
+        print(f"[OK] Migrated {self.legacy_file} into {len(self.read_manifest()['shards'])} shards under {self.path}")
+
+    # ---------- 读取 ----------
+    def load(self):
+        """加载完整数据，返回(数据, 数据版本)；存储为空时返回(None, None)"""
+        return self._load(None)
+
+    def load_shards(self, keys):
+        """只加载指定分片，返回(PartialData, 数据版本)；存储为空时返回(None, None)"""
+        return self._load(set(keys))
+
+    def load_groups(self, group_ids):
+        """只加载包含这些组的分片"""
+        self.migrate()
+        return self.load_shards({self.shard_key(gid) for gid in group_ids})
+
+    def load_range(self, start, stop):
+        """按存储位置[start, stop)只加载覆盖该区间的分片，返回(组列表, 总组数, 数据代次, 数据版本)"""
+        self.migrate()
+        manifest = self.read_manifest()
+        if manifest is None:
+            return [], 0, None, None
+        keys = sorted(manifest['shards'], key=int)
+        offsets = list(itertools.accumulate(manifest['shards'][k]['groups'] for k in keys))
+        total = offsets[-1] if offsets else 0
+        stop = min(stop, total)
+        if start >= stop:
+            return [], total, manifest['generation'], self.mtime()
+        first = bisect.bisect_right(offsets, start)
+        last = bisect.bisect_left(offsets, stop)
+        data, version = self.load_shards(int(k) for k in keys[first:last + 1])
+        base = offsets[first - 1] if first else 0
+        # 清单在两次读取之间被改写时，总数以实际读到的分片为准不影响本页内容
+        return data['groups'][start - base:stop - base], total, data[GENERATION_KEY], version
+
+    def _load(self, keys):
+        self.migrate()
+        for attempt in range(LOAD_RETRIES + 1):
+            if attempt < LOAD_RETRIES:
+                manifest = self.read_manifest()
+                if manifest is None:
+                    return None, None
+                result = self._read_shards(manifest, keys)
+                if result is not None:
+                    return result
+                metrics.LOCK_RETRIES.inc(op='shard_load')
+                continue
+            # 多次读到改写中的分片：持清单共享锁读取（期间写入方等待）
+            with open(self._file(MANIFEST_FILE), 'rb') as f:
+                portalocker.lock(f, portalocker.LOCK_SH)
+                try:
+                    manifest = codec.loads(f.read())
+                    result = self._read_shards(manifest, keys)
+                    if result is None:
+                        raise ValueError(f'Shard files under {self.path} do not match {MANIFEST_FILE}')
+                    return result
+                finally:
+                    portalocker.unlock(f)
+
+    def _read_shards(self, manifest, keys):
+        """按清单读取分片，分片代次与清单不一致时返回None"""
+        version = self.mtime()
+        groups = []
+        # 只在解码整份数据时暂停循环垃圾回收：按请求读取少数分片的线程并发较多，都暂停会使回收长期关闭
+        with codec.gc_paused() if keys is None else contextlib.nullcontext():
+            for key in sorted(manifest['shards'], key=int):
+                if keys is not None and int(key) not in keys:
+                    continue
+                info = manifest['shards'][key]
+                raw = _read_locked(self._file(info['file']))
+                shard = codec.loads(raw) if raw else {'generation': None, 'groups': []}
+                if shard['generation'] != info['generation']:
+                    return None
+                groups.extend(shard['groups'])
+            raw = _read_locked(self._file(META_FILE))
+            meta = codec.loads(raw) if raw else {}
+        data = {**meta, 'groups': groups, GENERATION_KEY: manifest['generation']}
+        if keys is not None:
+            data = PartialData(data, keys)
+        return data, version
+
+    # ---------- 写入 ----------
+    def in_shard_order(self, groups):
+        """组是否按分片键非递减排列（加载后的顺序与内存中一致）"""
+        size = self.shard_size or self._manifest_shard_size()
+        return all(a['id'] // size <= b['id'] // size for a, b in zip(groups, groups[1:]))
+
+    def save(self, data, changes=None):
+        """保存数据：只改写changes涉及的分片（未提供时改写全部分片），递增数据代次，返回(数据版本, 写入字节数)
+
+        data为PartialData时只写回其包含的分片，不改写顶层字段；代次在持清单锁时按磁盘上的代次递增，
+        并发保存不同分片的调用方不会得到相同的代次
+        """
+        size = self.shard_size or self._manifest_shard_size()
+        groups = data.get('groups', [])
+        partial = isinstance(data, PartialData)
+        if changes is None:
+            dirty = set(data.shard_keys) if partial else None
+        else:
+            dirty = {group['id'] // size for change in changes for group in change if group is not None}
+            if partial:
+                dirty &= data.shard_keys
+
+        by_shard = {}
+        for group in groups:
+            key = group['id'] // size
+            if dirty is None or key in dirty:
+                by_shard.setdefault(key, []).append(group)
+        # 加锁前完成编码，锁内只做写入
+        bodies = {key: codec.dumps(shard_groups) for key, shard_groups in by_shard.items()}
+        meta = None if partial else codec.dumps({k: v for k, v in data.items() if k not in ('groups', GENERATION_KEY)})
+
+        written = 0
+        with _open_for_write(self._file(MANIFEST_FILE)) as mf:
+            raw = mf.read()
+            manifest = codec.loads(raw) if raw else {'format': FORMAT_VERSION, 'shard_size': size, 'generation': 0,
+                                                     'shards': {}}
+            generation = manifest['generation'] + 1
+            shards = manifest['shards']
+            if dirty is None:
+                # 全量保存：没有组的旧分片清空
+                dirty_keys = set(by_shard) | {int(key) for key in shards}
+            else:
+                dirty_keys = dirty
+            for key in sorted(dirty_keys):
+                shard_groups = by_shard.get(key, [])
+                name = self.shard_name(key)
+                payload = b'{"generation":%d,"groups":%s}' % (generation, bodies.get(key, b'[]'))
+                with _open_for_write(self._file(name)) as f:
+                    _rewrite(f, payload)
+                    portalocker.unlock(f)
+                written += len(payload)
+                shards[str(key)] = {
+                    'file': name,
+                    'min_id': min(g['id'] for g in shard_groups) if shard_groups else None,
+                    'max_id': max(g['id'] for g in shard_groups) if shard_groups else None,
+                    'groups': len(shard_groups),
+                    'bytes': len(payload),
+                    'generation': generation
+                }
+            if meta is not None and meta != _read_locked(self._file(META_FILE)):
+                with _open_for_write(self._file(META_FILE)) as f:
+                    _rewrite(f, meta)
+                    portalocker.unlock(f)
+                written += len(meta)
+            manifest['generation'] = generation
+            manifest['shards'] = {str(k): shards[str(k)] for k in sorted(map(int, shards))}
+            _rewrite(mf, codec.dumps(manifest))
+            version = os.fstat(mf.fileno()).st_mtime_ns  # 持锁期间读取，不会取到其他进程随后写入的mtime
+            portalocker.unlock(mf)
+        self.shard_size = size
+        data[GENERATION_KEY] = generation
+        return version, written
+
+    def stats(self):
+        manifest = self.read_manifest() or {'shards': {}, 'generation': None, 'shard_size': SHARD_SIZE}
+        return {
+            'shard_size': manifest['shard_size'],
+            'generation': manifest['generation'],
+            'shards': len(manifest['shards']),
+            'groups': sum(info['groups'] for info in manifest['shards'].values()),
+            'bytes': sum(info['bytes'] for info in manifest['shards'].values())
+        }
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+标签分析模块
+功能：增量维护组×标签的稀疏共现计数，计算PMI、疑似同义标签合并建议，以及与属性取值重复的标签
+"""
+
+import itertools
+import math
+import threading
+from collections import Counter
+from difflib import SequenceMatcher
+
+from indexes import register_component
+
+# ========== 配置 ==========
+DEFAULT_MIN_COUNT = 3
+DEFAULT_REPORT_LIMIT = 50
+# 合并建议阈值：综合分数（字面相似度与上下文相似度的均值）
+MERGE_SCORE_THRESHOLD = 0.5
+# 同义标签很少同时出现在一个组里，共现率高于该值的视为互补而非重复
+MERGE_MAX_COOCCURRENCE_RATE = 0.3
+# 与属性取值重复的标签中需重点关注的属性
+COMMON_TAG_ATTRIBUTE = ('专属特征', '常见Tag')
+
+
+class TagCooccurrence:
+    """标签共现计数（索引组件）
+
+    tag_counts: 标签 -> 组数；pairs: (标签a, 标签b)（a<b）-> 共现组数；
+    neighbors: 标签 -> {共现标签: 次数}，即稀疏共现矩阵的行；
+    attribute_overlap: (标签, 特征类别, 属性名) -> 标签同时作为该属性取值出现的组数
+    """
+
+    def __init__(self):
+        self.total_groups = 0
+        self.tag_counts = {}
+        self.pairs = {}
+        self.neighbors = {}
+        self.attribute_overlap = {}
+        self._lock = threading.Lock()
+
+    def _update(self, group, sign):
+        tags = sorted(set(group.get('tags', [])))
+        with self._lock:
+            self.total_groups += sign
+            for i, tag in enumerate(tags):
+                _bump(self.tag_counts, tag, sign)
+                for other in tags[i + 1:]:
+                    _bump(self.pairs, (tag, other), sign)
+                    _bump(self.neighbors.setdefault(tag, {}), other, sign)
+                    _bump(self.neighbors.setdefault(other, {}), tag, sign)
+                    for key in (tag, other):
+                        if not self.neighbors[key]:
+                            del self.neighbors[key]
+            if not tags:
+                return
+            tag_set = set(tags)
+            for category, attrs in (group.get('attributes') or {}).items():
+                for key, values in (attrs or {}).items():
+                    for tag in tag_set.intersection(values or []):
+                        _bump(self.attribute_overlap, (tag, category, key), sign)
+
+    def build(self, groups):
+        """全量建立：逐组累计计数，最后由标签对生成共现矩阵的行"""
+        tag_counts, pairs, attribute_overlap = Counter(), Counter(), Counter()
+        for group in groups:
+            tags = sorted(set(group.get('tags', [])))
+            if not tags:
+                continue
+            tag_counts.update(tags)
+            pairs.update(itertools.combinations(tags, 2))
+            tag_set = set(tags)
+            for category, attrs in (group.get('attributes') or {}).items():
+                for key, values in (attrs or {}).items():
+                    for tag in tag_set.intersection(values or []):
+                        attribute_overlap[(tag, category, key)] += 1
+        neighbors = {}
+        for (a, b), count in pairs.items():
+            neighbors.setdefault(a, {})[b] = count
+            neighbors.setdefault(b, {})[a] = count
+        with self._lock:
+            self.total_groups = len(groups)
+            self.tag_counts = dict(tag_counts)
+            self.pairs = dict(pairs)
+            self.neighbors = neighbors
+            self.attribute_overlap = dict(attribute_overlap)
+
+    def add(self, group):
+        self._update(group, 1)
+
+    def remove(self, group):
+        self._update(group, -1)
+
+    # ---------- 分析 ----------
+    def pmi_pairs(self, min_count=DEFAULT_MIN_COUNT, limit=DEFAULT_REPORT_LIMIT):
+        """共现次数不少于min_count的标签对，按PMI降序"""
+        with self._lock:
+            total = self.total_groups
+            results = []
+            for (a, b), together in self.pairs.items():
+                if together < min_count:
+                    continue
+                pmi = math.log(together * total / (self.tag_counts[a] * self.tag_counts[b]))
+                p_ab = together / total
+                npmi = pmi / -math.log(p_ab) if p_ab < 1 else 1.0
+                results.append({
+                    'tags': [a, b],
+                    'cooccurrence': together,
+                    'pmi': round(pmi, 4),
+                    'npmi': round(npmi, 4)
+                })
+        results.sort(key=lambda item: (-item['pmi'], -item['cooccurrence']))
+        return results[:limit]
+
+    def merge_candidates(self, min_count=DEFAULT_MIN_COUNT, limit=DEFAULT_REPORT_LIMIT):
+        """疑似同义的标签对：字面相近、共现标签分布相似、且很少同时出现
+
+        只比较至少共享一个字符的标签对（按字符倒排），不做全词表两两比较；
+        建议把低频标签替换为高频标签，batch字段可直接作为 /api/batch 的请求体提交
+        """
+        with self._lock:
+            eligible = [tag for tag, count in self.tag_counts.items() if count >= min_count]
+            by_char = {}
+            for tag in eligible:
+                for char in set(tag):
+                    by_char.setdefault(char, []).append(tag)
+
+            checked = set()
+            results = []
+            for tags in by_char.values():
+                for i, a in enumerate(tags):
+                    for b in tags[i + 1:]:
+                        pair = (a, b) if a < b else (b, a)
+                        if pair in checked:
+                            continue
+                        checked.add(pair)
+                        candidate = self._merge_score(*pair)
+                        if candidate:
+                            results.append(candidate)
+        results.sort(key=lambda item: -item['score'])
+        return results[:limit]
+
+    def _merge_score(self, a, b):
+        chars_a, chars_b = set(a), set(b)
+        if len(chars_a & chars_b) / len(chars_a | chars_b) < 1 / 3:
+            return None
+        count_a, count_b = self.tag_counts[a], self.tag_counts[b]
+        together = self.pairs.get((a, b), 0)
+        if together / min(count_a, count_b) > MERGE_MAX_COOCCURRENCE_RATE:
+            return None
+        lexical = SequenceMatcher(None, a, b).ratio()
+        context = self._context_similarity(a, b)
+        score = (lexical + context) / 2
+        if score < MERGE_SCORE_THRESHOLD:
+            return None
+        old_tag, new_tag = (a, b) if count_a < count_b or (count_a == count_b and a > b) else (b, a)
+        return {
+            'old_tag': old_tag,
+            'new_tag': new_tag,
+            'score': round(score, 4),
+            'lexical_similarity': round(lexical, 4),
+            'context_similarity': round(context, 4),
+            'counts': {old_tag: self.tag_counts[old_tag], new_tag: self.tag_counts[new_tag]},
+            'cooccurrence': together,
+            'batch': {
+                'selector': {'tag': old_tag},
+                'operations': [{'op': 'replace_tag', 'old_tag': old_tag, 'new_tag': new_tag}]
+            }
+        }
+
+    def _context_similarity(self, a, b):
+        """两个标签共现向量（不含彼此）的余弦相似度"""
+        row_a = self.neighbors.get(a, {})
+        row_b = self.neighbors.get(b, {})
+        if len(row_a) > len(row_b):
+            row_a, row_b = row_b, row_a
+        dot = sum(count * row_b[tag] for tag, count in row_a.items() if tag in row_b and tag not in (a, b))
+        if not dot:
+            return 0.0
+        norm_a = math.sqrt(sum(c * c for t, c in row_a.items() if t not in (a, b)))
+        norm_b = math.sqrt(sum(c * c for t, c in row_b.items() if t not in (a, b)))
+        return dot / (norm_a * norm_b)
+
+    def attribute_duplicates(self, min_count=1, limit=DEFAULT_REPORT_LIMIT):
+        """同时作为属性取值出现在同一组里的标签，专属特征.常见Tag排在最前"""
+        with self._lock:
+            results = [{
+                'tag': tag,
+                'category': category,
+                'key': key,
+                'groups': count,
+                'tag_count': self.tag_counts.get(tag, 0),
+                'ratio': round(count / self.tag_counts[tag], 4) if self.tag_counts.get(tag) else 0.0,
+                'batch': {
+                    'selector': {'tag': tag, 'attribute': {'category': category, 'key': key, 'value': tag}},
+                    'operations': [{'op': 'remove_tag', 'tag': tag}]
+                }
+            } for (tag, category, key), count in self.attribute_overlap.items() if count >= min_count]
+        results.sort(key=lambda item: ((item['category'], item['key']) != COMMON_TAG_ATTRIBUTE, -item['groups']))
+        return results[:limit]
+
+
+def _bump(table, key, delta):
+    value = table.get(key, 0) + delta
+    if value > 0:
+        table[key] = value
+    else:
+        table.pop(key, None)
+
+
+register_component('tag_cooccurrence', TagCooccurrence)
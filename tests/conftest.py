@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import importlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# 各模块导入时在当前目录创建的文件夹（模块只导入一次，之后的临时目录需自行创建）
+DATA_FOLDERS = ('data/metrics', 'data/history', 'data/import_reports', 'data/remote_cache', 'data/relabel_cache',
+                'data/relabel_jobs', 'static/images', 'static/thumbs', 'logs/profiles')
+
+
+def make_group(group_id):
+    return {'id': group_id, 'images': [], 'tags': [], 'attributes': {}, 'reviewed': False, 'modified': False}
+
+
+@pytest.fixture
+def app_factory(tmp_path, monkeypatch):
+    """在临时目录中以给定的组启动应用，返回测试客户端"""
+    started = []
+
+    def start(groups):
+        monkeypatch.chdir(tmp_path)
+        for folder in DATA_FOLDERS:
+            os.makedirs(folder, exist_ok=True)
+        with open('data/annotations.json', 'wb') as f:
+            f.write(codec.dumps({'groups': groups}))
+
+        app = importlib.import_module('app')
+        import history
+        from indexes import invalidate_index
+        from page_cache import page_cache
+        from review_queue import LeaseTable
+        from snapshot import SnapshotWriter
+        from storage import ShardedStore
+
+        store = ShardedStore(app.DATA_DIR, app.DATA_FILE)
+        monkeypatch.setattr(app, 'store', store)
+        monkeypatch.setattr(history, '_store', None)
+        monkeypatch.setattr(app, 'review_leases', LeaseTable())
+        monkeypatch.setattr(app, 'snapshot_writer', SnapshotWriter(app.SNAPSHOT_FILE, loader=store.load))
+        invalidate_index()
+        page_cache.clear()
+        app.create_app()
+        started.append(app)
+        return app.app.test_client()
+
+    yield start
+    for app in started:
+        app.snapshot_writer.flush(5)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""导入流水线：仓库自带的new.jsonl（含多分类记录）端到端导入"""
+
+import io
+import os
+
+from conftest import REPO_ROOT
+
+SAMPLE_FILE = os.path.join(REPO_ROOT, 'new.jsonl')
+
+
+def imported_groups(client):
+    response = client.get('/api/groups?page=1&per_page=50')
+    assert response.status_code == 200
+    return {group['task']['uid']: group for group in response.json['groups']}
+
+
+def test_import_path_accepts_multi_category_records(app_factory):
+    client = app_factory([])
+    response = client.post('/api/import/path', json={'file_path': SAMPLE_FILE})
+    assert response.status_code == 200, response.json
+    assert response.json['summary'] == {'total': 6, 'created': 6, 'updated': 0, 'skipped': 0, 'errors': 0}
+
+    groups = imported_groups(client)
+    assert len(groups) == 6
+    # 多分类记录的各字段为列表，原样保存
+    multi = groups['10001075']
+    assert isinstance(multi['primary_category'], list)
+    assert isinstance(multi['封面图包含文字'], list)
+    assert isinstance(multi['直播图包含文字'], list)
+
+
+def test_import_file_accepts_multi_category_records(app_factory):
+    client = app_factory([])
+    with open(SAMPLE_FILE, 'rb') as f:
+        content = f.read()
+    response = client.post('/api/import/file', data={'file': (io.BytesIO(content), 'new.jsonl')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200, response.json
+    assert response.json['groups_created'] == 6
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""索引组件：全量建立(build)与逐组add得到相同的状态，之后的增量更新不受影响"""
+
+import pytest
+
+import indexes
+import liveness  # noqa: F401  注册索引组件
+import priority  # noqa: F401
+import review_queue  # noqa: F401
+import similarity  # noqa: F401
+import tag_analysis  # noqa: F401
+import vocab  # noqa: F401
+from benchmarks.datagen import make_dataset
+
+
+def state(value):
+    """组件的公开状态（堆只比较内容，不比较排列）"""
+    if hasattr(value, '__dict__'):
+        result = {}
+        for name, item in vars(value).items():
+            if name.startswith('_') or name == 'version':
+                continue
+            if name == 'heaps':
+                result[name] = {heap: sorted(items) for heap, items in item.items()}
+            else:
+                result[name] = state(item)
+        return result
+    if isinstance(value, dict):
+        return {key: state(item) for key, item in value.items()}
+    return value
+
+
+@pytest.fixture(scope='module')
+def groups():
+    groups = make_dataset(2000, seed=3)['groups']
+    for group in groups[::7]:
+        group['reviewed'] = True
+    return groups
+
+
+@pytest.mark.parametrize('name', sorted(indexes._component_factories))
+def test_build_matches_incremental_add(name, groups):
+    factory = indexes._component_factories[name]
+    built = factory()
+    built.build(groups)
+    added = factory()
+    for group in groups:
+        added.add(group)
+    assert state(built) == state(added)
+
+    for group in groups[:100]:
+        built.remove(group)
+        added.remove(group)
+    for group in groups[50:150]:
+        built.add(group)
+        added.add(group)
+    assert state(built) == state(added)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""图片可用性检查：对本地模拟服务（benchmarks/mock_images.py）的探测与后台检查"""
+
+import time
+
+import pytest
+
+import liveness
+from benchmarks import mock_images
+
+
+@pytest.fixture(scope='module')
+def image_host():
+    server, base = mock_images.serve()
+    yield server, base
+    server.shutdown()
+
+
+def test_probe_states(image_host):
+    server, base = image_host
+    session = liveness.make_session(4)
+
+    ok = liveness.probe(session, f'{base}/ok/a.jpg')
+    assert (ok['state'], ok['http_status']) == ('alive', 200)
+
+    # HEAD返回405时改用Range GET
+    no_head = liveness.probe(session, f'{base}/nohead/b.jpg')
+    assert (no_head['state'], no_head['http_status']) == ('alive', 206)
+    assert server.stats['HEAD nohead'] == 1 and server.stats['GET nohead'] == 1
+
+    missing = liveness.probe(session, f'{base}/missing/c.jpg')
+    assert (missing['state'], missing['http_status']) == ('dead', 404)
+
+    expired = liveness.probe(session, f'{base}/expired/d.jpg')
+    assert expired['state'] == 'dead'
+
+    flaky = liveness.probe(session, f'{base}/flaky/e.jpg')
+    assert (flaky['state'], flaky['http_status']) == ('error', 503)
+
+    refused = liveness.probe(session, mock_images.refused_url())
+    assert refused['state'] == 'dead' and refused['http_status'] is None
+    assert refused['error'] == 'ConnectionError'
+
+
+def test_checker_persists_results(image_host, tmp_path):
+    _, base = image_host
+    store = liveness.LivenessStore(str(tmp_path / 'liveness.json'))
+    checker = liveness.LivenessChecker(store, workers=4)
+    urls = [f'{base}/ok/1.jpg', f'{base}/nohead/2.jpg', f'{base}/missing/3.jpg', mock_images.refused_url()]
+    assert checker.submit(urls) == len(urls)
+
+    deadline = time.time() + 10
+    while checker.status()['running'] and time.time() < deadline:
+        time.sleep(0.05)
+    assert not checker.status()['running']
+
+    # 结果已写入文件，新的存储实例可读出
+    reloaded = liveness.LivenessStore(store.path)
+    reloaded.refresh()
+    assert [reloaded.get(url)['state'] for url in urls] == ['alive', 'alive', 'dead', 'dead']
+    # 未过期的结果不再重新检查
+    assert checker.submit(urls) == 0
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""图片内容哈希索引的读写、本地哈希缓存与缓存目录清理"""
+
+import hashlib
+import os
+import time
+
+import media
+
+
+def test_hash_index_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(media, 'HASH_INDEX_FILE', str(tmp_path / 'image_hashes.json'))
+    assert media.load_hash_index() == {'by_hash': {}, 'by_name': {}}
+
+    index = media.load_hash_index()
+    assert media.register_image_hash(index, '封面.jpg', 'a' * 64) == '封面.jpg'
+    assert media.register_image_hash(index, 'copy.jpg', 'a' * 64) == '封面.jpg'
+    media.save_hash_index(index)
+    assert media.load_hash_index() == index
+
+    # 较短的内容覆盖写入后不残留旧内容
+    media.save_hash_index({'by_hash': {}, 'by_name': {}})
+    assert media.load_hash_index() == {'by_hash': {}, 'by_name': {}}
+
+
+def test_unreadable_hash_index_starts_empty(tmp_path, monkeypatch):
+    path = tmp_path / 'image_hashes.json'
+    path.write_bytes(b'{"by_hash": ')
+    monkeypatch.setattr(media, 'HASH_INDEX_FILE', str(path))
+    assert media.load_hash_index() == {'by_hash': {}, 'by_name': {}}
+
+
+def test_local_hash_cache_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(media, 'LOCAL_HASH_CACHE_SIZE', 3)
+    monkeypatch.setattr(media, '_local_hash_cache', media.collections.OrderedDict())
+    path = tmp_path / 'a.jpg'
+    for i in range(5):
+        path.write_bytes(b'v%d' % i)
+        os.utime(path, ns=(i, i))  # 每次改写都是新的修改时间
+        assert media.file_sha256(str(path)) == hashlib.sha256(b'v%d' % i).hexdigest()
+    assert list(media._local_hash_cache) == [str(path)]
+
+    others = []
+    for i in range(4):
+        other = tmp_path / f'{i}.jpg'
+        other.write_bytes(b'x')
+        others.append(str(other))
+        media.file_sha256(str(other))
+    assert list(media._local_hash_cache) == others[1:]
+
+
+def test_prune_cache_evicts_least_recently_used(tmp_path):
+    now = time.time()
+    for name, age, size in [('old', 10 * 86400, 100), ('mid', 3600, 100), ('new', 60, 100), ('x.tmp', 7200, 50)]:
+        path = tmp_path / 'ab' / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b'0' * size)
+        os.utime(path, (now - age, now - age))
+
+    # 超过保留时长的先删除，临时文件遗留过久也删除
+    assert media.prune_cache(str(tmp_path), max_bytes=1000, max_age=86400) == (2, 150)
+    # 总大小超限时从最久未使用的开始删除
+    assert media.prune_cache(str(tmp_path), max_bytes=150) == (1, 100)
+    assert os.listdir(tmp_path / 'ab') == ['new']
+
+
+def test_cache_hit_refreshes_usage_time(tmp_path):
+    path = tmp_path / 'thumb.webp'
+    path.write_bytes(b'0')
+    os.utime(path, (0, 0))
+    assert media._cache_hit(str(path))
+    assert os.stat(path).st_mtime > time.time() - 60
+    assert not media._cache_hit(str(tmp_path / 'missing'))
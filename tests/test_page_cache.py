@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""分页缓存失效的回归测试"""
+
+import pytest
+
+from conftest import make_group
+
+
+@pytest.fixture
+def client(app_factory):
+    """以30个组（ID 1..30）启动应用"""
+    return app_factory([make_group(i) for i in range(1, 31)])
+
+
+def page_ids(client, page, per_page=5):
+    response = client.get(f'/api/groups?page={page}&per_page={per_page}')
+    assert response.status_code == 200
+    return [group['id'] for group in response.json['groups']]
+
+
+def test_undo_delete_invalidates_following_pages(client):
+    # 撤销删除会把组按ID插回列表中间，之后的页整体后移
+    assert page_ids(client, 2) == [6, 7, 8, 9, 10]
+    assert client.post('/api/groups/4/delete').status_code == 200
+    assert page_ids(client, 1) == [1, 2, 3, 5, 6]
+    assert page_ids(client, 2) == [7, 8, 9, 10, 11]
+
+    assert client.post('/api/groups/4/undo').status_code == 200
+    assert page_ids(client, 1) == [1, 2, 3, 4, 5]
+    assert page_ids(client, 2) == [6, 7, 8, 9, 10]
+    assert page_ids(client, 6) == [26, 27, 28, 29, 30]
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""审核队列：租用与完成只读取索引和租出的组，剩余数不含租约中的组"""
+
+import pytest
+
+from conftest import make_group
+
+
+@pytest.fixture
+def client(app_factory, monkeypatch):
+    client = app_factory([make_group(i) for i in range(1, 21)])
+    assert client.get('/api/queue/stats').json['pending'] == 20  # 建立索引
+
+    import app
+
+    def full_load():
+        raise AssertionError('queue endpoints should not load every shard')
+
+    monkeypatch.setattr(app, 'load_data', full_load)
+    return client
+
+
+def test_queue_counts_exclude_leases(client):
+    leased = client.post('/api/queue/next', json={'reviewer': 'alice', 'n': 5})
+    assert leased.status_code == 200
+    ids = [group['id'] for group in leased.json['groups']]
+    assert len(ids) == 5
+    assert leased.json['remaining'] == 15
+
+    stats = client.get('/api/queue/stats').json
+    assert (stats['pending'], stats['leased'], stats['by_reviewer']) == (15, 5, {'alice': 5})
+
+    # 其他审核人拿不到已租出的组
+    other = client.post('/api/queue/next', json={'reviewer': 'bob', 'n': 5}).json
+    assert not set(ids) & {group['id'] for group in other['groups']}
+    assert other['remaining'] == 10
+
+
+def test_queue_complete_loads_only_leased_groups(client):
+    ids = [group['id'] for group in client.post('/api/queue/next', json={'reviewer': 'alice', 'n': 3}).json['groups']]
+    done = client.post('/api/queue/complete', json={'reviewer': 'alice', 'ids': ids + [999, 'x']})
+    assert done.status_code == 200
+    assert done.json['completed_ids'] == ids
+    assert done.json['missing'] == [999, 'x']
+
+    stats = client.get('/api/queue/stats').json
+    assert (stats['pending'], stats['leased']) == (17, 0)
+
+
+def test_lease_table_persists_through_codec(tmp_path):
+    from review_queue import LeaseTable
+
+    path = str(tmp_path / 'leases.json')
+    table = LeaseTable(path)
+    with table.transaction() as t:
+        t.acquire([1, 2], 'alice', 60)
+    assert set(LeaseTable(path).active()) == {1, 2}
+
+    with open(path, 'wb') as f:
+        f.write(b'{"1": ["alice"')
+    assert LeaseTable(path).active() == {}
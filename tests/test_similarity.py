@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""近似重复接口：查找只使用缓存索引，结果中的组按ID单独读取"""
+
+import pytest
+
+from conftest import make_group
+
+
+def described(group_id, description, tags):
+    group = make_group(group_id)
+    group.update({'video_description': description, 'tags': tags, 'task': {'uid': f'u{group_id}'}})
+    return group
+
+
+@pytest.fixture(params=['snapshot', 'shards'])
+def client(request, app_factory, monkeypatch):
+    groups = [described(i, '主播在卧室里唱歌聊天，灯光明亮，背景是粉色墙面', ['唱歌', '聊天陪伴']) for i in (1, 2, 3)]
+    others = ['户外骑行，沿海边公路拍摄日落风景', '厨房烘焙蛋糕教程，展示打发奶油步骤', '弹吉他演唱民谣，专业麦克风收音',
+              '城市街道夜景漫步，霓虹灯招牌特写', '美妆教程：底妆与眉眼的前后对比', '钢琴独奏古典曲目，镜头对准琴键']
+    groups += [described(i, text, [f'tag{i}']) for i, text in enumerate(others, 4)]
+    client = app_factory(groups)
+    assert client.get('/api/groups/1/similar').status_code == 200  # 建立索引
+
+    import app
+
+    def full_load():
+        raise AssertionError('similarity endpoints should not load every shard')
+
+    monkeypatch.setattr(app, 'load_data', full_load)
+    if request.param == 'shards':
+        monkeypatch.setattr(app, 'load_snapshot', lambda: None)  # 快照不可用时只加载结果所在分片
+    return client
+
+
+def test_similar_groups(client):
+    response = client.get('/api/groups/1/similar')
+    assert response.status_code == 200
+    similar = response.json['similar']
+    assert [item['id'] for item in similar] == [2, 3]
+    assert similar[0]['uid'] == 'u2' and similar[0]['similarity'] == 1.0
+
+    assert client.get('/api/groups/999/similar').status_code == 404
+
+
+def test_near_duplicate_report(client):
+    report = client.get('/api/analysis/near-duplicates').json
+    assert report['total_clusters'] == 1
+    cluster = report['clusters'][0]
+    assert [member['id'] for member in cluster['groups']] == [1, 2, 3]
+    assert cluster['size'] == 3 and not cluster['same_uid']
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+多版本模块
+功能：同一task.uid保留多个模型运行结果（按provider/model/timestamp区分），支持导入策略、逐字段对比与切换当前版本；
+各版本共享组上的task数据，属性块按内容去重存放在顶层attribute_blocks中
+"""
+
+import copy
+import hashlib
+import json
+
+# ========== 配置 ==========
+# 导入时遇到已存在的task.uid：skip 跳过；replace 用新结果替换；append 追加为新版本
+IMPORT_POLICIES = ('skip', 'replace', 'append')
+DEFAULT_IMPORT_POLICY = 'skip'
+
+# 运行元信息与模型输出字段
+RUN_META_FIELDS = ('provider', 'model', 'timestamp', 'elapsed_seconds', 'usage')
+RUN_OUTPUT_FIELDS = ('primary_category', 'confidence', 'attributes', 'tags', 'video_description',
+                     'reasoning', 'push_title', '封面图包含文字', '直播图包含文字')
+
+BLOCKS_KEY = 'attribute_blocks'
+
+
+def run_key(run):
+    """版本标识：(provider, model, timestamp)"""
+    return (run.get('provider', ''), run.get('model', ''), run.get('timestamp', ''))
+
+
+def run_from_item(item_data):
+    """从导入对象（task/output格式）提取一次运行结果"""
+    output = item_data.get('output', {})
+    run = {field: item_data.get(field, '') for field in RUN_META_FIELDS}
+    run.update({field: output.get(field, '') for field in RUN_OUTPUT_FIELDS})
+    if not run['attributes']:
+        run['attributes'] = {'通用特征': {}, '专属特征': {}}
+    for field in ('confidence', 'tags'):
+        run[field] = run[field] or []
+    return run
+
+
+def run_from_group(group):
+    """从组的当前内容提取一次运行结果"""
+    return {field: copy.deepcopy(group.get(field, '')) for field in RUN_META_FIELDS + RUN_OUTPUT_FIELDS}
+
+
+def attribute_block_key(attributes):
+    """属性块的内容地址"""
+    canonical = json.dumps(attributes, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:16]
+
+
+def store_run(data, run):
+    """转换为存储形式：属性块登记到attribute_blocks，版本中只保存其键"""
+    stored = {k: v for k, v in run.items() if k != 'attributes'}
+    key = attribute_block_key(run['attributes'])
+    data.setdefault(BLOCKS_KEY, {}).setdefault(key, copy.deepcopy(run['attributes']))
+    stored['attributes_ref'] = key
+    return stored
+
+
+def expand_run(data, stored):
+    """还原存储形式的版本为完整运行结果"""
+    run = {k: v for k, v in stored.items() if k != 'attributes_ref'}
+    run['attributes'] = copy.deepcopy(data.get(BLOCKS_KEY, {}).get(stored.get('attributes_ref'), {}))
+    return run
+
+
+def ensure_versions(data, group):
+    """旧数据没有版本列表时，以组当前内容作为第一个版本"""
+    if 'versions' not in group:
+        group['versions'] = [store_run(data, run_from_group(group))]
+        group['active_version'] = 0
+
+
+def activate_run(group, run, index):
+    """以某个版本的内容覆盖组的当前内容（清除修改标记）"""
+    for field in RUN_META_FIELDS + RUN_OUTPUT_FIELDS:
+        group[field] = copy.deepcopy(run[field])
+    group['active_version'] = index
+    group['modified'] = False
+
+
+def merge_run(data, group, run, policy):
+    """按导入策略将新的运行结果合并到已有组，返回组是否发生变化
+
+    append: 追加为新版本（同一provider/model/timestamp已存在时忽略），当前内容不变；
+    replace: 新结果成为组的唯一版本和当前内容，审核状态重置
+    """
+    if policy == 'skip':
+        return False
+    ensure_versions(data, group)
+    if policy == 'append':
+        if any(run_key(version) == run_key(run) for version in group['versions']):
+            return False
+        group['versions'].append(store_run(data, run))
+        return True
+    group['versions'] = [store_run(data, run)]
+    activate_run(group, run, 0)
+    group['reviewed'] = False
+    return True
+
+
+def prune_attribute_blocks(data):
+    """删除不再被任何版本引用的属性块"""
+    blocks = data.get(BLOCKS_KEY)
+    if not blocks:
+        return 0
+    used = {version.get('attributes_ref') for group in data.get('groups', []) for version in group.get('versions', [])}
+    unused = [key for key in blocks if key not in used]
+    for key in unused:
+        del blocks[key]
+    return len(unused)
+
+
+# ========== 对比 ==========
+def diff_runs(run_a, run_b):
+    """逐字段对比两次运行结果
+
+    标签按集合对比；属性按(特征类别, 属性名)对比；其余字段直接比较取值
+    """
+    fields = {}
+    for field in RUN_META_FIELDS + RUN_OUTPUT_FIELDS:
+        a, b = run_a.get(field), run_b.get(field)
+        if a == b:
+            continue
+        if field == 'tags':
+            set_a, set_b = set(a or []), set(b or [])
+            fields[field] = {
+                'only_a': [t for t in a or [] if t not in set_b],
+                'only_b': [t for t in b or [] if t not in set_a],
+                'common': [t for t in a or [] if t in set_b]
+            }
+        elif field == 'attributes':
+            changed = []
+            for category in sorted(set(a or {}) | set(b or {})):
+                attrs_a, attrs_b = (a or {}).get(category) or {}, (b or {}).get(category) or {}
+                for key in sorted(set(attrs_a) | set(attrs_b)):
+                    if attrs_a.get(key) != attrs_b.get(key):
+                        changed.append({'category': category, 'key': key,
+                                        'a': attrs_a.get(key), 'b': attrs_b.get(key)})
+            fields[field] = changed
+        else:
+            fields[field] = {'a': a, 'b': b}
+    return {
+        'fields': fields,
+        'equal_fields': [f for f in RUN_META_FIELDS + RUN_OUTPUT_FIELDS if f not in fields]
+    }
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+词表补全模块
+功能：统计已有标签/属性值的出现次数，以有序数组建立前缀索引（含拼音首字母），增量维护，供输入补全使用
+"""
+
+import bisect
+import heapq
+import threading
+from collections import Counter, defaultdict
+
+from indexes import register_component
+
+# 拼音首字母：优先使用pypinyin（可选依赖），否则按GB2312一级汉字区位表推算
+try:
+    from pypinyin import lazy_pinyin, Style
+    HAS_PYPINYIN = True
+except ImportError:
+    HAS_PYPINYIN = False
+
+# ========== 配置 ==========
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 50
+
+# GB2312一级汉字按拼音排序，各首字母起始区位码（I/U/V无汉字）
+_GB2312_INITIALS = [
+    (0xB0A1, 'a'), (0xB0C5, 'b'), (0xB2C1, 'c'), (0xB4EE, 'd'), (0xB6EA, 'e'), (0xB7A2, 'f'),
+    (0xB8C1, 'g'), (0xB9FE, 'h'), (0xBBF7, 'j'), (0xBFA6, 'k'), (0xC0AC, 'l'), (0xC2E8, 'm'),
+    (0xC4C3, 'n'), (0xC5B6, 'o'), (0xC5BE, 'p'), (0xC6DA, 'q'), (0xC8BB, 'r'), (0xC8F6, 's'),
+    (0xCBFA, 't'), (0xCDDA, 'w'), (0xCEF4, 'x'), (0xD1B9, 'y'), (0xD4D1, 'z')
+]
+_GB2312_LEVEL1_END = 0xD7F9
+_GB2312_CODES = [code for code, _ in _GB2312_INITIALS]
+
+
+def _char_initial(char):
+    """单个字符的拼音首字母，非汉字原样返回（小写），无法识别返回空串"""
+    if char.isascii():
+        return char.lower() if char.isalnum() else ''
+    try:
+        encoded = char.encode('gb2312')
+    except UnicodeEncodeError:
+        return ''
+    if len(encoded) != 2:
+        return ''
+    code = (encoded[0] << 8) | encoded[1]
+    if code < _GB2312_CODES[0] or code > _GB2312_LEVEL1_END:
+        return ''  # 二级汉字按部首排序，无法推算拼音
+    return _GB2312_INITIALS[bisect.bisect_right(_GB2312_CODES, code) - 1][1]
+
+
+def pinyin_initials(text):
+    """返回文本的拼音首字母串（如 “美女” -> “mn”），英文数字保留小写"""
+    if HAS_PYPINYIN:
+        items = lazy_pinyin(text, style=Style.FIRST_LETTER)
+        return ''.join(char.lower() for item in items for char in item if char.isascii() and char.isalnum())
+    return ''.join(_char_initial(char) for char in text)
+
+
+class Vocabulary:
+    """单个词表：词 -> 次数，以及按词本身和拼音首字母排序的两个有序数组"""
+
+    def __init__(self):
+        self.counts = {}
+        self.terms = []      # 有序的词
+        self.initials = []   # 有序的 (首字母串, 词)
+
+    def build(self, counts):
+        """由 词 -> 次数 一次建立，两个有序数组各排序一次"""
+        self.counts = dict(counts)
+        self.terms = sorted(self.counts)
+        self.initials = sorted((pinyin_initials(term), term) for term in self.counts)
+        return self
+
+    def add(self, term):
+        count = self.counts.get(term, 0)
+        self.counts[term] = count + 1
+        if count == 0:
+            bisect.insort(self.terms, term)
+            bisect.insort(self.initials, (pinyin_initials(term), term))
+
+    def remove(self, term):
+        count = self.counts.get(term, 0)
+        if count > 1:
+            self.counts[term] = count - 1
+            return
+        if count == 0:
+            return
+        del self.counts[term]
+        _remove_sorted(self.terms, term)
+        _remove_sorted(self.initials, (pinyin_initials(term), term))
+
+    def complete(self, prefix, limit=DEFAULT_SUGGESTIONS):
+        """返回以prefix开头（或拼音首字母以prefix开头）的词，按出现次数降序"""
+        if not prefix:
+            matches = self.counts.keys()
+        else:
+            matches = set(self.terms[bisect.bisect_left(self.terms, prefix):
+                                     bisect.bisect_left(self.terms, prefix + '\uffff')])
+            lowered = prefix.lower()
+            if lowered.isascii() and lowered.isalnum():
+                start = bisect.bisect_left(self.initials, (lowered,))
+                end = bisect.bisect_left(self.initials, (lowered + '\uffff',))
+                matches.update(term for _, term in self.initials[start:end])
+        top = heapq.nsmallest(limit, matches, key=lambda term: (-self.counts[term], term))
+        return [{'value': term, 'count': self.counts[term]} for term in top]
+
+    def __len__(self):
+        return len(self.counts)
+
+
+def _remove_sorted(items, item):
+    pos = bisect.bisect_left(items, item)
+    if pos < len(items) and items[pos] == item:
+        del items[pos]
+
+
+class VocabIndex:
+    """标签与各属性(特征类别, 属性名)取值的词表（索引组件）"""
+
+    def __init__(self):
+        self.tags = Vocabulary()
+        self.attributes = {}  # (特征类别, 属性名) -> Vocabulary
+        self._lock = threading.Lock()
+
+    def _attribute_values(self, group):
+        for category, attrs in (group.get('attributes') or {}).items():
+            for key, values in (attrs or {}).items():
+                for value in values or []:
+                    yield (category, key), value
+
+    def build(self, groups):
+        tag_counts = Counter()
+        attribute_counts = defaultdict(Counter)
+        for group in groups:
+            tag_counts.update(group.get('tags', []))
+            for category, attrs in (group.get('attributes') or {}).items():
+                for key, values in (attrs or {}).items():
+                    if values:
+                        attribute_counts[(category, key)].update(values)
+        tags = Vocabulary().build(tag_counts)
+        attributes = {attr: Vocabulary().build(counts) for attr, counts in attribute_counts.items()}
+        with self._lock:
+            self.tags, self.attributes = tags, attributes
+
+    def add(self, group):
+        with self._lock:
+            for tag in group.get('tags', []):
+                self.tags.add(tag)
+            for attr, value in self._attribute_values(group):
+                self.attributes.setdefault(attr, Vocabulary()).add(value)
+
+    def remove(self, group):
+        with self._lock:
+            for tag in group.get('tags', []):
+                self.tags.remove(tag)
+            for attr, value in self._attribute_values(group):
+                vocabulary = self.attributes.get(attr)
+                if vocabulary is not None:
+                    vocabulary.remove(value)
+                    if not vocabulary:
+                        del self.attributes[attr]
+
+    def complete_tags(self, prefix, limit=DEFAULT_SUGGESTIONS):
+        with self._lock:
+            return self.tags.complete(prefix, limit)
+
+    def complete_attribute(self, category, key, prefix, limit=DEFAULT_SUGGESTIONS):
+        """属性不存在时返回None"""
+        with self._lock:
+            vocabulary = self.attributes.get((category, key))
+            return vocabulary.complete(prefix, limit) if vocabulary is not None else None
+
+
+register_component('vocab', VocabIndex)